@@ -24,6 +24,8 @@ def create_app():
     os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'documents'), exist_ok=True)
     os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'exports'), exist_ok=True)
     os.makedirs(app.config['BACKUP_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['ARCHIVE_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['PROFILE_FOLDER'], exist_ok=True)
     
     # Initialize extensions
     login_manager.init_app(app)
@@ -33,17 +35,45 @@ def create_app():
     
     # Setup database session with connection pool settings
     global db_session, db_engine
+    engine_options = {}
+    if app.config['METRICS_ENABLED']:
+        # Pool that records checkout wait times for /metrics
+        from app.core.metrics import get_pool_class
+        engine_options['poolclass'] = get_pool_class()
     db_engine = create_engine(
         app.config['SQLALCHEMY_DATABASE_URI'],
         pool_pre_ping=True,
-        pool_size=10,  # Number of connections to maintain
-        max_overflow=20,  # Maximum number of connections beyond pool_size
+        pool_size=app.config['DB_POOL_SIZE'],  # Number of connections to maintain
+        max_overflow=app.config['DB_MAX_OVERFLOW'],  # Maximum number of connections beyond pool_size
         pool_recycle=3600,  # Recycle connections after 1 hour
-        pool_timeout=30,  # Timeout for getting connection from pool
-        echo=False
+        pool_timeout=app.config['DB_POOL_TIMEOUT'],  # Timeout for getting connection from pool
+        echo=False,
+        **engine_options
     )
     db_session = scoped_session(sessionmaker(bind=db_engine))
     
+    # Give every request (and every background app context) a fresh session,
+    # so identity maps do not outlive the request that filled them
+    @app.teardown_appcontext
+    def remove_db_session(exception=None):
+        db_session.remove()
+    
+    # Optional per-request query/identity-map statistics
+    from app.core.db_instrumentation import init_db_instrumentation
+    init_db_instrumentation(app, db_engine, db_session)
+    
+    # Optional query profiler (slow query log, N+1 detection)
+    from app.core.query_profiler import init_query_profiler
+    init_query_profiler(app, db_engine)
+    
+    # Optional Prometheus metrics at /metrics
+    from app.core.metrics import init_metrics
+    init_metrics(app, db_engine)
+    
+    # On-demand stack sampling started from /admin/profiler
+    from app.core.sampling_profiler import init_sampling_profiler
+    init_sampling_profiler(app)
+    
     # Import core models first
     from app.core import models as core_models
     
@@ -99,13 +129,8 @@ def create_app():
             org = core_models.Organization.query.get(org_id)
         
         # Get branding settings
-        brand_name = 'InfoGarden'
-        brand_logo = None
-        for setting in core_models.Setting.query.filter(core_models.Setting.key.in_(['brand_name', 'brand_logo'])).all():
-            if setting.key == 'brand_name' and setting.value:
-                brand_name = setting.value
-            elif setting.key == 'brand_logo' and setting.value:
-                brand_logo = setting.value
+        from app.core.settings_cache import get_branding
+        brand_name, brand_logo = get_branding()
         
         # Get recent visits
         recent_visits = []
@@ -29,13 +29,81 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'static', 'uploads')
     BACKUP_FOLDER = os.path.join(os.path.dirname(__file__), 'backups')
+    ARCHIVE_FOLDER = os.path.join(os.path.dirname(__file__), 'archives')
+    PROFILE_FOLDER = os.getenv('PROFILE_FOLDER', os.path.join(os.path.dirname(__file__), 'profiles'))
     MAX_CONTENT_LENGTH = 2 * 1024 * 1024 * 1024  # 2GB for software uploads
     ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY', '')
     
+    # Database connection pool (per worker process)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+    
     # Backup settings (defaults)
     BACKUP_ENABLED = os.getenv('BACKUP_ENABLED', 'true').lower() == 'true'
     BACKUP_DAY = os.getenv('BACKUP_DAY', 'sunday')  # sunday, monday, etc.
     BACKUP_HOUR = int(os.getenv('BACKUP_HOUR', '0'))  # 0 = midnight
     BACKUP_MINUTE = int(os.getenv('BACKUP_MINUTE', '0'))
     BACKUP_RETENTION_DAYS = int(os.getenv('BACKUP_RETENTION_DAYS', '30'))  # Keep backups for 30 days
-
+    
+    # Activity log retention (purged by a scheduled job, not on every request)
+    ACTIVITY_LOG_RETENTION_DAYS = int(os.getenv('ACTIVITY_LOG_RETENTION_DAYS', '90'))
+    ACTIVITY_LOG_PURGE_BATCH_SIZE = int(os.getenv('ACTIVITY_LOG_PURGE_BATCH_SIZE', '5000'))
+    ACTIVITY_LOG_PARTITIONING = os.getenv('ACTIVITY_LOG_PARTITIONING', 'false').lower() == 'true'  # MySQL monthly partitions
+    
+    # Cold archive of expired activity logs (gzip JSONL segments, local or s3)
+    ACTIVITY_LOG_ARCHIVE_ENABLED = os.getenv('ACTIVITY_LOG_ARCHIVE_ENABLED', 'false').lower() == 'true'
+    ACTIVITY_LOG_ARCHIVE_STORAGE = os.getenv('ACTIVITY_LOG_ARCHIVE_STORAGE', 'local')
+    ACTIVITY_LOG_ARCHIVE_SEGMENT_ROWS = int(os.getenv('ACTIVITY_LOG_ARCHIVE_SEGMENT_ROWS', '20000'))
+    
+    # How often the daily activity rollups behind dashboard statistics are refreshed
+    ACTIVITY_ROLLUP_INTERVAL_MINUTES = int(os.getenv('ACTIVITY_ROLLUP_INTERVAL_MINUTES', '15'))
+    
+    # Seconds each worker may serve cached settings before re-checking the settings version
+    SETTINGS_CACHE_TTL = int(os.getenv('SETTINGS_CACHE_TTL', '5'))
+    
+    # Per-request database statistics (query count, objects loaded, identity map size)
+    DB_STATS_ENABLED = os.getenv('DB_STATS_ENABLED', 'false').lower() == 'true'
+    DB_STATS_HEADERS = os.getenv('DB_STATS_HEADERS', 'false').lower() == 'true'  # Add X-DB-* response headers
+    
+    # Query profiler: slow query log, N+1 detection and per-endpoint report at /admin/query-profile
+    QUERY_PROFILER_ENABLED = os.getenv('QUERY_PROFILER_ENABLED', 'false').lower() == 'true'
+    QUERY_PROFILER_SLOW_MS = int(os.getenv('QUERY_PROFILER_SLOW_MS', '100'))
+    QUERY_PROFILER_N_PLUS_ONE = int(os.getenv('QUERY_PROFILER_N_PLUS_ONE', '5'))  # Repeats of one SELECT shape per request
+    QUERY_PROFILER_SLOW_LOG = os.getenv('QUERY_PROFILER_SLOW_LOG', '')  # JSON lines file; empty logs to the app log
+    
+    # Prometheus metrics at /metrics (set PROMETHEUS_MULTIPROC_DIR under gunicorn)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # If set, scrapes must send "Authorization: Bearer <token>"; if not, only direct local scrapes are served
+    
+    # Storage backend for new uploads: '' follows the S3 settings, or force 'local', 's3' or 'memory' (tests only)
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', '').strip().lower()
+    
+    # S3 client connection pool and multipart transfers (one shared client per worker process)
+    S3_MAX_POOL_CONNECTIONS = int(os.getenv('S3_MAX_POOL_CONNECTIONS', '20'))
+    S3_TRANSFER_CONCURRENCY = int(os.getenv('S3_TRANSFER_CONCURRENCY', '10'))  # Parts sent or fetched in parallel per transfer
+    S3_MULTIPART_THRESHOLD_MB = int(os.getenv('S3_MULTIPART_THRESHOLD_MB', '16'))
+    S3_MULTIPART_CHUNKSIZE_MB = int(os.getenv('S3_MULTIPART_CHUNKSIZE_MB', '16'))
+    S3_VERIFY_CHECKSUMS = os.getenv('S3_VERIFY_CHECKSUMS', 'true').lower() == 'true'  # SHA-256 per part, object checked after upload
+    
+    # Resumable chunked uploads of software and folder files
+    RESUMABLE_CHUNK_SIZE_MB = int(os.getenv('RESUMABLE_CHUNK_SIZE_MB', '8'))  # S3 needs at least 5
+    RESUMABLE_UPLOAD_THRESHOLD_MB = int(os.getenv('RESUMABLE_UPLOAD_THRESHOLD_MB', '32'))  # Browsers send larger files in chunks
+    RESUMABLE_UPLOAD_EXPIRY_HOURS = int(os.getenv('RESUMABLE_UPLOAD_EXPIRY_HOURS', '24'))  # Idle sessions are then discarded
+    UPLOAD_PARTIAL_FOLDER = os.getenv('UPLOAD_PARTIAL_FOLDER', os.path.join(os.path.dirname(__file__), 'upload_parts'))
+    
+    # WebP display variants and thumbnails of pasted images, built in the background
+    IMAGE_DISPLAY_MAX_PX = int(os.getenv('IMAGE_DISPLAY_MAX_PX', '1600'))  # Longest side shown in documents and exports
+    IMAGE_THUMB_MAX_PX = int(os.getenv('IMAGE_THUMB_MAX_PX', '400'))
+    IMAGE_VARIANT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', '80'))  # WebP quality, 0-100
+    
+    # Orphaned file collector: pages through storage listings, deleting files no record refers to
+    FILE_GC_DRY_RUN = os.getenv('FILE_GC_DRY_RUN', 'true').lower() == 'true'  # Only log and count orphans
+    FILE_GC_GRACE_HOURS = int(os.getenv('FILE_GC_GRACE_HOURS', '24'))  # Younger files are never deleted
+    FILE_GC_INTERVAL_MINUTES = int(os.getenv('FILE_GC_INTERVAL_MINUTES', '60'))
+    FILE_GC_PAGE_SIZE = int(os.getenv('FILE_GC_PAGE_SIZE', '1000'))
+    FILE_GC_PAGES_PER_RUN = int(os.getenv('FILE_GC_PAGES_PER_RUN', '10'))
+    
+    # Let the front proxy send local uploads after the access check: '', 'x-accel-redirect' (nginx) or 'x-sendfile'
+    SENDFILE_MODE = os.getenv('SENDFILE_MODE', '').strip().lower()
+    SENDFILE_ACCEL_PREFIX = os.getenv('SENDFILE_ACCEL_PREFIX', '/protected-uploads/')  # nginx internal location for UPLOAD_FOLDER
@@ -3,6 +3,10 @@ from flask import request, session
 from datetime import datetime, timedelta
 from app import db_session
 from app.core import models
+from app.core.metrics import track_job
+import logging
+
+logger = logging.getLogger(__name__)
 
 def log_activity(action_type, resource_type, resource_id=None, details=None):
     """Log user activity"""
@@ -43,15 +47,97 @@ def log_activity(action_type, resource_type, resource_id=None, details=None):
     
     db_session.add(log)
     db_session.commit()
+
+def cleanup_old_logs(retention_days=90, batch_size=5000):
+    """
+    Remove activity logs older than the retention period.
+    
+    Expired monthly partitions are dropped first (when activity_logs is
+    partitioned), then the remaining expired rows are deleted in batches of
+    batch_size, each batch in its own short transaction so writers are never
+    blocked behind one large DELETE.
+    
+    Returns:
+        Number of rows removed (dropped partitions are not counted)
+    """
+    from app import db_engine
+    from app.core.migration import drop_expired_activity_log_partitions
+    
+    cutoff_date = datetime.utcnow() - timedelta(days=retention_days)
+    drop_expired_activity_log_partitions(db_engine, cutoff_date)
     
-    # Cleanup old logs (older than 90 days)
-    cleanup_old_logs()
+    deleted = 0
+    while True:
+        ids = [row[0] for row in db_session.query(models.ActivityLog.id).filter(
+            models.ActivityLog.timestamp < cutoff_date
+        ).order_by(models.ActivityLog.timestamp).limit(batch_size).all()]
+        if not ids:
+            break
+        
+        models.ActivityLog.query.filter(models.ActivityLog.id.in_(ids)).delete(synchronize_session=False)
+        db_session.commit()
+        deleted += len(ids)
+        
+        if len(ids) < batch_size:
+            break
+    
+    return deleted
 
-def cleanup_old_logs():
-    """Remove activity logs older than 90 days"""
-    cutoff_date = datetime.utcnow() - timedelta(days=90)
-    models.ActivityLog.query.filter(models.ActivityLog.timestamp < cutoff_date).delete()
-    db_session.commit()
+@track_job('activity_log_retention')
+def run_log_retention(app):
+    """Scheduled job: purge expired activity logs and roll partitions forward"""
+    from app.core.job_lock import cluster_lock
+    from app.core.migration import ensure_activity_log_partitions
+    
+    with app.app_context():
+        try:
+            # One node at a time, as archive segments and purges of the same rows must not overlap
+            with cluster_lock('activity_log_retention') as acquired:
+                if not acquired:
+                    return
+                retention_days = app.config.get('ACTIVITY_LOG_RETENTION_DAYS', 90)
+                batch_size = app.config.get('ACTIVITY_LOG_PURGE_BATCH_SIZE', 5000)
+                if app.config.get('ACTIVITY_LOG_PARTITIONING'):
+                    from app import db_engine
+                    ensure_activity_log_partitions(db_engine)
+                if app.config.get('ACTIVITY_LOG_ARCHIVE_ENABLED'):
+                    # Archive first so partition drops and deletes only remove archived rows
+                    from app.core.log_archive import archive_expired_logs
+                    archive_expired_logs(
+                        datetime.utcnow() - timedelta(days=retention_days),
+                        segment_rows=app.config.get('ACTIVITY_LOG_ARCHIVE_SEGMENT_ROWS', 20000),
+                        batch_size=batch_size
+                    )
+                deleted = cleanup_old_logs(retention_days=retention_days, batch_size=batch_size)
+                logger.info(f"Activity log retention removed {deleted} rows")
+        except Exception as e:
+            db_session.rollback()
+            logger.error(f"Error purging activity logs: {str(e)}")
+        finally:
+            db_session.remove()
+
+@track_job('activity_log_migration')
+def run_activity_log_migration(app):
+    """
+    Scheduled job, once after startup: build missing activity_logs indexes
+    and, with ACTIVITY_LOG_PARTITIONING, convert the table to monthly
+    partitions. Both can take long on a large table, so they are kept out of
+    worker boot and run on one node at a time.
+    """
+    from app import db_engine
+    from app.core.job_lock import cluster_lock
+    from app.core.migration import safe_create_indexes, setup_activity_log_partitioning
+    
+    with app.app_context():
+        try:
+            with cluster_lock('activity_log_migration') as acquired:
+                if not acquired:
+                    return
+                safe_create_indexes(db_engine, models.ActivityLog)
+                if app.config.get('ACTIVITY_LOG_PARTITIONING'):
+                    setup_activity_log_partitioning(db_engine)
+        except Exception as e:
+            logger.error(f"Error migrating activity logs: {str(e)}")
 
 def track_page_view(f):
     """Decorator to track page views"""
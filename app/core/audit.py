@@ -0,0 +1,108 @@
+"""
+Activity log queries for the audit views and API.
+
+Pages are fetched with keyset pagination on (timestamp, id) instead of
+OFFSET, so every page costs the same no matter how deep into the history it
+is. The (user_id, timestamp) and (org_id, timestamp) indexes on activity_logs
+serve the filtered queries.
+
+Rows without a timestamp sort after all others (MySQL and SQLite order NULL
+last when descending) and are paged by id under a "null" cursor.
+"""
+from datetime import datetime
+from sqlalchemy import or_, and_
+from app.core import models
+
+NULL_TIMESTAMP = 'null'
+
+
+def parse_datetime(value):
+    """Parse an ISO date or datetime query parameter, returning None if invalid"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def encode_cursor(log):
+    """Cursor pointing just past the given log entry"""
+    timestamp = log.timestamp.isoformat() if log.timestamp else NULL_TIMESTAMP
+    return f"{timestamp}_{log.id}"
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into (timestamp, id), or None if it is malformed; timestamp is None past the dated rows"""
+    if not cursor or '_' not in cursor:
+        return None
+    timestamp, _, log_id = cursor.rpartition('_')
+    try:
+        if timestamp == NULL_TIMESTAMP:
+            return None, int(log_id)
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except ValueError:
+        return None
+
+
+def build_activity_query(user_id=None, org_id=None, action_type=None, resource_type=None, start=None, end=None):
+    """Filtered activity log query ordered newest first"""
+    log = models.ActivityLog
+    query = log.query
+    if user_id is not None:
+        query = query.filter(log.user_id == user_id)
+    if org_id is not None:
+        query = query.filter(log.org_id == org_id)
+    if action_type:
+        query = query.filter(log.action_type == action_type)
+    if resource_type:
+        query = query.filter(log.resource_type == resource_type)
+    if start:
+        query = query.filter(log.timestamp >= start)
+    if end:
+        query = query.filter(log.timestamp < end)
+    return query.order_by(log.timestamp.desc(), log.id.desc())
+
+
+def fetch_activity_page(query, cursor=None, limit=50):
+    """
+    Fetch one page of a query from build_activity_query.
+
+    Returns:
+        Tuple of (logs, next_cursor); next_cursor is None on the last page
+    """
+    log = models.ActivityLog
+    position = decode_cursor(cursor)
+    if position:
+        timestamp, log_id = position
+        if timestamp is None:
+            query = query.filter(log.timestamp.is_(None), log.id < log_id)
+        else:
+            query = query.filter(or_(
+                log.timestamp < timestamp,
+                and_(log.timestamp == timestamp, log.id < log_id),
+                log.timestamp.is_(None)
+            ))
+
+    # Fetch one extra row to know whether another page exists
+    logs = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(logs) > limit:
+        logs = logs[:limit]
+        next_cursor = encode_cursor(logs[-1])
+    return logs, next_cursor
+
+
+def serialize_log(log):
+    """JSON representation of an activity log entry"""
+    return {
+        'id': log.id,
+        'timestamp': log.timestamp.isoformat() if log.timestamp else None,
+        'user_id': log.user_id,
+        'org_id': log.org_id,
+        'action_type': log.action_type,
+        'resource_type': log.resource_type,
+        'resource_id': log.resource_id,
+        'ip_address': log.ip_address,
+        'details': log.details
+    }
@@ -126,6 +126,10 @@ def restore_backup(backup_file):
         if temp_file != backup_file:
             os.remove(temp_file)
         
+        # Restored settings must replace what every worker has cached
+        from app.core.settings_cache import invalidate_settings
+        invalidate_settings()
+        
         logger.info(f"Backup restored from: {backup_file}")
         return True
     except Exception as e:
@@ -209,8 +213,85 @@ def setup_backup_scheduler(app, engine):
             except Exception as e:
                 logger.error(f"Error adding export cleanup job: {str(e)}")
             
-            scheduler.start()
             logger.info(f"Backup scheduler started: {backup_day} at {backup_hour:02d}:{backup_minute:02d}")
+        
+        # Activity log retention runs regardless of backup settings
+        from app.core.activity_logger import run_log_retention
+        scheduler.add_job(
+            func=run_log_retention,
+            args=[app],
+            trigger=CronTrigger(hour=3, minute=0),  # Daily at 3 AM
+            id='activity_log_retention',
+            name='Activity Log Retention',
+            replace_existing=True
+        )
+        
+        # Indexing (and partitioning) a large activity_logs table takes a while, so it runs here rather than during startup
+        from app.core.activity_logger import run_activity_log_migration
+        scheduler.add_job(
+            func=run_activity_log_migration,
+            args=[app],
+            id='activity_log_migration',
+            name='Activity Log Migration',
+            replace_existing=True
+        )
+        
+        # Keep the daily activity rollups current for dashboard statistics
+        from apscheduler.triggers.interval import IntervalTrigger
+        from app.core.activity_rollups import run_rollup_refresh
+        scheduler.add_job(
+            func=run_rollup_refresh,
+            args=[app],
+            trigger=IntervalTrigger(minutes=app.config.get('ACTIVITY_ROLLUP_INTERVAL_MINUTES', 15)),
+            id='activity_rollups',
+            name='Activity Rollups',
+            replace_existing=True
+        )
+        
+        # Abort chunked uploads that were abandoned part way
+        from app.modules.docs.uploads import run_upload_session_cleanup
+        scheduler.add_job(
+            func=run_upload_session_cleanup,
+            args=[app],
+            trigger=IntervalTrigger(hours=1),
+            id='upload_session_cleanup',
+            name='Upload Session Cleanup',
+            replace_existing=True
+        )
+        
+        # Build display variants of pasted images that their upload thread missed
+        from app.modules.docs.images import run_image_variant_job
+        scheduler.add_job(
+            func=run_image_variant_job,
+            args=[app],
+            trigger=IntervalTrigger(minutes=10),
+            id='image_variants',
+            name='Image Variants',
+            replace_existing=True
+        )
+        
+        # Move inline base64 images of existing documents to the blob store, once at startup
+        from app.modules.docs.images import run_inline_image_backfill
+        scheduler.add_job(
+            func=run_inline_image_backfill,
+            args=[app],
+            id='inline_image_backfill',
+            name='Inline Image Backfill',
+            replace_existing=True
+        )
+        
+        # Find (and unless in dry-run mode, delete) uploaded files no record refers to
+        from app.core.file_gc import run_file_gc
+        scheduler.add_job(
+            func=run_file_gc,
+            args=[app],
+            trigger=IntervalTrigger(minutes=app.config.get('FILE_GC_INTERVAL_MINUTES', 60)),
+            id='file_gc',
+            name='Orphaned File Cleanup',
+            replace_existing=True
+        )
+        
+        scheduler.start()
     except Exception as e:
         logger.error(f"Error setting up backup scheduler: {str(e)}")
 
@@ -0,0 +1,244 @@
+"""
+Content-addressed store for uploaded files.
+
+MSPs upload the same agent installers, logos and screenshots to many
+organizations. store_blob() hashes an upload with SHA-256 and stores each
+distinct content once, under blobs/<sha256[:2]>/<sha256><ext> in the storage
+backend for new uploads. A Blob row records where the content is and how many
+Software, DocumentFile and organization logo records point at it;
+release_file() drops a reference and, with the last one, deletes the row and
+the stored object.
+
+Images pasted into documents take no reference: document content is edited,
+copied and deleted without going through the blob store, so a count of it
+would drift. Storing one only marks its Blob as used now, and image blobs
+are not deleted with their last record reference either. The orphaned file
+collector deletes an image once neither a record nor document content
+refers to it.
+
+Files stored before the blob store existed have no Blob row;
+release_file() deletes those directly, as before. Direct and resumable
+uploads are stored under their own keys first and registered with
+register_blob() once their SHA-256 is verified.
+
+Stored objects are only deleted once the transaction that released them
+commits, so a rolled-back delete or edit still finds its file.
+"""
+import os
+import base64
+import logging
+from datetime import datetime
+from sqlalchemy import event, func, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from werkzeug.utils import secure_filename
+from app import db_session
+from app.core.models import Blob
+from app.core.storage import CHUNK_SIZE, HashingReader, get_storage_for_url
+
+logger = logging.getLogger(__name__)
+
+
+def sha256_hex(checksum):
+    """Hex form of a base64 SHA-256 (as browsers and S3 send it)"""
+    return base64.b64decode(checksum).hex()
+
+
+def find_blob(sha256):
+    """The Blob holding this content, or None if it is not stored or its object is gone"""
+    blob = Blob.query.filter_by(sha256=sha256).first()
+    if blob is None:
+        return None
+    backend, key = get_storage_for_url(blob.url)
+    if not backend or backend.head(key) is None:
+        logger.warning(f"Blob {sha256} is missing from storage at {blob.url}")
+        return None
+    return blob
+
+
+PENDING_DELETES = 'blob_store_pending_deletes'
+
+
+def _delete_after_commit(url, files):
+    """Delete files once the current transaction commits, unless a Blob row then stores url again"""
+    db_session().info.setdefault(PENDING_DELETES, []).append((url, list(files)))
+
+
+@event.listens_for(Session, 'after_commit')
+def _delete_released_files(session):
+    from app.core.s3_utils import delete_file
+    pending = session.info.pop(PENDING_DELETES, None)
+    if not pending:
+        return
+    # The session cannot run SQL after its commit, so the check uses a connection of its own
+    with session.get_bind().connect() as connection:
+        for url, files in pending:
+            # Content stored again since it was released keeps its files
+            if connection.execute(select(Blob.id).where(Blob.url == url).limit(1)).first():
+                continue
+            for file_url in files:
+                delete_file(file_url)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _keep_released_files(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop(PENDING_DELETES, None)
+
+
+def is_image_blob(blob):
+    """Whether blob is an image, which document content may show and only the orphaned file collector deletes"""
+    return (blob.content_type or '').startswith('image/')
+
+
+def counted_blobs():
+    """Filter for the Blob rows whose ref_count decides when they are deleted: all but images"""
+    return or_(Blob.content_type.is_(None), ~Blob.content_type.startswith('image/'))
+
+
+def _add_reference(blob, count=1, content_type=None):
+    """
+    Take count references to blob (none only marks it as used now); False if
+    its last reference was dropped (and the row deleted) meanwhile. Content
+    first stored without a type (a software package) takes an image type it
+    is stored again under, so the image is not deleted with its last record.
+    """
+    values = {'ref_count': Blob.ref_count + count, 'updated_at': datetime.utcnow()}
+    if content_type and content_type.startswith('image/') and not is_image_blob(blob):
+        values['content_type'] = content_type
+    if not Blob.query.filter_by(id=blob.id).update(values, synchronize_session=False):
+        return False
+    if 'content_type' in values:
+        blob.content_type = content_type
+    return True
+
+
+def _record_blob(sha256, size, url, content_type, count):
+    """Record stored content with count references; another request storing the same content first wins"""
+    blob = Blob.query.filter_by(sha256=sha256).first()
+    if blob is not None:
+        # The row outlived its object, which has just been stored again
+        blob.url = url
+        blob.size = size
+        if _add_reference(blob, count, content_type):
+            return blob
+        db_session.expunge(blob)
+    try:
+        with db_session.begin_nested():
+            blob = Blob(sha256=sha256, size=size, content_type=content_type, url=url, ref_count=count)
+            db_session.add(blob)
+    except IntegrityError:
+        blob = Blob.query.filter_by(sha256=sha256).one()
+        _add_reference(blob, count, content_type)
+    return blob
+
+
+def store_blob(file_obj, filename, content_type=None, max_size=None, reference=True):
+    """
+    Store an upload in the blob store and take a reference to it.
+
+    The upload is hashed first, since its key depends on the hash; content
+    that is already stored is not uploaded again. The reference is part of
+    the caller's transaction.
+
+    Args:
+        file_obj: Seekable file-like object to store
+        filename: Original filename; its extension is kept on the stored object
+        content_type: Optional MIME type
+        max_size: Optional size limit; larger uploads raise UploadTooLargeError
+        reference: False for images pasted into document content, which take no reference
+
+    Returns:
+        The Blob, or None if the upload failed
+    """
+    from app.core.s3_utils import upload_file
+    start = file_obj.tell()
+    reader = HashingReader(file_obj, max_size=max_size)
+    buffer = bytearray(CHUNK_SIZE)
+    while reader.readinto(buffer):
+        pass
+    sha256 = reader.hexdigest()
+
+    count = 1 if reference else 0
+    blob = find_blob(sha256)
+    if blob is not None:
+        if _add_reference(blob, count, content_type):
+            return blob
+        # Its last reference was released while we looked: store the content again
+        db_session.expunge(blob)
+
+    extension = os.path.splitext(secure_filename(filename))[1].lower()
+    file_obj.seek(start)
+    url = upload_file(file_obj, f"{sha256}{extension}", folder=f"blobs/{sha256[:2]}", content_type=content_type)
+    if not url:
+        return None
+    return _record_blob(sha256, reader.size, url, content_type, count)
+
+
+def register_blob(sha256, size, url, content_type=None, reference=True):
+    """
+    Take a reference to a file that was stored elsewhere (a verified direct
+    upload) and whose SHA-256 is known. If the content is already in the
+    store, the new copy is deleted and the existing blob is referenced instead.
+    Images for document content pass reference=False, as for store_blob().
+
+    Returns:
+        The Blob; its url is what the record should store
+    """
+    count = 1 if reference else 0
+    blob = find_blob(sha256)
+    if blob is not None:
+        if _add_reference(blob, count, content_type):
+            if blob.url != url:
+                _delete_after_commit(url, [url])
+            return blob
+        # Its last reference was released while we looked: keep this copy instead
+        db_session.expunge(blob)
+    return _record_blob(sha256, size, url, content_type, count)
+
+
+def release_file(url):
+    """
+    Drop a record's reference to a stored file. With the last reference the
+    Blob row is deleted, and the file once the caller's transaction commits;
+    images, which document content may still show, are left to the orphaned
+    file collector. Files outside the blob store are deleted on commit too.
+
+    Returns:
+        True if the file is to be deleted
+    """
+    if not url:
+        return False
+    blob = Blob.query.filter_by(url=url).first()
+    if blob is None:
+        _delete_after_commit(url, [url])
+        return True
+
+    Blob.query.filter(Blob.id == blob.id, Blob.ref_count > 0).update(
+        {'ref_count': Blob.ref_count - 1, 'updated_at': datetime.utcnow()}, synchronize_session=False
+    )
+    # Only a row still without references is removed. A store_blob() that found the row meanwhile gets
+    # no reference from _add_reference() and stores the content again, which the commit-time check keeps.
+    # The type is checked in the same statement, as an image pasted meanwhile may have set it
+    if not Blob.query.filter(Blob.id == blob.id, Blob.ref_count == 0, counted_blobs()).delete(synchronize_session=False):
+        return False
+    db_session.expunge(blob)
+    _delete_after_commit(url, [url])
+    return True
+
+
+def blob_stats():
+    """Blob store totals for the settings page; saved_bytes is what storing each content once saves"""
+    blobs, references, stored, referenced = db_session.query(
+        func.count(Blob.id),
+        func.coalesce(func.sum(Blob.ref_count), 0),
+        func.coalesce(func.sum(Blob.size), 0),
+        func.coalesce(func.sum(Blob.size * Blob.ref_count), 0)
+    ).one()
+    return {
+        'blobs': blobs,
+        'references': int(references),
+        'stored_bytes': int(stored),
+        'referenced_bytes': int(referenced),
+        'saved_bytes': max(int(referenced) - int(stored), 0)
+    }
@@ -0,0 +1,92 @@
+"""
+Per-request database instrumentation.
+
+When DB_STATS_ENABLED is set, every request records how many SQL statements
+it executed, how many ORM objects it loaded, and how many objects were left
+in the session identity map when the response was built. The numbers are
+logged per request and, with DB_STATS_HEADERS, returned as X-DB-* response
+headers so load tests can watch them alongside worker memory.
+"""
+import os
+import time
+import logging
+from flask import g, request, has_app_context
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+
+class RequestDbStats:
+    """Counters for the current request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.objects_loaded = 0
+        self.identity_map_size = 0
+        self.started = time.perf_counter()
+
+
+def get_request_stats():
+    """Return the RequestDbStats for the current request, or None outside one"""
+    if not has_app_context():
+        return None
+    return g.get('db_stats')
+
+
+def get_rss_mb():
+    """Current resident set size of this process in MB, or None if unavailable"""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    stats = get_request_stats()
+    if stats is not None:
+        stats.queries += 1
+
+
+def _count_load(session, instance):
+    stats = get_request_stats()
+    if stats is not None:
+        stats.objects_loaded += 1
+
+
+def init_db_instrumentation(app, engine, session):
+    """Attach query/load counters to the engine and session if enabled"""
+    if not app.config.get('DB_STATS_ENABLED'):
+        return
+
+    event.listen(engine, 'before_cursor_execute', _count_query)
+    event.listen(session.session_factory, 'loaded_as_persistent', _count_load)
+
+    @app.before_request
+    def start_db_stats():
+        g.db_stats = RequestDbStats()
+
+    @app.after_request
+    def report_db_stats(response):
+        stats = get_request_stats()
+        if stats is None:
+            return response
+
+        if session.registry.has():
+            stats.identity_map_size = len(session().identity_map)
+
+        if app.config.get('DB_STATS_HEADERS'):
+            response.headers['X-DB-Queries'] = str(stats.queries)
+            response.headers['X-DB-Objects-Loaded'] = str(stats.objects_loaded)
+            response.headers['X-DB-Identity-Map'] = str(stats.identity_map_size)
+
+        rss = get_rss_mb()
+        logger.info(
+            f"{request.method} {request.path} {response.status_code} "
+            f"queries={stats.queries} loaded={stats.objects_loaded} "
+            f"identity_map={stats.identity_map_size} "
+            f"time_ms={(time.perf_counter() - stats.started) * 1000:.1f}"
+            + (f" rss_mb={rss:.1f}" if rss is not None else "")
+        )
+        return response
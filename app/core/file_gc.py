@@ -0,0 +1,357 @@
+"""
+Collector for orphaned uploaded files.
+
+Replaced files, failed uploads and organization deletes can leave objects in
+storage that no record refers to. A scheduled job pages through each storage
+backend's listing in key order, FILE_GC_PAGES_PER_RUN pages of
+FILE_GC_PAGE_SIZE objects per run, and carries on from where the previous run
+stopped, so a store of any size is covered over successive runs without
+listing it at once. Every object in a page is checked against the records
+that can refer to it: Blob rows (and their image variants), Software and
+DocumentFile paths, organization logos, the brand logo and image references
+in document content.
+
+Image blobs hold no references for the documents that show them, so their
+Blob row only keeps them for FILE_GC_GRACE_HOURS after they were last stored
+or pasted; after that they live as long as a record or document content
+refers to them. An orphaned image's Blob row and variants are deleted with
+it.
+
+An unreferenced object is only deleted once it is older than
+FILE_GC_GRACE_HOURS, so uploads whose record is still being written are kept.
+With FILE_GC_DRY_RUN (the default) orphans are only logged and counted; the
+totals of the last complete pass over each backend are shown on the settings
+page.
+
+On S3 only the prefixes InfoGarden writes to are listed, in case the bucket
+is shared; organization exports in the local upload folder are left to their
+own cleanup.
+"""
+import re
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+from sqlalchemy import or_
+from flask import current_app
+from app import db_session
+from app.core.blobs import counted_blobs
+from app.core.metrics import track_job
+from app.core.models import Blob, Organization, Setting
+from app.core.storage import get_backend, get_storage_for_url
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY = 'file_gc_state'
+
+# In key order, as they are listed one after another
+S3_PREFIXES = ('blobs/', 'documents/', 'software/', 'uploads/')
+LOCAL_EXCLUDED_PREFIXES = ('exports/',)
+
+BLOB_KEY = re.compile(r'^blobs/[0-9a-f]{2}/([0-9a-f]{64})(?:\.|$)')
+VARIANT_KEY = re.compile(r'^(.+)\.(?:display|thumb)\.webp$')
+
+# Keys per IN list, and per OR of LIKE patterns (SQLite limits expression depth)
+IN_BATCH = 500
+LIKE_BATCH = 100
+
+
+def _batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _managed(backend, key):
+    """Whether key is an upload the collector may delete"""
+    if any(part.startswith('.') for part in key.split('/')):
+        return False
+    if backend.name == 's3':
+        return key.startswith(S3_PREFIXES)
+    return not key.startswith(LOCAL_EXCLUDED_PREFIXES)
+
+
+def _url_forms(backend, key):
+    """Values a record may store for key: its URL and, for older local rows, the filesystem path"""
+    forms = {backend.url_for(key)}
+    path = backend.local_path(key)
+    if path:
+        forms.add(path)
+    return forms
+
+
+def _live_blobs(cutoff):
+    """Blob rows that keep their object: those counting references, and images stored or pasted since cutoff"""
+    return or_(counted_blobs(), Blob.updated_at >= cutoff)
+
+
+def _reference_columns(cutoff):
+    """(column, criteria) pairs of the rows that can refer to an uploaded file"""
+    from app.modules.docs.models import Software, DocumentFile
+    return ((Software.file_path, ()), (DocumentFile.file_path, ()), (Organization.logo_path, ()),
+            (Blob.url, (_live_blobs(cutoff),)))
+
+
+def _blob_referenced(keys, cutoff):
+    """Keys in the blob store whose Blob row still keeps them"""
+    by_sha = {}
+    for key in keys:
+        match = BLOB_KEY.match(key)
+        if match:
+            by_sha.setdefault(match.group(1), []).append(key)
+    live = set()
+    shas = list(by_sha)
+    for batch in _batches(shas, IN_BATCH):
+        for (sha,) in db_session.query(Blob.sha256).filter(Blob.sha256.in_(batch), _live_blobs(cutoff)):
+            live.update(by_sha[sha])
+    return live
+
+
+def _variant_referenced(backend, keys):
+    """Image variant keys listed in the variants of the Blob they were built from"""
+    stems = {}
+    for key in keys:
+        match = VARIANT_KEY.match(key)
+        if match:
+            stems.setdefault(backend.url_for(match.group(1)) + '.', []).append(key)
+    live = set()
+    prefixes = list(stems)
+    for batch in _batches(prefixes, LIKE_BATCH):
+        rows = db_session.query(Blob.variants).filter(or_(*[Blob.url.startswith(p, autoescape=True) for p in batch]))
+        variant_urls = {variant['url'] for (variants,) in rows for variant in (variants or {}).values()}
+        live.update(key for prefix in batch for key in stems[prefix] if backend.url_for(key) in variant_urls)
+    return live
+
+
+def _path_referenced(backend, keys, cutoff):
+    """Keys that Software, DocumentFile, logo or Blob rows store, matched exactly (indexed)"""
+    form_keys = {}
+    for key in keys:
+        for form in _url_forms(backend, key):
+            form_keys[form] = key
+    live = set()
+    forms = list(form_keys)
+    for column, criteria in _reference_columns(cutoff):
+        for batch in _batches(forms, IN_BATCH):
+            for (value,) in db_session.query(column).filter(column.in_(batch), *criteria):
+                live.add(form_keys[value])
+    return live
+
+
+def _suffix_referenced(keys, cutoff):
+    """
+    Keys that rows store under another URL form (a custom domain or endpoint
+    set since), or that document content refers to. Each is one scan per
+    batch, so only keys that passed every indexed check get here.
+    """
+    from app.modules.docs.models import Document
+    patterns = {}
+    for key in keys:
+        for pattern in {key, quote(key, safe='/')}:
+            patterns.setdefault(pattern, set()).add(key)
+    live = set()
+    for batch in _batches(list(patterns), LIKE_BATCH):
+        for column, criteria in _reference_columns(cutoff):
+            rows = db_session.query(column).filter(or_(*[column.endswith(p, autoescape=True) for p in batch]), *criteria)
+            for (value,) in rows:
+                live.update(key for p in batch if value.endswith(p) for key in patterns[p])
+
+        rows = db_session.query(Document.content).filter(or_(*[Document.content.contains(p, autoescape=True) for p in batch]))
+        for (content,) in rows:
+            live.update(key for p in batch if p in content for key in patterns[p])
+    return live
+
+
+def referenced_keys(backend, keys, cutoff):
+    """The keys of backend, among keys, that some record refers to; cutoff (naive UTC) ends image blobs' grace period"""
+    from app.core.settings_cache import get_setting
+    live = set()
+    brand_backend, brand_key = get_storage_for_url(get_setting('brand_logo'))
+    if brand_backend and brand_backend.name == backend.name and brand_key in keys:
+        live.add(brand_key)
+    for check in (lambda remaining: _blob_referenced(remaining, cutoff),
+                  lambda remaining: _variant_referenced(backend, remaining),
+                  lambda remaining: _path_referenced(backend, remaining, cutoff),
+                  lambda remaining: _suffix_referenced(remaining, cutoff)):
+        remaining = [key for key in keys if key not in live]
+        if not remaining:
+            break
+        live |= check(remaining)
+    return live
+
+
+def _list_page(backend, cursor, limit):
+    """The next page of a backend's listing after cursor; on S3 only under S3_PREFIXES, one after another"""
+    if backend.name != 's3':
+        return backend.list_objects(start_after=cursor, limit=limit)
+    objects = []
+    for prefix in S3_PREFIXES:
+        if cursor and cursor > prefix and not cursor.startswith(prefix):
+            continue  # Listed in full already
+        objects += backend.list_objects(start_after=cursor, limit=limit - len(objects), prefix=prefix)
+        if len(objects) >= limit:
+            break
+    return objects
+
+
+def _delete_image_blob(backend, key, cutoff):
+    """
+    Delete the Blob row of an orphaned image object, and its variants, in
+    case it is one.
+
+    Returns:
+        False if the image was stored or pasted again since the check, and
+        the object is to be kept
+    """
+    from app.core.s3_utils import delete_file
+    match = BLOB_KEY.match(key)
+    if match:
+        blob = Blob.query.filter_by(sha256=match.group(1)).first()
+    else:
+        blob = Blob.query.filter(Blob.url.in_(_url_forms(backend, key))).first()
+    if blob is None:
+        return True
+    row_backend, row_key = get_storage_for_url(blob.url)
+    if not row_backend or row_backend.name != backend.name or row_key != key:
+        return True  # The row is about another copy of the content
+
+    variant_urls = {variant['url'] for variant in (blob.variants or {}).values()} - {blob.url}
+    if not Blob.query.filter(Blob.id == blob.id, ~_live_blobs(cutoff)).delete(synchronize_session=False):
+        db_session.rollback()
+        return False
+    db_session.commit()
+    for url in variant_urls:
+        delete_file(url)
+    return True
+
+
+def _load_state():
+    value = db_session.query(Setting.value).filter(Setting.key == STATE_KEY).scalar()
+    try:
+        return json.loads(value) if value else {}
+    except ValueError:
+        return {}
+
+
+def _save_state(state):
+    # Written directly rather than through save_settings(): this is not a setting and must not reset the settings cache
+    setting = Setting.query.filter_by(key=STATE_KEY).first()
+    if setting is None:
+        setting = Setting(key=STATE_KEY, description='Progress of the orphaned file collector')
+        db_session.add(setting)
+    setting.value = json.dumps(state)
+    db_session.commit()
+
+
+def _new_pass():
+    return {'started': datetime.utcnow().isoformat(timespec='seconds'), 'checked': 0, 'orphans': 0,
+            'orphan_bytes': 0, 'deleted': 0}
+
+
+def collect_backend(backend, state, dry_run=True, grace_hours=24, pages=10, page_size=1000):
+    """
+    Check the next pages of a backend's listing for orphaned files and delete
+    them (or, in a dry run, only count them). state is the backend's progress
+    from the previous run and is updated in place.
+
+    Returns:
+        Number of objects checked
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=grace_hours)
+    # Blob rows store naive UTC times
+    row_cutoff = cutoff.replace(tzinfo=None)
+    progress = state.setdefault('pass', _new_pass())
+    checked = 0
+    for _ in range(pages):
+        objects = _list_page(backend, state.get('cursor'), page_size)
+        if objects:
+            state['cursor'] = objects[-1][0]
+        candidates = {key: info for key, info in objects
+                      if _managed(backend, key) and info.last_modified and info.last_modified < cutoff}
+        live = referenced_keys(backend, list(candidates), row_cutoff) if candidates else set()
+        checked += len(objects)
+        progress['checked'] += len(objects)
+
+        for key, info in candidates.items():
+            if key in live:
+                continue
+            progress['orphans'] += 1
+            progress['orphan_bytes'] += info.size
+            if dry_run:
+                logger.info(f"Orphaned file {backend.name}:{key} ({info.size} bytes), not deleted (dry run)")
+                continue
+            # Re-check the age in case the object was rewritten since the listing
+            current = backend.head(key)
+            if current is None or current.last_modified >= cutoff:
+                continue
+            if not _delete_image_blob(backend, key, row_cutoff):
+                continue
+            if backend.delete(key):
+                progress['deleted'] += 1
+                logger.info(f"Deleted orphaned file {backend.name}:{key} ({info.size} bytes)")
+
+        if len(objects) < page_size:
+            # End of the listing: the pass is complete and the next run starts over
+            progress['finished'] = datetime.utcnow().isoformat(timespec='seconds')
+            progress['dry_run'] = dry_run
+            state['last_pass'] = progress
+            state['pass'] = _new_pass()
+            state['cursor'] = None
+            logger.info(f"Orphaned file pass over {backend.name} storage: {progress['checked']} files checked, "
+                        f"{progress['orphans']} orphaned ({progress['orphan_bytes']} bytes), {progress['deleted']} deleted")
+            break
+    return checked
+
+
+def collect_orphaned_files(dry_run=None):
+    """
+    Run the collector over every configured storage backend, resuming each
+    listing where the previous run stopped.
+
+    Returns:
+        {backend name: progress state}
+    """
+    config = current_app.config
+    if dry_run is None:
+        dry_run = config.get('FILE_GC_DRY_RUN', True)
+    names = ['local', 's3'] + (['memory'] if config.get('STORAGE_BACKEND') == 'memory' else [])
+    state = _load_state()
+    for name in names:
+        backend = get_backend(name)
+        if backend is None:
+            continue
+        try:
+            collect_backend(backend, state.setdefault(name, {}), dry_run=dry_run,
+                            grace_hours=config.get('FILE_GC_GRACE_HOURS', 24),
+                            pages=config.get('FILE_GC_PAGES_PER_RUN', 10),
+                            page_size=config.get('FILE_GC_PAGE_SIZE', 1000))
+        except Exception as e:
+            db_session.rollback()
+            logger.error(f"Error collecting orphaned files in {name} storage: {str(e)}")
+        # Saved after a failure too, so the next run resumes after the last page listed
+        _save_state(state)
+    return state
+
+
+def file_gc_report():
+    """Last complete pass over each backend, for the settings page"""
+    return {name: backend_state['last_pass'] for name, backend_state in _load_state().items()
+            if backend_state.get('last_pass')}
+
+
+@track_job('file_gc')
+def run_file_gc(app):
+    """Scheduled job: find and delete orphaned uploaded files"""
+    from app.core.job_lock import cluster_lock
+
+    with app.app_context():
+        try:
+            # One node at a time, as the listing cursor is shared in the database
+            with cluster_lock('file_gc') as acquired:
+                if not acquired:
+                    return
+                collect_orphaned_files()
+        except Exception as e:
+            db_session.rollback()
+            logger.error(f"Error collecting orphaned files: {str(e)}")
+        finally:
+            db_session.remove()
@@ -2,8 +2,11 @@
 IP Whitelist middleware for Flask application
 """
 import ipaddress
+from bisect import bisect_right
+from functools import lru_cache
 from flask import request, abort
-from app.core import models
+from app.core.settings_cache import get_setting, get_setting_bool
+from app.core.metrics import record_cache
 
 
 def get_client_ip():
@@ -24,6 +27,53 @@ def get_client_ip():
     return client_ip
 
 
+def _parse_entries(whitelist):
+    """Split a whitelist on newlines and commas into stripped entries"""
+    entries = []
+    for line in whitelist.split('\n'):
+        entries.extend([e.strip() for e in line.split(',') if e.strip()])
+    return entries
+
+
+@lru_cache(maxsize=16)
+def compile_whitelist(whitelist):
+    """
+    Compile a whitelist string into sorted, merged address intervals.
+    
+    Each entry (single IP or CIDR range) becomes an inclusive integer range.
+    Ranges are sorted and overlapping or adjacent ones merged, separately for
+    IPv4 and IPv6. The result is cached per whitelist string, so it is only
+    rebuilt when the setting changes.
+    
+    Returns:
+        dict: {4: (starts, ends), 6: (starts, ends)} with parallel tuples of ints
+    """
+    ranges = {4: [], 6: []}
+    for entry in _parse_entries(whitelist):
+        try:
+            if '/' in entry:
+                network = ipaddress.ip_network(entry, strict=False)
+                ranges[network.version].append((int(network.network_address), int(network.broadcast_address)))
+            else:
+                address = ipaddress.ip_address(entry)
+                ranges[address.version].append((int(address), int(address)))
+        except ValueError:
+            # Invalid entry, skip it
+            continue
+    
+    compiled = {}
+    for version, version_ranges in ranges.items():
+        merged = []
+        for start, end in sorted(version_ranges):
+            if merged and start <= merged[-1][1] + 1:
+                if end > merged[-1][1]:
+                    merged[-1][1] = end
+            else:
+                merged.append([start, end])
+        compiled[version] = (tuple(r[0] for r in merged), tuple(r[1] for r in merged))
+    return compiled
+
+
 def is_ip_allowed(ip_address, whitelist):
     """
     Check if an IP address is allowed based on the whitelist.
@@ -45,30 +95,13 @@ def is_ip_allowed(ip_address, whitelist):
         # Invalid IP address format
         return False
     
-    # Parse whitelist entries - support both comma-separated and newline-separated
-    # First split by newlines, then by commas
-    entries = []
-    for line in whitelist.split('\n'):
-        entries.extend([e.strip() for e in line.split(',') if e.strip()])
-    whitelist_entries = entries
-    
-    for entry in whitelist_entries:
-        try:
-            # Check if entry is a CIDR range
-            if '/' in entry:
-                network = ipaddress.ip_network(entry, strict=False)
-                if client_ip_obj in network:
-                    return True
-            else:
-                # Single IP address
-                allowed_ip = ipaddress.ip_address(entry)
-                if client_ip_obj == allowed_ip:
-                    return True
-        except (ValueError, ipaddress.AddressValueError):
-            # Invalid entry, skip it
-            continue
-    
-    return False
+    # Binary search for the last range starting at or before the address
+    misses = compile_whitelist.cache_info().misses
+    starts, ends = compile_whitelist(whitelist)[client_ip_obj.version]
+    record_cache('ip_whitelist', 'miss' if compile_whitelist.cache_info().misses > misses else 'hit')
+    value = int(client_ip_obj)
+    index = bisect_right(starts, value) - 1
+    return index >= 0 and value <= ends[index]
 
 
 def check_ip_whitelist():
@@ -86,13 +119,9 @@ def check_ip_whitelist():
         return None
     
     try:
-        # Get IP whitelist settings
-        ip_whitelist_enabled = models.Setting.query.filter_by(key='ip_whitelist_enabled').first()
-        ip_whitelist = models.Setting.query.filter_by(key='ip_whitelist').first()
-        
         # Check if IP whitelist is enabled
-        if ip_whitelist_enabled and ip_whitelist_enabled.value == 'true':
-            whitelist_value = ip_whitelist.value if ip_whitelist and ip_whitelist.value else ''
+        if get_setting_bool('ip_whitelist_enabled'):
+            whitelist_value = get_setting('ip_whitelist', '')
             
             if whitelist_value:
                 client_ip = get_client_ip()
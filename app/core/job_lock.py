@@ -0,0 +1,86 @@
+"""
+Cross-process locks for scheduled jobs.
+
+Every gunicorn worker runs create_app() and therefore starts its own
+APScheduler instance, so each scheduled job fires once per worker. Jobs that
+should only run once per node wrap their body in job_lock().
+
+Jobs whose work must not overlap across nodes either, because they rewrite
+shared rows or keep progress in the database, use cluster_lock(): a MySQL
+named lock, held by a connection of its own for as long as the job runs. On
+other databases (SQLite, a single node) it falls back to job_lock().
+"""
+import os
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+
+def get_lock_folder():
+    """Directory holding the job lock files"""
+    from flask import current_app
+    lock_folder = os.path.join(current_app.config['BACKUP_FOLDER'], '.locks')
+    os.makedirs(lock_folder, exist_ok=True)
+    return lock_folder
+
+
+@contextmanager
+def job_lock(name):
+    """
+    Try to take a non-blocking, node-wide lock for a scheduled job.
+
+    Yields True if this process holds the lock and should run the job, False
+    if another worker is already running it. Must be used inside an app context.
+    """
+    if fcntl is None:
+        yield True
+        return
+
+    lock_path = os.path.join(get_lock_folder(), f'{name}.lock')
+    with open(lock_path, 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            logger.debug(f"Job {name} is already running in another worker")
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def cluster_lock(name):
+    """
+    Try to take a non-blocking lock for a scheduled job across all nodes
+    sharing the database.
+
+    Yields True if this process holds the lock and should run the job, False
+    if another worker or node is already running it. Must be used inside an
+    app context.
+    """
+    from sqlalchemy import text
+    from app import db_engine
+
+    if db_engine.dialect.name != 'mysql':
+        with job_lock(name) as acquired:
+            yield acquired
+        return
+
+    lock_name = f'infogarden_{name}'
+    with db_engine.connect() as conn:
+        if not conn.execute(text("SELECT GET_LOCK(:name, 0)"), {'name': lock_name}).scalar():
+            logger.debug(f"Job {name} is already running on another node")
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            conn.execute(text("SELECT RELEASE_LOCK(:name)"), {'name': lock_name})
@@ -0,0 +1,220 @@
+"""
+Cold archive for expired activity logs.
+
+Before the retention job deletes expired rows, they are streamed into
+gzip-compressed JSONL segment files laid out by day:
+
+    activity_logs/YYYY/MM/DD/segment_<first id>_<last id>.jsonl.gz
+
+Segments are written once and never modified. They live either in the local
+ARCHIVE_FOLDER or in the configured S3 bucket, and can be filtered with
+scan_archive() without loading whole segments into memory.
+"""
+import io
+import os
+import gzip
+import json
+import tempfile
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, and_
+from flask import current_app
+from app import db_session
+from app.core import models
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = 'activity_logs'
+
+
+def _day_prefix(day):
+    return f"{ARCHIVE_PREFIX}/{day.strftime('%Y/%m/%d')}"
+
+
+def _serialize(row):
+    """Convert an activity_logs row to its archived JSON line"""
+    return json.dumps({
+        'id': row.id,
+        'user_id': row.user_id,
+        'org_id': row.org_id,
+        'action_type': row.action_type,
+        'resource_type': row.resource_type,
+        'resource_id': row.resource_id,
+        'ip_address': row.ip_address,
+        'details': row.details,
+        'timestamp': row.timestamp.isoformat() if row.timestamp else None
+    }, separators=(',', ':'), default=str)
+
+
+class LocalArchiveStore:
+    """Segments stored under a local directory"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def write_segment(self, key, lines):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb') as gz:
+                    for line in lines:
+                        gz.write(line.encode('utf-8') + b'\n')
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def list_segments(self, day):
+        folder = os.path.join(self.root, _day_prefix(day))
+        if not os.path.isdir(folder):
+            return []
+        return [f"{_day_prefix(day)}/{name}" for name in sorted(os.listdir(folder)) if name.endswith('.jsonl.gz')]
+
+    def open_segment(self, key):
+        return gzip.open(os.path.join(self.root, key), 'rt', encoding='utf-8')
+
+
+class S3ArchiveStore:
+    """Segments stored in the configured S3 bucket"""
+
+    def __init__(self, client, bucket):
+        self.client = client
+        self.bucket = bucket
+
+    def write_segment(self, key, lines):
+        # Compressed segments are spooled to disk once they outgrow 8MB
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as buffer:
+            with gzip.GzipFile(fileobj=buffer, mode='wb') as gz:
+                for line in lines:
+                    gz.write(line.encode('utf-8') + b'\n')
+            buffer.seek(0)
+            self.client.upload_fileobj(
+                buffer,
+                self.bucket,
+                key,
+                ExtraArgs={'ContentType': 'application/x-ndjson', 'ContentEncoding': 'gzip'}
+            )
+
+    def list_segments(self, day):
+        keys = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=_day_prefix(day) + '/'):
+            for obj in page.get('Contents', []):
+                if obj['Key'].endswith('.jsonl.gz'):
+                    keys.append(obj['Key'])
+        return sorted(keys)
+
+    def open_segment(self, key):
+        body = self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+        return io.TextIOWrapper(gzip.GzipFile(fileobj=body, mode='rb'), encoding='utf-8')
+
+
+def get_archive_store():
+    """Return the archive store selected by ACTIVITY_LOG_ARCHIVE_STORAGE"""
+    if current_app.config.get('ACTIVITY_LOG_ARCHIVE_STORAGE') == 's3':
+        from app.core.s3_utils import get_s3_client
+        result = get_s3_client()
+        if not result:
+            raise RuntimeError('Activity log archive is set to S3 but S3 is not configured')
+        client, bucket = result
+        return S3ArchiveStore(client, bucket)
+    return LocalArchiveStore(current_app.config['ARCHIVE_FOLDER'])
+
+
+def _delete_archived_range(first_id, last_id, cutoff, batch_size):
+    """Delete archived rows in id windows of batch_size, one transaction each"""
+    log = models.ActivityLog
+    start = first_id
+    while start <= last_id:
+        end = min(start + batch_size - 1, last_id)
+        log.query.filter(
+            log.id >= start,
+            log.id <= end,
+            log.timestamp < cutoff
+        ).delete(synchronize_session=False)
+        db_session.commit()
+        start = end + 1
+
+
+def archive_expired_logs(cutoff, segment_rows=20000, batch_size=5000):
+    """
+    Archive and then delete activity logs older than cutoff.
+
+    Rows are read in id order, segment_rows at a time, as plain tuples.
+    Each chunk is split by day and written as one segment per day; only after
+    its segments are durably stored are the rows deleted from the table.
+
+    Returns:
+        Number of rows archived
+    """
+    store = get_archive_store()
+    table = models.ActivityLog.__table__
+    archived = 0
+    last_id = 0
+
+    while True:
+        rows = db_session.execute(
+            select(table).where(and_(table.c.timestamp < cutoff, table.c.id > last_id))
+            .order_by(table.c.id).limit(segment_rows)
+        ).all()
+        if not rows:
+            break
+
+        by_day = {}
+        for row in rows:
+            day = (row.timestamp or cutoff).date()
+            by_day.setdefault(day, []).append(row)
+
+        for day, day_rows in sorted(by_day.items()):
+            key = f"{_day_prefix(day)}/segment_{day_rows[0].id:012d}_{day_rows[-1].id:012d}.jsonl.gz"
+            store.write_segment(key, (_serialize(row) for row in day_rows))
+
+        first_id = rows[0].id
+        last_id = rows[-1].id
+        # End the read transaction before the batched deletes
+        db_session.commit()
+        _delete_archived_range(first_id, last_id, cutoff, batch_size)
+        archived += len(rows)
+
+        if len(rows) < segment_rows:
+            break
+
+    logger.info(f"Archived {archived} activity log rows older than {cutoff.isoformat()}")
+    return archived
+
+
+def scan_archive(start, end, user_id=None, org_id=None, action_type=None, resource_type=None):
+    """
+    Yield archived log entries with start <= timestamp < end that match the filters.
+
+    Segments are decompressed and parsed line by line, so memory use does not
+    depend on segment size. Entries are yielded as dictionaries in the same
+    shape that was archived, ordered by day and then by id within a segment.
+    """
+    store = get_archive_store()
+    day = start.date()
+    while day <= end.date():
+        for key in store.list_segments(day):
+            with store.open_segment(key) as segment:
+                for line in segment:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if user_id is not None and entry.get('user_id') != user_id:
+                        continue
+                    if org_id is not None and entry.get('org_id') != org_id:
+                        continue
+                    if action_type and entry.get('action_type') != action_type:
+                        continue
+                    if resource_type and entry.get('resource_type') != resource_type:
+                        continue
+                    timestamp = datetime.fromisoformat(entry['timestamp']) if entry.get('timestamp') else None
+                    if timestamp is None or timestamp < start or timestamp >= end:
+                        continue
+                    yield entry
+        day += timedelta(days=1)
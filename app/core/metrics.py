@@ -0,0 +1,243 @@
+"""
+Prometheus metrics.
+
+Exposes /metrics when METRICS_ENABLED is set and prometheus_client is
+installed. Under gunicorn every worker is a separate process, so the
+PROMETHEUS_MULTIPROC_DIR environment variable must point at a shared, empty
+directory before the workers start; each process then writes its samples
+there and /metrics merges them (see gunicorn_config.py). Without it, the
+numbers cover only the process that serves the scrape.
+
+Scrapes must send METRICS_TOKEN as a bearer token. Without a token, only
+scrapes straight from a loopback or private address are served; requests
+through a reverse proxy are refused, since the proxy makes every client
+look local.
+
+All helpers in this module are no-ops when metrics are disabled; the metrics
+themselves are only created when init_metrics() enables them, so processes
+without metrics never touch the multiprocess directory.
+"""
+import os
+import time
+import logging
+import ipaddress
+from functools import wraps
+from flask import g, request, Response, abort
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram
+except ImportError:  # pragma: no cover - optional dependency
+    prometheus_client = None
+
+_enabled = False
+
+REQUEST_LATENCY = REQUEST_COUNT = REQUESTS_IN_PROGRESS = None
+POOL_CHECKOUT_WAIT = POOL_CHECKED_OUT = POOL_OVERFLOW = POOL_CAPACITY = None
+JOB_DURATION = JOB_FAILURES = JOBS_IN_PROGRESS = CACHE_REQUESTS = None
+
+
+def _create_metrics():
+    """
+    Create the metric objects, once and only when metrics are enabled: in
+    multiprocess mode each one opens files in PROMETHEUS_MULTIPROC_DIR.
+    """
+    global REQUEST_LATENCY, REQUEST_COUNT, REQUESTS_IN_PROGRESS
+    global POOL_CHECKOUT_WAIT, POOL_CHECKED_OUT, POOL_OVERFLOW, POOL_CAPACITY
+    global JOB_DURATION, JOB_FAILURES, JOBS_IN_PROGRESS, CACHE_REQUESTS
+    if REQUEST_LATENCY is not None:
+        return
+    multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+
+    REQUEST_LATENCY = Histogram(
+        'infogarden_http_request_duration_seconds',
+        'Request latency by endpoint',
+        ['endpoint', 'method'],
+        buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    )
+    REQUEST_COUNT = Counter(
+        'infogarden_http_requests_total',
+        'Requests by endpoint and status code',
+        ['endpoint', 'method', 'status']
+    )
+    REQUESTS_IN_PROGRESS = Gauge(
+        'infogarden_http_requests_in_progress',
+        'Requests currently being served',
+        multiprocess_mode='livesum'
+    )
+    POOL_CHECKOUT_WAIT = Histogram(
+        'infogarden_db_pool_checkout_wait_seconds',
+        'Time spent waiting for a connection from the pool',
+        buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+    )
+    POOL_CHECKED_OUT = Gauge(
+        'infogarden_db_pool_checked_out',
+        'Connections currently checked out of the pool',
+        multiprocess_mode='livesum'
+    )
+    POOL_OVERFLOW = Gauge(
+        'infogarden_db_pool_overflow',
+        'Connections open beyond pool_size',
+        multiprocess_mode='livesum'
+    )
+    POOL_CAPACITY = Gauge(
+        'infogarden_db_pool_capacity',
+        'pool_size + max_overflow per worker',
+        multiprocess_mode='livesum'
+    )
+    JOB_DURATION = Histogram(
+        'infogarden_job_duration_seconds',
+        'Duration of export, PDF and scheduled jobs',
+        ['job'],
+        buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+    )
+    JOB_FAILURES = Counter(
+        'infogarden_job_failures_total',
+        'Jobs that raised an exception',
+        ['job']
+    )
+    JOBS_IN_PROGRESS = Gauge(
+        'infogarden_jobs_in_progress',
+        'Jobs currently running (export queue depth)',
+        ['job'],
+        multiprocess_mode='livesum'
+    )
+    CACHE_REQUESTS = Counter(
+        'infogarden_cache_requests_total',
+        'Cache lookups by cache and result (hit, revalidated, miss)',
+        ['cache', 'result']
+    )
+
+
+def metrics_enabled():
+    return _enabled
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited"""
+
+    def _do_get(self):
+        if not _enabled:
+            return super()._do_get()
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+
+def get_pool_class():
+    """Pool class for create_engine: the instrumented pool when metrics can be collected"""
+    return InstrumentedQueuePool if prometheus_client is not None else QueuePool
+
+
+def record_cache(cache, result):
+    """Count a cache lookup; result is 'hit', 'revalidated' or 'miss'"""
+    if _enabled:
+        CACHE_REQUESTS.labels(cache=cache, result=result).inc()
+
+
+def track_job(job):
+    """Decorator recording duration, failures and concurrency of a job"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not _enabled:
+                return f(*args, **kwargs)
+            in_progress = JOBS_IN_PROGRESS.labels(job=job)
+            in_progress.inc()
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            except Exception:
+                JOB_FAILURES.labels(job=job).inc()
+                raise
+            finally:
+                JOB_DURATION.labels(job=job).observe(time.perf_counter() - start)
+                in_progress.dec()
+        return decorated_function
+    return decorator
+
+
+def _update_pool_gauges(pool):
+    POOL_CHECKED_OUT.set(pool.checkedout())
+    POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+
+def _local_scrape():
+    """Whether the request comes straight from a loopback or private address rather than through a proxy"""
+    if request.headers.get('X-Forwarded-For') or request.headers.get('X-Real-IP'):
+        return False
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    return address.is_loopback or address.is_private
+
+
+def _metrics_view():
+    """Serve metrics in the Prometheus text format, merged across workers if configured"""
+    from flask import current_app
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    if not token and not _local_scrape():
+        abort(403)
+
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import CollectorRegistry, multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return Response(prometheus_client.generate_latest(registry), mimetype=prometheus_client.CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app, engine):
+    """Register request hooks, pool listeners and the /metrics route if enabled"""
+    global _enabled
+
+    if not app.config.get('METRICS_ENABLED'):
+        return
+    if prometheus_client is None:
+        logger.warning("METRICS_ENABLED is set but prometheus_client is not installed")
+        return
+    _create_metrics()
+    _enabled = True
+    if not app.config.get('METRICS_TOKEN'):
+        logger.warning("METRICS_TOKEN is not set: /metrics is only served to loopback and private addresses "
+                       "connecting directly, not through a proxy")
+
+    pool = engine.pool
+    if isinstance(pool, QueuePool):
+        POOL_CAPACITY.set(pool.size() + max(pool._max_overflow, 0))
+        event.listen(engine, 'checkout', lambda *args: _update_pool_gauges(pool))
+        event.listen(engine, 'checkin', lambda *args: _update_pool_gauges(pool))
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_start = time.perf_counter()
+        g.metrics_in_progress = True
+        REQUESTS_IN_PROGRESS.inc()
+
+    @app.after_request
+    def record_request_metrics(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            endpoint = request.endpoint or 'unmatched'
+            REQUEST_LATENCY.labels(endpoint=endpoint, method=request.method).observe(time.perf_counter() - start)
+            REQUEST_COUNT.labels(endpoint=endpoint, method=request.method, status=str(response.status_code)).inc()
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exception=None):
+        if g.pop('metrics_in_progress', False):
+            REQUESTS_IN_PROGRESS.dec()
+
+    app.add_url_rule('/metrics', 'metrics', _metrics_view)
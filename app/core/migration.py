@@ -3,6 +3,7 @@ Auto-migration system that detects schema changes and applies them safely
 """
 from sqlalchemy import inspect, text
 from sqlalchemy.exc import OperationalError
+from datetime import date, datetime
 import logging
 
 logger = logging.getLogger(__name__)
@@ -79,8 +80,21 @@ def safe_drop_column(engine, table_name, column_name):
         logger.error(f"Error dropping column {column_name} from {table_name}: {str(e)}")
         return False
 
-def migrate_table(engine, model):
-    """Migrate a single table"""
+def safe_create_indexes(engine, model):
+    """Create indexes declared on the model that are missing from the database"""
+    table_name = model.__tablename__
+    try:
+        inspector = inspect(engine)
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table_name)}
+        for index in model.__table__.indexes:
+            if index.name not in existing_indexes:
+                index.create(engine)
+                logger.info(f"Created index {index.name} on {table_name}")
+    except Exception as e:
+        logger.error(f"Error creating indexes on {table_name}: {str(e)}")
+
+def migrate_table(engine, model, create_indexes=True):
+    """Migrate a single table; create_indexes=False leaves missing indexes of an existing table to the caller"""
     table_name = model.__tablename__
     db_columns = get_table_columns(engine, table_name)
     model_columns = get_model_columns(model)
@@ -96,9 +110,179 @@ def migrate_table(engine, model):
         if col_name not in db_columns:
             safe_add_column(engine, table_name, col_name, col_def)
     
+    # Add missing indexes
+    if create_indexes:
+        safe_create_indexes(engine, model)
+    
     # Note: We don't automatically drop columns unless explicitly configured
     # This is a safety measure - columns should be dropped manually if needed
 
+def _month_start(value):
+    """First day of the month containing value"""
+    return date(value.year, value.month, 1)
+
+def _add_months(value, months):
+    """Shift a first-of-month date by a number of months"""
+    month_index = value.year * 12 + value.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def _partition_name(month):
+    return f"p{month.strftime('%Y%m')}"
+
+def _partition_clause(month):
+    """Partition definition holding all rows before the start of the following month"""
+    upper = _add_months(month, 1)
+    return f"PARTITION {_partition_name(month)} VALUES LESS THAN (TO_DAYS('{upper.isoformat()}'))"
+
+def get_activity_log_partitions(engine):
+    """Return the partition names of activity_logs in order (empty if not partitioned)"""
+    if engine.dialect.name != 'mysql':
+        return []
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'activity_logs' "
+            "AND PARTITION_NAME IS NOT NULL ORDER BY PARTITION_ORDINAL_POSITION"
+        )).fetchall()
+    return [row[0] for row in rows]
+
+# MySQL named lock held while activity_logs is converted to partitions
+PARTITIONING_LOCK = 'infogarden_activity_log_partitioning'
+
+def setup_activity_log_partitioning(engine, months_ahead=3):
+    """
+    Convert activity_logs to monthly RANGE partitions on timestamp (MySQL only).
+    
+    MySQL requires the partitioning column in every unique key and does not
+    allow foreign keys on partitioned tables, so the foreign keys are dropped
+    and the primary key becomes (id, timestamp). Existing rows are placed in
+    one partition per month starting at the oldest row. An already partitioned
+    table only gets new months added.
+    
+    Rebuilding a large table takes a long time, so this runs from the
+    activity_log_migration job rather than at startup, and under a MySQL named lock: while one worker
+    (on any node) converts the table, the others skip it.
+    """
+    if engine.dialect.name != 'mysql':
+        logger.info("Activity log partitioning is only supported on MySQL, skipping")
+        return False
+    
+    if get_activity_log_partitions(engine):
+        ensure_activity_log_partitions(engine, months_ahead)
+        return True
+    
+    try:
+        inspector = inspect(engine)
+        with engine.connect() as conn:
+            if not conn.execute(text("SELECT GET_LOCK(:name, 0)"), {'name': PARTITIONING_LOCK}).scalar():
+                logger.info("activity_logs is being partitioned by another worker, skipping")
+                return False
+            try:
+                return _partition_activity_logs(conn, inspector, months_ahead)
+            finally:
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {'name': PARTITIONING_LOCK})
+    except Exception as e:
+        logger.error(f"Error partitioning activity_logs: {str(e)}")
+        return False
+
+def _partition_activity_logs(conn, inspector, months_ahead):
+    """Convert activity_logs to partitions on conn, which holds PARTITIONING_LOCK"""
+    # Another worker may have finished the conversion since the caller checked
+    if conn.execute(text(
+        "SELECT COUNT(*) FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'activity_logs' AND PARTITION_NAME IS NOT NULL"
+    )).scalar():
+        return True
+    
+    for fk in inspector.get_foreign_keys('activity_logs'):
+        if fk.get('name'):
+            conn.execute(text(f"ALTER TABLE activity_logs DROP FOREIGN KEY `{fk['name']}`"))
+    
+    conn.execute(text("UPDATE activity_logs SET `timestamp` = UTC_TIMESTAMP() WHERE `timestamp` IS NULL"))
+    conn.execute(text("ALTER TABLE activity_logs MODIFY COLUMN `timestamp` DATETIME NOT NULL"))
+    conn.execute(text("ALTER TABLE activity_logs DROP PRIMARY KEY, ADD PRIMARY KEY (id, `timestamp`)"))
+    
+    oldest = conn.execute(text("SELECT MIN(`timestamp`) FROM activity_logs")).scalar()
+    first_month = _month_start(oldest or datetime.utcnow())
+    last_month = _add_months(_month_start(datetime.utcnow()), months_ahead)
+    
+    clauses = []
+    month = first_month
+    while month <= last_month:
+        clauses.append(_partition_clause(month))
+        month = _add_months(month, 1)
+    clauses.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    
+    conn.execute(text(
+        "ALTER TABLE activity_logs PARTITION BY RANGE (TO_DAYS(`timestamp`)) (" + ", ".join(clauses) + ")"
+    ))
+    conn.commit()
+    logger.info(f"Partitioned activity_logs into {len(clauses)} monthly partitions")
+    return True
+
+def ensure_activity_log_partitions(engine, months_ahead=3):
+    """Split pmax so partitions exist for the next months_ahead months"""
+    partitions = get_activity_log_partitions(engine)
+    if not partitions or 'pmax' not in partitions:
+        return 0
+    
+    existing = {name for name in partitions if name != 'pmax'}
+    months = []
+    month = _month_start(datetime.utcnow())
+    last_month = _add_months(month, months_ahead)
+    while month <= last_month:
+        if _partition_name(month) not in existing:
+            months.append(month)
+        month = _add_months(month, 1)
+    
+    # Only months newer than the newest existing partition can be split out of pmax
+    if existing:
+        newest = max(existing)
+        months = [m for m in months if _partition_name(m) > newest]
+    if not months:
+        return 0
+    
+    clauses = [_partition_clause(m) for m in months]
+    clauses.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    try:
+        with engine.connect() as conn:
+            conn.execute(text(
+                "ALTER TABLE activity_logs REORGANIZE PARTITION pmax INTO (" + ", ".join(clauses) + ")"
+            ))
+            conn.commit()
+        logger.info(f"Added {len(months)} activity_logs partitions")
+        return len(months)
+    except Exception as e:
+        logger.error(f"Error adding activity_logs partitions: {str(e)}")
+        return 0
+
+def drop_expired_activity_log_partitions(engine, cutoff):
+    """Drop monthly partitions whose rows are all older than cutoff"""
+    partitions = get_activity_log_partitions(engine)
+    expired = []
+    for name in partitions:
+        if name == 'pmax':
+            continue
+        try:
+            month = datetime.strptime(name[1:], '%Y%m').date()
+        except ValueError:
+            continue
+        if datetime.combine(_add_months(month, 1), datetime.min.time()) <= cutoff:
+            expired.append(name)
+    
+    if not expired:
+        return 0
+    
+    try:
+        with engine.connect() as conn:
+            conn.execute(text(f"ALTER TABLE activity_logs DROP PARTITION {', '.join(expired)}"))
+            conn.commit()
+        logger.info(f"Dropped expired activity_logs partitions: {', '.join(expired)}")
+        return len(expired)
+    except Exception as e:
+        logger.error(f"Error dropping activity_logs partitions: {str(e)}")
+        return 0
+
 def run_auto_migration(engine, session):
     """Run auto-migration for all models"""
     logger.info("Starting auto-migration...")
@@ -106,20 +290,25 @@ def run_auto_migration(engine, session):
     try:
         # Import all models
         from app.core import models as core_models
-        from app.modules.docs.models import Document, DocumentFolder
+        from app.modules.docs.models import Document, DocumentFolder, Software, DocumentFile
         from app.modules.contacts.models import Contact
         from app.modules.passwords.models import PasswordEntry
         
         # Migrate core models
         migrate_table(engine, core_models.User)
         migrate_table(engine, core_models.Organization)
-        migrate_table(engine, core_models.ActivityLog)
+        # Indexing a large activity_logs table outlasts the worker boot timeout; the activity_log_migration job does it
+        migrate_table(engine, core_models.ActivityLog, create_indexes=False)
+        migrate_table(engine, core_models.ActivityRollup)
         migrate_table(engine, core_models.Role)
         migrate_table(engine, core_models.Setting)
+        migrate_table(engine, core_models.Blob)
         
         # Migrate module models
         migrate_table(engine, DocumentFolder)
         migrate_table(engine, Document)
+        migrate_table(engine, Software)
+        migrate_table(engine, DocumentFile)
         migrate_table(engine, Contact)
         migrate_table(engine, PasswordEntry)
         
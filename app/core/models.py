@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Date, DateTime, Boolean, ForeignKey, JSON, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -62,7 +62,7 @@ class Organization(Base):
     name = Column(String(200), nullable=False)
     description = Column(Text, nullable=True)
     status = Column(String(50), nullable=False, default='active')  # active, inactive, archived
-    logo_path = Column(String(255), nullable=True)
+    logo_path = Column(String(255), nullable=True, index=True)
     custom_links = Column(JSON, nullable=True)  # List of {label: str, url: str} objects
     pinned_contacts = Column(JSON, nullable=True)  # List of {contact_id: int, note: str} objects
     must_knows = Column(Text, nullable=True)  # Rich text field for important operational information
@@ -96,6 +96,28 @@ class ActivityLog(Base):
     
     user = relationship('User', back_populates='activity_logs')
     organization = relationship('Organization', back_populates='activity_logs')
+    
+    __table_args__ = (
+        Index('ix_activity_logs_user_id_timestamp', 'user_id', 'timestamp'),
+        Index('ix_activity_logs_org_id_timestamp', 'org_id', 'timestamp'),
+    )
+
+class ActivityRollup(Base):
+    """Daily activity counts per (org, user, action_type, resource_type), built from activity_logs"""
+    __tablename__ = 'activity_rollups'
+    query = QueryProperty()
+    
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False, index=True)
+    org_id = Column(Integer, nullable=True)  # No foreign keys: rollups are kept after orgs/users are deleted
+    user_id = Column(Integer, nullable=True)
+    action_type = Column(String(50), nullable=False)
+    resource_type = Column(String(50), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index('ix_activity_rollups_org_id_day', 'org_id', 'day'),
+    )
 
 class Role(Base):
     __tablename__ = 'roles'
@@ -134,3 +156,17 @@ class ExportJob(Base):
     organization = relationship('Organization')
     creator = relationship('User')
 
+class Blob(Base):
+    """An uploaded file stored once per distinct content and shared by every record that references it"""
+    __tablename__ = 'blobs'
+    query = QueryProperty()
+    
+    id = Column(Integer, primary_key=True)
+    sha256 = Column(String(64), unique=True, nullable=False)  # Hex SHA-256 of the content
+    size = Column(BigInteger, nullable=False)
+    content_type = Column(String(100), nullable=True)
+    url = Column(String(500), nullable=False, index=True)  # What Software, DocumentFile, logo and image references store
+    ref_count = Column(Integer, nullable=False, default=0)
+    variants = Column(JSON(none_as_null=True), nullable=True)  # Image display/thumbnail variants; {} when there are none
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
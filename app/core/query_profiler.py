@@ -0,0 +1,221 @@
+"""
+Opt-in SQL query profiler.
+
+When QUERY_PROFILER_ENABLED is set, every statement executed during a request
+is timed and reduced to a "shape" (the SQL with literals and IN lists
+collapsed). At the end of the request:
+
+- statements slower than QUERY_PROFILER_SLOW_MS are written as JSON lines to
+  the slow query log together with the application call site;
+- SELECT shapes repeated QUERY_PROFILER_N_PLUS_ONE times or more are flagged
+  as likely N+1 patterns;
+- query count, DB time and flagged shapes are folded into per-endpoint
+  aggregates for this worker, shown at /admin/query-profile.
+"""
+import os
+import re
+import json
+import time
+import logging
+import threading
+import traceback
+from datetime import datetime
+from flask import g, request, current_app, has_app_context
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger(__name__ + '.slow')
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_SHAPES_PER_ENDPOINT = 50
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_NAMED_PARAM_RE = re.compile(r'%\([^)]+\)s|:\w+')
+_PARAM_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+_lock = threading.Lock()
+_endpoints = {}
+
+
+def normalize_statement(statement):
+    """Reduce a SQL statement to its shape so repeated queries compare equal"""
+    shape = _WHITESPACE_RE.sub(' ', statement).strip()
+    shape = _STRING_RE.sub('?', shape)
+    shape = _NAMED_PARAM_RE.sub('?', shape)
+    shape = shape.replace('%s', '?')
+    shape = _NUMBER_RE.sub('?', shape)
+    return _PARAM_LIST_RE.sub('(?+)', shape)
+
+
+def get_call_site():
+    """Innermost application frame outside this module, as 'path:line in function'"""
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(APP_ROOT) and filename != os.path.abspath(__file__) and 'site-packages' not in filename:
+            return f"{os.path.relpath(filename, os.path.dirname(APP_ROOT))}:{frame.lineno} in {frame.name}"
+    return None
+
+
+class RequestProfile:
+    """Statements seen during the current request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.shapes = {}
+        self.slow = []
+
+
+def _get_profile():
+    if not has_app_context():
+        return None
+    return g.get('query_profile')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _get_profile() is not None:
+        conn.info.setdefault('query_profiler_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _get_profile()
+    starts = conn.info.get('query_profiler_start')
+    if profile is None or not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+
+    shape = normalize_statement(statement)
+    profile.queries += 1
+    profile.db_time += elapsed
+
+    entry = profile.shapes.get(shape)
+    if entry is None:
+        # Call sites are only resolved once per shape to keep overhead low
+        entry = profile.shapes[shape] = {'count': 0, 'time': 0.0, 'call_site': get_call_site()}
+    entry['count'] += 1
+    entry['time'] += elapsed
+
+    if elapsed * 1000 >= current_app.config.get('QUERY_PROFILER_SLOW_MS', 100):
+        profile.slow.append({
+            'duration_ms': round(elapsed * 1000, 2),
+            'statement': shape,
+            'call_site': get_call_site()
+        })
+
+
+def _handle_error(context):
+    # A statement that raised gets no after_cursor_execute; drop its start so the next statement is not timed from it
+    starts = context.connection.info.get('query_profiler_start') if context.connection is not None else None
+    if starts and context.execution_context is not None:
+        starts.pop()
+
+
+def _record(endpoint, profile, n_plus_one):
+    """Fold a finished request into the per-endpoint aggregates"""
+    with _lock:
+        stats = _endpoints.setdefault(endpoint, {
+            'requests': 0,
+            'queries': 0,
+            'db_time': 0.0,
+            'max_queries': 0,
+            'slow_queries': 0,
+            'n_plus_one_requests': 0,
+            'shapes': {}
+        })
+        stats['requests'] += 1
+        stats['queries'] += profile.queries
+        stats['db_time'] += profile.db_time
+        stats['max_queries'] = max(stats['max_queries'], profile.queries)
+        stats['slow_queries'] += len(profile.slow)
+        if n_plus_one:
+            stats['n_plus_one_requests'] += 1
+        for shape, count, call_site in n_plus_one:
+            flagged = stats['shapes'].get(shape)
+            if flagged is None:
+                if len(stats['shapes']) >= MAX_SHAPES_PER_ENDPOINT:
+                    continue
+                flagged = stats['shapes'][shape] = {'requests': 0, 'max_count': 0, 'call_site': call_site}
+            flagged['requests'] += 1
+            flagged['max_count'] = max(flagged['max_count'], count)
+
+
+def get_profile_report():
+    """Per-endpoint aggregates for this worker, busiest DB time first"""
+    with _lock:
+        report = []
+        for endpoint, stats in _endpoints.items():
+            report.append({
+                'endpoint': endpoint,
+                'requests': stats['requests'],
+                'avg_queries': round(stats['queries'] / stats['requests'], 1),
+                'max_queries': stats['max_queries'],
+                'avg_db_ms': round(stats['db_time'] * 1000 / stats['requests'], 2),
+                'total_db_ms': round(stats['db_time'] * 1000, 2),
+                'slow_queries': stats['slow_queries'],
+                'n_plus_one_requests': stats['n_plus_one_requests'],
+                'n_plus_one': sorted(
+                    ({'statement': shape, **flagged} for shape, flagged in stats['shapes'].items()),
+                    key=lambda item: item['max_count'],
+                    reverse=True
+                )
+            })
+    return sorted(report, key=lambda item: item['total_db_ms'], reverse=True)
+
+
+def reset_profile_report():
+    """Clear this worker's aggregates"""
+    with _lock:
+        _endpoints.clear()
+
+
+def init_query_profiler(app, engine):
+    """Attach the profiler to the engine and request cycle if enabled"""
+    if not app.config.get('QUERY_PROFILER_ENABLED'):
+        return
+
+    log_path = app.config.get('QUERY_PROFILER_SLOW_LOG')
+    if log_path and not slow_logger.handlers:
+        os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+        handler = logging.FileHandler(log_path)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        slow_logger.addHandler(handler)
+        slow_logger.setLevel(logging.INFO)
+        slow_logger.propagate = False
+
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+    @app.before_request
+    def start_query_profile():
+        g.query_profile = RequestProfile()
+
+    @app.after_request
+    def finish_query_profile(response):
+        profile = _get_profile()
+        if profile is None:
+            return response
+
+        endpoint = request.endpoint or request.path
+        threshold = app.config.get('QUERY_PROFILER_N_PLUS_ONE', 5)
+        n_plus_one = [
+            (shape, entry['count'], entry['call_site'])
+            for shape, entry in profile.shapes.items()
+            if entry['count'] >= threshold and shape.upper().startswith('SELECT')
+        ]
+        for shape, count, call_site in n_plus_one:
+            logger.warning(f"Possible N+1 on {endpoint}: {count}x at {call_site}: {shape[:200]}")
+
+        for slow in profile.slow:
+            slow_logger.info(json.dumps({
+                'timestamp': datetime.utcnow().isoformat(),
+                'method': request.method,
+                'path': request.path,
+                'endpoint': endpoint,
+                **slow
+            }))
+
+        _record(endpoint, profile, n_plus_one)
+        return response
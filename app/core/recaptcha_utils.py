@@ -3,7 +3,7 @@ reCAPTCHA utility functions for verifying Google reCAPTCHA v2 tokens
 """
 import requests
 from typing import Optional, Dict, Tuple
-from app.core import models
+from app.core.settings_cache import get_setting
 
 
 def get_recaptcha_settings() -> Optional[Dict[str, str]]:
@@ -13,22 +13,19 @@ def get_recaptcha_settings() -> Optional[Dict[str, str]]:
     Returns:
         Dictionary with reCAPTCHA settings or None if not configured
     """
-    recaptcha_enabled = models.Setting.query.filter_by(key='recaptcha_enabled').first()
-    if not recaptcha_enabled or recaptcha_enabled.value != 'true':
+    if get_setting('recaptcha_enabled') != 'true':
         return None
     
-    recaptcha_site_key = models.Setting.query.filter_by(key='recaptcha_site_key').first()
-    recaptcha_secret_key = models.Setting.query.filter_by(key='recaptcha_secret_key').first()
+    recaptcha_site_key = get_setting('recaptcha_site_key')
+    recaptcha_secret_key = get_setting('recaptcha_secret_key')
     
-    if not recaptcha_site_key or not recaptcha_site_key.value:
-        return None
-    if not recaptcha_secret_key or not recaptcha_secret_key.value:
+    if not recaptcha_site_key or not recaptcha_secret_key:
         return None
     
     return {
         'enabled': True,
-        'site_key': recaptcha_site_key.value,
-        'secret_key': recaptcha_secret_key.value
+        'site_key': recaptcha_site_key,
+        'secret_key': recaptcha_secret_key
     }
 
 
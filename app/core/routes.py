@@ -8,6 +8,7 @@ from app.core.backup import create_backup, restore_backup
 from app.core.smtp_utils import get_smtp_settings, test_smtp_connection, send_test_email, send_email
 from app.core.recent_visits import remove_recent_visit
 from app.core.recaptcha_utils import get_recaptcha_settings, verify_recaptcha
+from app.core.settings_cache import get_setting, get_settings, get_all_settings, get_branding, save_settings
 from app import db_session
 from werkzeug.utils import secure_filename
 import os
@@ -95,13 +96,7 @@ def login():
         if not username or not password:
             flash('Username and password are required', 'error')
             # Get branding for template
-            brand_name = 'InfoGarden'
-            brand_logo = None
-            for setting in models.Setting.query.filter(models.Setting.key.in_(['brand_name', 'brand_logo'])).all():
-                if setting.key == 'brand_name' and setting.value:
-                    brand_name = setting.value
-                elif setting.key == 'brand_logo' and setting.value:
-                    brand_logo = setting.value
+            brand_name, brand_logo = get_branding()
             # Check if SMTP is configured
             smtp_configured = get_smtp_settings() is not None
             # Get reCAPTCHA settings
@@ -116,13 +111,7 @@ def login():
             if not recaptcha_token:
                 flash('Please complete the reCAPTCHA verification', 'error')
                 # Get branding for template
-                brand_name = 'InfoGarden'
-                brand_logo = None
-                for setting in models.Setting.query.filter(models.Setting.key.in_(['brand_name', 'brand_logo'])).all():
-                    if setting.key == 'brand_name' and setting.value:
-                        brand_name = setting.value
-                    elif setting.key == 'brand_logo' and setting.value:
-                        brand_logo = setting.value
+                brand_name, brand_logo = get_branding()
                 # Check if SMTP is configured
                 smtp_configured = get_smtp_settings() is not None
                 return render_template('login.html', brand_name=brand_name, brand_logo=brand_logo, 
@@ -133,13 +122,7 @@ def login():
             if not success:
                 flash(f'reCAPTCHA verification failed: {message}', 'error')
                 # Get branding for template
-                brand_name = 'InfoGarden'
-                brand_logo = None
-                for setting in models.Setting.query.filter(models.Setting.key.in_(['brand_name', 'brand_logo'])).all():
-                    if setting.key == 'brand_name' and setting.value:
-                        brand_name = setting.value
-                    elif setting.key == 'brand_logo' and setting.value:
-                        brand_logo = setting.value
+                brand_name, brand_logo = get_branding()
                 # Check if SMTP is configured
                 smtp_configured = get_smtp_settings() is not None
                 return render_template('login.html', brand_name=brand_name, brand_logo=brand_logo, 
@@ -163,13 +146,7 @@ def login():
             flash('Invalid username or password', 'error')
     
     # Get branding for template
-    brand_name = 'InfoGarden'
-    brand_logo = None
-    for setting in models.Setting.query.filter(models.Setting.key.in_(['brand_name', 'brand_logo'])).all():
-        if setting.key == 'brand_name' and setting.value:
-            brand_name = setting.value
-        elif setting.key == 'brand_logo' and setting.value:
-            brand_logo = setting.value
+    brand_name, brand_logo = get_branding()
     
     # Check if SMTP is configured
     smtp_configured = get_smtp_settings() is not None
@@ -184,13 +161,7 @@ def login():
 def forgot_password():
     """Forgot password - send reset email"""
     # Get branding for template
-    brand_name = 'InfoGarden'
-    brand_logo = None
-    for setting in models.Setting.query.filter(models.Setting.key.in_(['brand_name', 'brand_logo'])).all():
-        if setting.key == 'brand_name' and setting.value:
-            brand_name = setting.value
-        elif setting.key == 'brand_logo' and setting.value:
-            brand_logo = setting.value
+    brand_name, brand_logo = get_branding()
     
     # Check if SMTP is configured
     smtp_settings = get_smtp_settings()
@@ -271,13 +242,7 @@ Best regards,
 def reset_password(token):
     """Reset password with token"""
     # Get branding for template
-    brand_name = 'InfoGarden'
-    brand_logo = None
-    for setting in models.Setting.query.filter(models.Setting.key.in_(['brand_name', 'brand_logo'])).all():
-        if setting.key == 'brand_name' and setting.value:
-            brand_name = setting.value
-        elif setting.key == 'brand_logo' and setting.value:
-            brand_logo = setting.value
+    brand_name, brand_logo = get_branding()
     
     if current_user.is_authenticated:
         return redirect(url_for('core_auth.dashboard'))
@@ -336,8 +301,18 @@ def dashboard():
     if org_id:
         org = models.Organization.query.get(org_id)
     
+    # Activity statistics come from the daily rollups; global admins without an org see all orgs
+    activity_summary = activity_daily = activity_top_users = None
+    if org or current_user.is_global_admin():
+        from app.core.activity_rollups import get_activity_summary, get_daily_activity, get_top_users
+        stats_org_id = org.id if org else None
+        activity_summary = get_activity_summary(stats_org_id)
+        activity_daily = get_daily_activity(stats_org_id)
+        activity_top_users = get_top_users(stats_org_id)
+    
     log_activity('view', 'dashboard', None)
-    return render_template('dashboard.html', org=org)
+    return render_template('dashboard.html', org=org, activity_summary=activity_summary,
+                           activity_daily=activity_daily, activity_top_users=activity_top_users)
 
 @bp.route('/settings', methods=['GET', 'POST'])
 @login_required
@@ -415,37 +390,33 @@ def settings():
             settings_map['s3_region'] = request.form.get('s3_region', 'us-east-1').strip()
         if 's3_custom_domain' in request.form:
             settings_map['s3_custom_domain'] = request.form.get('s3_custom_domain', '').strip()
+        if 's3_endpoint_url' in request.form:
+            settings_map['s3_endpoint_url'] = request.form.get('s3_endpoint_url', '').strip()
+        if 's3_presigned_expiry' in request.form:
+            # Submitted with the S3 form, where an unchecked box is simply absent
+            settings_map['s3_presigned_downloads'] = str(request.form.get('s3_presigned_downloads') == 'on').lower()
+            settings_map['s3_direct_uploads'] = str(request.form.get('s3_direct_uploads') == 'on').lower()
+            settings_map['s3_presigned_expiry'] = request.form.get('s3_presigned_expiry', '300').strip()
         
-        # Store in settings table
-        for key, value in settings_map.items():
-            # Skip secret keys if they're empty (user wants to keep existing)
-            if key in ['recaptcha_secret_key', 's3_secret_key'] and not value:
-                continue
-            setting = models.Setting.query.filter_by(key=key).first()
-            if setting:
-                setting.value = value
-            else:
-                # Don't create secret key setting if it's empty
-                if key in ['recaptcha_secret_key', 's3_secret_key'] and not value:
-                    continue
-                setting = models.Setting(key=key, value=value)
-                db_session.add(setting)
-        
-        db_session.commit()
+        # Store in settings table, keeping existing secret keys if left empty
+        save_settings(settings_map, keep_if_empty=['recaptcha_secret_key', 's3_secret_key'])
         flash('Settings updated successfully', 'success')
         log_activity('update', 'settings', None)
         return redirect(url_for('core_auth.settings'))
     
     # Get current settings
-    settings_dict = {}
-    for setting in models.Setting.query.all():
-        settings_dict[setting.key] = setting.value
+    settings_dict = get_all_settings()
     
     # Get current client IP for display in IP whitelist settings
     from app.core.ip_whitelist import get_client_ip
     current_client_ip = get_client_ip()
     
-    return render_template('settings.html', settings=settings_dict, current_client_ip=current_client_ip)
+    # Deduplicated upload storage and orphaned files, for the storage summary
+    from app.core.blobs import blob_stats
+    from app.core.file_gc import file_gc_report
+    
+    return render_template('settings.html', settings=settings_dict, current_client_ip=current_client_ip,
+                           blob_stats=blob_stats(), file_gc=file_gc_report())
 
 @bp.route('/settings/upload-logo', methods=['POST'])
 @login_required
@@ -468,23 +439,16 @@ def upload_logo():
         filename = secure_filename('brand_logo.jpg')
         
         # Delete old logo if it exists
-        old_logo_setting = models.Setting.query.filter_by(key='brand_logo').first()
-        if old_logo_setting and old_logo_setting.value:
-            delete_file(old_logo_setting.value)
+        old_logo = get_setting('brand_logo')
+        if old_logo:
+            delete_file(old_logo)
         
         # Upload file (to S3 or local storage)
         logo_url = upload_file(file, filename, folder='uploads', content_type='image/jpeg')
         
         if logo_url:
             # Store logo path in settings
-            setting = models.Setting.query.filter_by(key='brand_logo').first()
-            if setting:
-                setting.value = logo_url
-            else:
-                setting = models.Setting(key='brand_logo', value=logo_url)
-                db_session.add(setting)
-            
-            db_session.commit()
+            save_settings({'brand_logo': logo_url})
             flash('Logo uploaded successfully', 'success')
             log_activity('update', 'settings', None, {'action': 'logo_upload'})
         else:
@@ -597,22 +561,8 @@ def smtp_settings_save():
         flash('SMTP port must be a valid number between 1 and 65535', 'error')
         return redirect(url_for('core_auth.settings'))
     
-    # Store in settings table
-    for key, value in smtp_settings.items():
-        setting = models.Setting.query.filter_by(key=key).first()
-        if setting:
-            # Don't update password if it's empty (user wants to keep existing)
-            if key == 'smtp_password' and not value:
-                continue
-            setting.value = value
-        else:
-            # Don't create password setting if it's empty
-            if key == 'smtp_password' and not value:
-                continue
-            setting = models.Setting(key=key, value=value)
-            db_session.add(setting)
-    
-    db_session.commit()
+    # Store in settings table, keeping the existing password if left empty
+    save_settings(smtp_settings, keep_if_empty=['smtp_password'])
     flash('SMTP settings saved successfully', 'success')
     log_activity('update', 'settings', None, {'action': 'smtp_settings'})
     return redirect(url_for('core_auth.settings'))
@@ -640,9 +590,7 @@ def smtp_test():
     
     # If password is empty, try to get from database
     if not smtp_settings['smtp_password']:
-        existing_setting = models.Setting.query.filter_by(key='smtp_password').first()
-        if existing_setting:
-            smtp_settings['smtp_password'] = existing_setting.value
+        smtp_settings['smtp_password'] = get_setting('smtp_password', '')
     
     # Validate required fields
     required_fields = ['smtp_server', 'smtp_port', 'smtp_from_email']
@@ -671,13 +619,93 @@ def smtp_test():
     else:
         return jsonify({'success': False, 'message': f'Failed to send test email: {message}'}), 200
 
+@bp.route('/admin/query-profile', methods=['GET', 'POST'])
+@login_required
+@require_global_admin
+def query_profile():
+    """Per-endpoint query statistics collected by the query profiler"""
+    from app.core.query_profiler import get_profile_report, reset_profile_report
+    
+    if request.method == 'POST':
+        reset_profile_report()
+        flash('Query profile reset for this worker', 'success')
+        return redirect(url_for('core_auth.query_profile'))
+    
+    report = get_profile_report()
+    if request.args.get('format') == 'json':
+        return jsonify({'pid': os.getpid(), 'endpoints': report})
+    
+    return render_template('query_profile.html', report=report, pid=os.getpid(),
+                         enabled=current_app.config.get('QUERY_PROFILER_ENABLED'))
+
+@bp.route('/admin/profiler')
+@login_required
+@require_global_admin
+def profiler():
+    """Start sampling sessions and download their flamegraph data"""
+    from app.core.sampling_profiler import SETTING_KEY, parse_session, list_profiles
+    raw = get_setting(SETTING_KEY)
+    active = parse_session(raw) if raw else None
+    if active and active['until'] <= datetime.now().timestamp():
+        active = None
+    endpoints = sorted({rule.endpoint for rule in current_app.url_map.iter_rules() if rule.endpoint != 'static'})
+    return render_template('profiler.html', active=active, endpoints=endpoints,
+                         profiles=list_profiles(current_app.config['PROFILE_FOLDER']))
+
+@bp.route('/admin/profiler/start', methods=['POST'])
+@login_required
+@require_global_admin
+def profiler_start():
+    """Start a profiling session in every worker"""
+    from app.core.sampling_profiler import SETTING_KEY, new_session
+    mode = request.form.get('mode', 'duration')
+    try:
+        seconds = int(request.form.get('seconds', '30'))
+        interval_ms = int(request.form.get('interval_ms', '10'))
+        request_count = int(request.form.get('requests', '10')) if mode == 'requests' else None
+    except ValueError:
+        flash('Seconds, interval and request count must be numbers', 'error')
+        return redirect(url_for('core_auth.profiler'))
+    
+    endpoint = request.form.get('endpoint', '').strip() or None
+    if mode == 'requests' and not endpoint:
+        flash('Choose an endpoint to profile', 'error')
+        return redirect(url_for('core_auth.profiler'))
+    
+    save_settings({SETTING_KEY: new_session(mode, seconds, endpoint, request_count, interval_ms)})
+    log_activity('update', 'settings', None, {'action': 'profiler_start', 'mode': mode, 'endpoint': endpoint})
+    flash('Profiling started. Workers join within a few seconds, on their next request.', 'success')
+    return redirect(url_for('core_auth.profiler'))
+
+@bp.route('/admin/profiler/stop', methods=['POST'])
+@login_required
+@require_global_admin
+def profiler_stop():
+    """Stop the active profiling session"""
+    from app.core.sampling_profiler import SETTING_KEY
+    save_settings({SETTING_KEY: ''})
+    flash('Profiling stopped. Workers write their samples on their next request.', 'success')
+    return redirect(url_for('core_auth.profiler'))
+
+@bp.route('/admin/profiler/<session_id>/download')
+@login_required
+@require_global_admin
+def profiler_download(session_id):
+    """Download the merged collapsed stacks of a session"""
+    from app.core.sampling_profiler import merge_profile
+    data = merge_profile(current_app.config['PROFILE_FOLDER'], session_id)
+    if data is None:
+        flash('Profile not found', 'error')
+        return redirect(url_for('core_auth.profiler'))
+    from io import BytesIO
+    return send_file(BytesIO(data.encode('utf-8')), as_attachment=True,
+                     download_name=f'profile-{session_id}.collapsed', mimetype='text/plain')
+
 @bp.route('/settings/email-restriction', methods=['GET'])
 @login_required
 def get_email_restriction_settings():
     """Get email domain restriction settings"""
-    settings_dict = {}
-    for setting in models.Setting.query.filter(models.Setting.key.in_(['email_domain_restriction_enabled', 'email_domain_restriction'])).all():
-        settings_dict[setting.key] = setting.value
+    settings_dict = get_settings(['email_domain_restriction_enabled', 'email_domain_restriction'])
     
     return jsonify({
         'enabled': settings_dict.get('email_domain_restriction_enabled', 'false') == 'true',
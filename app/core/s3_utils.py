@@ -1,44 +1,71 @@
 """
 S3 utility functions for handling file uploads, downloads, and deletions.
+
+The storage work itself is done by the backends in app.core.storage; these
+helpers keep the S3 settings handling and the upload/delete/exists calls the
+routes use.
+
+The boto3 client is built once per process and settings version and shared
+by all threads (boto3 clients are thread-safe), so requests reuse its pooled
+connections instead of paying for client construction and a new TLS
+handshake on every call.
 """
-import os
+import threading
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
 from botocore.exceptions import ClientError, NoCredentialsError
 from flask import current_app
-from app.core.models import Setting
+from app.core.settings_cache import get_setting, get_setting_bool, get_settings, get_settings_version
+
+MB = 1024 * 1024
+
+_client_lock = threading.Lock()
+_client_cache = {'version': None, 'result': None}
 
 
 def is_s3_enabled():
     """Check if S3 storage is enabled in settings."""
-    setting = Setting.query.filter_by(key='s3_enabled').first()
-    return setting and setting.value == 'true'
+    return get_setting_bool('s3_enabled')
 
 
-def get_s3_client():
-    """Get configured S3 client."""
-    if not is_s3_enabled():
-        return None
-    
-    # Get S3 settings
-    settings = {}
-    for key in ['s3_access_key', 's3_secret_key', 's3_region', 's3_bucket']:
-        setting = Setting.query.filter_by(key=key).first()
-        if setting:
-            settings[key] = setting.value
-        else:
-            return None
-    
-    # Check if all required settings are present
+def get_transfer_config():
+    """TransferConfig for uploads and downloads, from the S3_MULTIPART_* and S3_TRANSFER_CONCURRENCY settings"""
+    config = current_app.config
+    return TransferConfig(
+        multipart_threshold=config.get('S3_MULTIPART_THRESHOLD_MB', 16) * MB,
+        multipart_chunksize=config.get('S3_MULTIPART_CHUNKSIZE_MB', 16) * MB,
+        max_concurrency=config.get('S3_TRANSFER_CONCURRENCY', 10),
+        use_threads=True
+    )
+
+
+def _build_s3_client():
+    # Get S3 settings and check that all required settings are present
     required_keys = ['s3_access_key', 's3_secret_key', 's3_region', 's3_bucket']
-    if not all(settings.get(key) for key in required_keys):
+    settings = get_settings(required_keys)
+    if len(settings) != len(required_keys):
         return None
     
+    # Every transfer thread holds a connection, so the pool is never smaller than the transfer concurrency
+    pool_size = max(current_app.config.get('S3_MAX_POOL_CONNECTIONS', 20),
+                    current_app.config.get('S3_TRANSFER_CONCURRENCY', 10))
     try:
-        client = boto3.client(
+        # boto3.client() shares the default session, which is not safe to use from several threads
+        session = boto3.session.Session()
+        client = session.client(
             's3',
             aws_access_key_id=settings['s3_access_key'],
             aws_secret_access_key=settings['s3_secret_key'],
-            region_name=settings['s3_region']
+            region_name=settings['s3_region'],
+            # S3-compatible object stores (MinIO, moto_server) are reached through an explicit endpoint
+            endpoint_url=get_setting('s3_endpoint_url'),
+            config=BotoConfig(
+                max_pool_connections=pool_size,
+                signature_version='s3v4',  # Presigned uploads and downloads need SigV4 in most regions
+                retries={'max_attempts': 3, 'mode': 'standard'},
+                tcp_keepalive=True
+            )
         )
         return client, settings['s3_bucket']
     except Exception as e:
@@ -46,6 +73,29 @@ def get_s3_client():
         return None
 
 
+def get_s3_client():
+    """
+    Get the configured S3 client and bucket, built once per settings version and shared by all threads.
+    
+    The client is available whenever the credentials and bucket are set, even with S3 storage switched
+    off: files uploaded while it was on are still downloaded and deleted through it. Whether new uploads
+    go to S3 is decided by is_s3_enabled().
+    """
+    version = get_settings_version()
+    with _client_lock:
+        if _client_cache['version'] != version or _client_cache['result'] is None:
+            _client_cache['result'] = _build_s3_client()
+            _client_cache['version'] = version
+        return _client_cache['result']
+
+
+def reset_s3_client():
+    """Drop the cached client so the next call builds a new one"""
+    with _client_lock:
+        _client_cache['version'] = None
+        _client_cache['result'] = None
+
+
 def upload_file_to_s3(file_obj, s3_key, content_type=None):
     """
     Upload a file to S3.
@@ -58,45 +108,15 @@ def upload_file_to_s3(file_obj, s3_key, content_type=None):
     Returns:
         S3 URL if successful, None otherwise
     """
-    result = get_s3_client()
-    if not result:
+    from app.core.storage import get_backend
+    backend = get_backend('s3')
+    if not backend:
         return None
     
-    client, bucket = result
-    
     try:
         # Reset file pointer to beginning
         file_obj.seek(0)
-        
-        # Upload file
-        extra_args = {}
-        if content_type:
-            extra_args['ContentType'] = content_type
-        
-        client.upload_fileobj(
-            file_obj,
-            bucket,
-            s3_key,
-            ExtraArgs=extra_args
-        )
-        
-        # Generate URL
-        setting = Setting.query.filter_by(key='s3_region').first()
-        region = setting.value if setting else 'us-east-1'
-        
-        # If custom domain is configured, use it
-        custom_domain_setting = Setting.query.filter_by(key='s3_custom_domain').first()
-        if custom_domain_setting and custom_domain_setting.value:
-            domain = custom_domain_setting.value.rstrip('/')
-            url = f"{domain}/{s3_key}"
-        else:
-            # Use standard S3 URL
-            # URL encode the key for proper handling of special characters
-            from urllib.parse import quote
-            encoded_key = quote(s3_key, safe='/')
-            url = f"https://{bucket}.s3.{region}.amazonaws.com/{encoded_key}"
-        
-        return url
+        return backend.put(s3_key, file_obj, content_type)
     except ClientError as e:
         current_app.logger.error(f"Error uploading to S3: {str(e)}")
         return None
@@ -115,15 +135,13 @@ def delete_file_from_s3(s3_key):
     Returns:
         True if successful, False otherwise
     """
-    result = get_s3_client()
-    if not result:
+    from app.core.storage import get_backend
+    backend = get_backend('s3')
+    if not backend:
         return False
     
-    client, bucket = result
-    
     try:
-        client.delete_object(Bucket=bucket, Key=s3_key)
-        return True
+        return backend.delete(s3_key)
     except ClientError as e:
         current_app.logger.error(f"Error deleting from S3: {str(e)}")
         return False
@@ -142,26 +160,18 @@ def get_s3_key_from_url(url):
     Returns:
         S3 key if it's an S3 URL, None otherwise
     """
-    if not url:
-        return None
-    
-    # Check if it's an S3 URL (starts with http/https)
-    if url.startswith('http://') or url.startswith('https://'):
-        # Extract key from URL
-        # Format: https://bucket.s3.region.amazonaws.com/key
-        # or: https://custom-domain.com/key
-        from urllib.parse import urlparse, unquote
-        parsed = urlparse(url)
-        # Get path and remove leading slash, then URL decode
-        key = unquote(parsed.path.lstrip('/'))
-        return key if key else None
-    
-    return None
+    from app.core.storage import get_storage_for_url
+    backend, key = get_storage_for_url(url)
+    return key if backend and backend.name == 's3' else None
 
 
 def upload_file(file_obj, filename, folder='uploads', content_type=None):
     """
-    Upload a file to either S3 or local storage based on settings.
+    Upload a file to the storage backend selected in settings.
+    
+    The file is streamed in bounded chunks. Pass a HashingReader as file_obj to
+    get its size and SHA-256 from the same pass; an upload over the reader's
+    max_size raises UploadTooLargeError.
     
     Args:
         file_obj: File-like object to upload
@@ -172,61 +182,47 @@ def upload_file(file_obj, filename, folder='uploads', content_type=None):
     Returns:
         URL to access the file, or None if upload failed
     """
-    if is_s3_enabled():
-        # Upload to S3
-        s3_key = f"{folder}/{filename}"
-        url = upload_file_to_s3(file_obj, s3_key, content_type)
-        if url:
-            return url
-        # Fall back to local if S3 upload fails
-        current_app.logger.warning("S3 upload failed, falling back to local storage")
-    
-    # Upload to local storage
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    if folder != 'uploads':
-        upload_folder = os.path.join(upload_folder, folder)
-    os.makedirs(upload_folder, exist_ok=True)
-    
-    filepath = os.path.join(upload_folder, filename)
-    file_obj.seek(0)
-    
-    # Save file to disk
-    with open(filepath, 'wb') as f:
-        f.write(file_obj.read())
+    from app.core.storage import get_storage, get_backend, UploadTooLargeError
+    storage = get_storage()
     
-    # Return local URL
-    from flask import url_for
-    if folder == 'uploads':
-        return url_for('static', filename=f'uploads/{filename}')
-    else:
-        return url_for('static', filename=f'uploads/{folder}/{filename}')
+    if storage.name != 'local':
+        try:
+            file_obj.seek(0)
+            return storage.put(f"{folder}/{filename}", file_obj, content_type)
+        except UploadTooLargeError:
+            raise
+        except Exception as e:
+            current_app.logger.error(f"Error uploading to {storage.name} storage: {str(e)}")
+        # Fall back to local if the upload fails
+        current_app.logger.warning(f"{storage.name} upload failed, falling back to local storage")
+        storage = get_backend('local')
+    
+    # Loose uploads sit at the top of the local upload folder
+    key = filename if folder == 'uploads' else f"{folder}/{filename}"
+    file_obj.seek(0)
+    return storage.put(key, file_obj, content_type)
 
 
 def delete_file(file_path_or_url):
     """
-    Delete a file from either S3 or local storage.
+    Delete a file from whichever storage backend holds it.
     
     Args:
-        file_path_or_url: Local file path or S3 URL
+        file_path_or_url: Stored file URL (local, S3 or memory)
     
     Returns:
         True if successful, False otherwise
     """
-    if is_s3_enabled():
-        # Check if it's an S3 URL
-        s3_key = get_s3_key_from_url(file_path_or_url)
-        if s3_key:
-            return delete_file_from_s3(s3_key)
-    
-    # Delete from local storage
-    if os.path.exists(file_path_or_url):
-        try:
-            os.remove(file_path_or_url)
-            return True
-        except OSError:
-            return False
+    from app.core.storage import get_storage_for_url
+    backend, key = get_storage_for_url(file_path_or_url)
+    if not backend:
+        return False
     
-    return False
+    try:
+        return backend.delete(key)
+    except Exception as e:
+        current_app.logger.error(f"Error deleting {file_path_or_url} from {backend.name} storage: {str(e)}")
+        return False
 
 
 def get_file_url(file_path_or_url):
@@ -260,6 +256,34 @@ def get_file_url(file_path_or_url):
     return file_path_or_url
 
 
+def get_local_path(file_path_or_url):
+    """
+    Get the filesystem path of a locally stored file.
+    
+    Args:
+        file_path_or_url: Stored /static/uploads/... URL, or the filesystem path older rows hold
+    
+    Returns:
+        Filesystem path, or None for files that are not in the local upload folder
+    """
+    from app.core.storage import get_storage_for_url
+    backend, key = get_storage_for_url(file_path_or_url)
+    return backend.local_path(key) if backend else None
+
+
+def presigned_downloads_enabled():
+    """Check if S3 downloads should redirect to presigned URLs instead of streaming."""
+    return get_setting_bool('s3_presigned_downloads')
+
+
+def direct_uploads_enabled():
+    """Check if browsers should upload straight to S3 through presigned requests."""
+    if not get_setting_bool('s3_direct_uploads'):
+        return False
+    from app.core.storage import get_storage
+    return get_storage().name == 's3'
+
+
 def download_file_from_s3(s3_key):
     """
     Download a file from S3 and return its contents.
@@ -270,15 +294,19 @@ def download_file_from_s3(s3_key):
     Returns:
         File contents as bytes, or None if failed
     """
-    result = get_s3_client()
-    if not result:
+    from app.core.storage import get_backend
+    backend = get_backend('s3')
+    if not backend:
         return None
     
-    client, bucket = result
-    
     try:
-        response = client.get_object(Bucket=bucket, Key=s3_key)
-        return response['Body'].read()
+        stored = backend.open(s3_key)
+        if stored is None:
+            return None
+        try:
+            return b''.join(stored.body)
+        finally:
+            stored.close()
     except ClientError as e:
         current_app.logger.error(f"Error downloading from S3: {str(e)}")
         return None
@@ -296,18 +324,22 @@ def is_s3_url(url_or_path):
 
 def file_exists(file_path_or_url):
     """
-    Check if a file exists, whether it's in S3 or local storage.
+    Check if a file exists in whichever storage backend holds it.
     
     Args:
-        file_path_or_url: Local file path or S3 URL
+        file_path_or_url: Stored file URL (local, S3 or memory)
     
     Returns:
         True if file exists, False otherwise
     """
-    if is_s3_url(file_path_or_url):
+    from app.core.storage import get_storage_for_url
+    backend, key = get_storage_for_url(file_path_or_url)
+    if not backend:
+        return False
+    
+    if backend.name == 's3':
         # For S3 URLs, we assume they exist if the URL is valid
         # (we could verify by checking S3, but that's expensive)
         return True
     
-    # Check local file
-    return os.path.exists(file_path_or_url)
+    return backend.exists(key)
@@ -0,0 +1,231 @@
+"""
+On-demand sampling profiler for live workers.
+
+A global admin starts a profiling session from /admin/profiler. The session
+is stored in the profiler_session setting, so every gunicorn worker picks it
+up through the settings cache on its next request. While a session is active,
+a background thread in each worker samples Python stacks with
+sys._current_frames() and counts identical stacks. When the session ends the
+counts are written in collapsed-stack format, one file per worker:
+
+    PROFILE_FOLDER/<session id>/<host>-<pid>.collapsed
+
+Collapsed stacks load directly into speedscope or flamegraph.pl; the download
+route merges the files of all workers on this node.
+
+Sessions either run for a number of seconds (sampling every thread), or until
+a worker has served the next N requests to one endpoint (sampling only the
+threads serving those requests). When no session is active the only cost is
+one cached settings lookup per request.
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+from datetime import datetime
+from functools import lru_cache
+from flask import g, request, current_app
+
+logger = logging.getLogger(__name__)
+
+SETTING_KEY = 'profiler_session'
+MAX_DURATION = 600
+SESSION_ID_RE = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9a-f]{6}$')
+
+_lock = threading.Lock()
+_sampler = None
+_started_sessions = set()
+
+
+def new_session(mode, seconds, endpoint=None, requests=None, interval_ms=10):
+    """Build the settings value for a new profiling session"""
+    session_id = f"{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    return json.dumps({
+        'id': session_id,
+        'mode': mode,
+        'until': time.time() + min(max(int(seconds), 1), MAX_DURATION),
+        'endpoint': endpoint,
+        'requests': requests,
+        'interval_ms': max(int(interval_ms), 1)
+    })
+
+
+@lru_cache(maxsize=4)
+def parse_session(raw):
+    """Decode a profiler_session setting value, or None if it is invalid"""
+    try:
+        session = json.loads(raw)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(session, dict) or not SESSION_ID_RE.match(str(session.get('id', ''))):
+        return None
+    return session
+
+
+def _frame_label(code):
+    filename = code.co_filename
+    short = '/'.join(filename.replace('\\', '/').split('/')[-2:])
+    return f"{code.co_name} ({short}:{code.co_firstlineno})".replace(';', ':')
+
+
+class Sampler(threading.Thread):
+    """Background thread counting the stacks of the sampled threads"""
+
+    def __init__(self, session, folder):
+        super().__init__(name=f"profiler-{session['id']}", daemon=True)
+        self.session = session
+        self.folder = folder
+        self.interval = session['interval_ms'] / 1000.0
+        self.deadline = session['until']
+        self.counts = {}
+        self.samples = 0
+        self.stop_event = threading.Event()
+        # In request mode only registered thread ids are sampled
+        self.request_mode = session['mode'] == 'requests'
+        self.threads = set()
+        self.requests_started = 0
+        self.requests_done = 0
+        self.thread_names = {}
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        while not self.stop_event.is_set() and time.time() < self.deadline:
+            if not self.request_mode or self.threads:
+                self._sample()
+            self.stop_event.wait(self.interval)
+        self._write()
+
+    def _sample(self):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.ident or (self.request_mode and thread_id not in self.threads):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if thread_id not in self.thread_names:
+                self.thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stack.append(self.thread_names.get(thread_id, str(thread_id)))
+            key = ';'.join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+        self.samples += 1
+
+    def _write(self):
+        global _sampler
+        with _lock:
+            if _sampler is self:
+                _sampler = None
+        if not self.counts:
+            return
+        try:
+            folder = os.path.join(self.folder, self.session['id'])
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, f"{socket.gethostname()}-{os.getpid()}.collapsed")
+            with open(path, 'w') as f:
+                for stack, count in sorted(self.counts.items()):
+                    f.write(f"{stack} {count}\n")
+            logger.info(f"Profiler session {self.session['id']} wrote {self.samples} samples to {path}")
+        except Exception as e:
+            logger.error(f"Error writing profile: {str(e)}")
+
+
+def _sync_session():
+    """Start or stop this worker's sampler to match the profiler_session setting"""
+    global _sampler
+    from app.core.settings_cache import get_setting
+    raw = get_setting(SETTING_KEY)
+    session = parse_session(raw) if raw else None
+
+    with _lock:
+        if _sampler is not None and (session is None or session['id'] != _sampler.session['id']):
+            _sampler.stop()
+            _sampler = None
+
+        if session is None or session['id'] in _started_sessions or time.time() >= session['until']:
+            return _sampler
+
+        _started_sessions.add(session['id'])
+        _sampler = Sampler(session, current_app.config['PROFILE_FOLDER'])
+        _sampler.start()
+        return _sampler
+
+
+def profiler_before_request():
+    """before_request hook: follow the active session and register sampled requests"""
+    sampler = _sync_session()
+    if sampler is None or not sampler.request_mode:
+        return None
+    if request.endpoint != sampler.session.get('endpoint'):
+        return None
+
+    with _lock:
+        if sampler.requests_started >= (sampler.session.get('requests') or 0):
+            return None
+        sampler.requests_started += 1
+        sampler.threads.add(threading.get_ident())
+    g.profiler_sampler = sampler
+    return None
+
+
+def profiler_teardown_request(exception=None):
+    """teardown_request hook: stop sampling the request and end the session after N requests"""
+    sampler = g.pop('profiler_sampler', None)
+    if sampler is None:
+        return
+    with _lock:
+        sampler.threads.discard(threading.get_ident())
+        sampler.requests_done += 1
+        finished = sampler.requests_done >= (sampler.session.get('requests') or 0)
+    if finished:
+        sampler.stop()
+
+
+def list_profiles(folder):
+    """Sessions with output on this node, newest first"""
+    if not os.path.isdir(folder):
+        return []
+    profiles = []
+    for session_id in os.listdir(folder):
+        path = os.path.join(folder, session_id)
+        if not SESSION_ID_RE.match(session_id) or not os.path.isdir(path):
+            continue
+        files = [name for name in os.listdir(path) if name.endswith('.collapsed')]
+        profiles.append({
+            'id': session_id,
+            'workers': len(files),
+            'size': sum(os.path.getsize(os.path.join(path, name)) for name in files)
+        })
+    return sorted(profiles, key=lambda p: p['id'], reverse=True)
+
+
+def merge_profile(folder, session_id):
+    """Merge the per-worker collapsed files of a session into one collapsed-stack text"""
+    if not SESSION_ID_RE.match(session_id):
+        return None
+    path = os.path.join(folder, session_id)
+    if not os.path.isdir(path):
+        return None
+
+    counts = {}
+    for name in sorted(os.listdir(path)):
+        if not name.endswith('.collapsed'):
+            continue
+        with open(os.path.join(path, name)) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    counts[stack] = counts.get(stack, 0) + int(count)
+    return ''.join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+
+
+def init_sampling_profiler(app):
+    """Register the request hooks that let an admin-started session reach this worker"""
+    app.before_request(profiler_before_request)
+    app.teardown_request(profiler_teardown_request)
@@ -0,0 +1,158 @@
+"""
+Cached access to the key/value Setting table.
+
+All settings are loaded in one query and kept in process memory. Every write
+goes through save_settings() or invalidate_settings(), which store a new
+random token in the settings_version row in the same transaction. Each worker
+re-reads that single row at most every SETTINGS_CACHE_TTL seconds and reloads
+the whole table only when the token has changed, so in steady state requests
+make no settings queries at all, and writes on one worker or node reach every
+other worker within the TTL.
+"""
+import time
+import uuid
+import logging
+import threading
+from flask import current_app, has_app_context
+from app import db_session
+from app.core import models
+from app.core.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'settings_version'
+DEFAULT_TTL = 5
+
+_lock = threading.Lock()
+_values = {}
+_version = None
+_loaded = False
+_checked_at = 0.0
+
+
+def _ttl():
+    if has_app_context():
+        return current_app.config.get('SETTINGS_CACHE_TTL', DEFAULT_TTL)
+    return DEFAULT_TTL
+
+
+def _refresh():
+    """Reload the cache if the TTL has passed and the version stamp changed"""
+    global _values, _version, _loaded, _checked_at
+
+    now = time.monotonic()
+    if _loaded and now - _checked_at < _ttl():
+        record_cache('settings', 'hit')
+        return
+
+    with _lock:
+        if _loaded and now - _checked_at < _ttl():
+            record_cache('settings', 'hit')
+            return
+        version = db_session.query(models.Setting.value).filter(models.Setting.key == VERSION_KEY).scalar()
+        if not _loaded or version != _version:
+            _values = {setting.key: setting.value for setting in db_session.query(models.Setting.key, models.Setting.value)}
+            _version = version
+            _loaded = True
+            record_cache('settings', 'miss')
+        else:
+            record_cache('settings', 'revalidated')
+        _checked_at = time.monotonic()
+
+
+def reset_settings_cache():
+    """Drop this worker's cache so the next read reloads from the database"""
+    global _loaded
+    with _lock:
+        _loaded = False
+
+
+def get_setting(key, default=None):
+    """Return a setting value, or default if it is missing or empty"""
+    _refresh()
+    value = _values.get(key)
+    return value if value not in (None, '') else default
+
+
+def get_setting_bool(key, default=False):
+    """Return a 'true'/'false' setting as a bool"""
+    value = get_setting(key)
+    if value is None:
+        return default
+    return value.strip().lower() == 'true'
+
+
+def get_setting_int(key, default=None):
+    """Return a setting as an int, or default if it is missing or not a number"""
+    value = get_setting(key)
+    try:
+        return int(value) if value is not None else default
+    except ValueError:
+        return default
+
+
+def get_settings(keys):
+    """Return {key: value} for the keys that have a non-empty value"""
+    _refresh()
+    return {key: _values[key] for key in keys if _values.get(key) not in (None, '')}
+
+
+def get_settings_version():
+    """Return the current settings version token, for caching things derived from settings"""
+    _refresh()
+    return _version
+
+
+def get_all_settings():
+    """Return a copy of every setting except the internal version stamp"""
+    _refresh()
+    return {key: value for key, value in _values.items() if key != VERSION_KEY}
+
+
+def get_branding():
+    """Return (brand_name, brand_logo) for page templates"""
+    return get_setting('brand_name', 'InfoGarden'), get_setting('brand_logo')
+
+
+def _stamp_version():
+    """Write a new version stamp into the current transaction"""
+    token = uuid.uuid4().hex
+    setting = models.Setting.query.filter_by(key=VERSION_KEY).first()
+    if setting:
+        setting.value = token
+    else:
+        db_session.add(models.Setting(key=VERSION_KEY, value=token, description='Changes whenever settings are saved'))
+
+
+def save_settings(values, keep_if_empty=()):
+    """
+    Insert or update settings and commit them together with a new version stamp.
+
+    Args:
+        values: Dictionary of key -> value
+        keep_if_empty: Keys (e.g. secrets) whose stored value is kept when the new value is empty
+    """
+    existing = {setting.key: setting for setting in models.Setting.query.filter(models.Setting.key.in_(list(values))).all()}
+    for key, value in values.items():
+        if key in keep_if_empty and not value:
+            continue
+        setting = existing.get(key)
+        if setting:
+            setting.value = value
+        else:
+            db_session.add(models.Setting(key=key, value=value))
+
+    _stamp_version()
+    db_session.commit()
+    reset_settings_cache()
+
+
+def invalidate_settings():
+    """Force every worker to reload settings, e.g. after restoring a backup"""
+    try:
+        _stamp_version()
+        db_session.commit()
+    except Exception as e:
+        db_session.rollback()
+        logger.error(f"Error updating settings version: {str(e)}")
+    reset_settings_cache()
@@ -6,8 +6,7 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.utils import formataddr
 from typing import Optional, Dict, Tuple
-from app.core import models
-from app import db_session
+from app.core.settings_cache import get_settings
 
 
 def get_smtp_settings() -> Optional[Dict[str, str]]:
@@ -27,13 +26,9 @@ def get_smtp_settings() -> Optional[Dict[str, str]]:
         'smtp_from_name'
     ]
     
-    settings = {}
-    for key in settings_keys:
-        setting = models.Setting.query.filter_by(key=key).first()
-        if setting and setting.value:
-            settings[key] = setting.value
-        else:
-            return None  # If any required setting is missing, return None
+    settings = get_settings(settings_keys)
+    if len(settings) != len(settings_keys):
+        return None  # If any required setting is missing, return None
     
     return settings
 
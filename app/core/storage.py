@@ -0,0 +1,802 @@
+"""
+Storage backends for uploaded files.
+
+Uploads are addressed by a key such as "documents/<name>". put() stores an
+object and returns the URL kept in the database; key_from_url() maps such a
+URL back to its key. Three backends implement the same streaming interface:
+
+    LocalBackend   files under UPLOAD_FOLDER, URLs /static/uploads/<key>
+    S3Backend      objects in the configured bucket; an endpoint URL points
+                   it at an S3-compatible store (MinIO, moto_server) instead
+    MemoryBackend  objects in process memory, URLs memory://<key>, for tests
+                   and benchmarks
+
+Large uploads can also be sent in chunks: start_upload(), write_part() for
+each part and finish_upload(), which map to S3 multipart uploads and to a
+partial file for local storage.
+
+list_objects() pages through a backend's objects in key order, for the
+orphaned file collector.
+
+Local writes are copied in bounded chunks through one reused buffer. Wrapping
+an upload in a HashingReader measures and hashes it while it is stored, so
+callers need no separate pass to learn its size or digest.
+
+get_storage() returns the backend new uploads go to, chosen once per
+settings version from STORAGE_BACKEND or the S3 settings. Existing objects
+are read through get_storage_for_url(), because rows uploaded before S3 was
+switched on (or off) keep pointing at where they were written.
+"""
+import io
+import os
+import re
+import time
+import base64
+import shutil
+import heapq
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime, timezone
+from urllib.parse import quote, unquote, urlparse
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class StoredObject:
+    """Metadata of a stored object; body is a chunk iterator when it was opened"""
+
+    def __init__(self, size, content_type=None, etag=None, last_modified=None, body=None, start=0, end=None, close=None):
+        self.size = size
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body = body
+        self.start = start
+        self.end = size - 1 if end is None else end
+        self._close = close
+
+    @property
+    def content_length(self):
+        return self.end - self.start + 1
+
+    @property
+    def content_range(self):
+        return f"bytes {self.start}-{self.end}/{self.size}"
+
+    def close(self):
+        if self._close:
+            self._close()
+
+
+class StorageBackend:
+    """Interface shared by the storage backends"""
+
+    name = None
+
+    def put(self, key, file_obj, content_type=None):
+        """Store file_obj (read in chunks) under key and return its URL"""
+        raise NotImplementedError
+
+    def open(self, key, start=None, end=None):
+        """Return a StoredObject streaming the object, or bytes start..end inclusive; None if missing"""
+        raise NotImplementedError
+
+    def head(self, key):
+        """Return a StoredObject without body, or None if missing"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Delete an object; True if it was deleted"""
+        raise NotImplementedError
+
+    def exists(self, key):
+        return self.head(key) is not None
+
+    def list_objects(self, start_after=None, limit=1000, prefix=''):
+        """
+        Up to limit (key, StoredObject without body) pairs in key order,
+        starting after key start_after; with a prefix (a folder, ending in /)
+        only the keys in it
+        """
+        raise NotImplementedError
+
+    def url_for(self, key):
+        """URL stored in the database for key"""
+        raise NotImplementedError
+
+    def key_from_url(self, url):
+        """Key of a URL written by this backend, or None"""
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """Filesystem path of an object, for backends that have one"""
+        return None
+
+    def presigned_url(self, key, download_name, mimetype=None, as_attachment=True, expires_in=300):
+        """Short-lived direct download URL, for backends that support it"""
+        return None
+
+    def presigned_upload(self, key, content_type, checksum=None, expires_in=900):
+        """{'method', 'url', 'headers'} for a browser to upload key directly, for backends that support it"""
+        return None
+
+    # Chunked uploads: parts of part_size bytes (the last may be shorter) are written in any order and
+    # rewritten on retry, then finish_upload() publishes the object under key.
+
+    def start_upload(self, key, content_type=None):
+        """Begin a chunked upload of key and return its upload id"""
+        raise NotImplementedError
+
+    def write_part(self, key, upload_id, part_number, offset, data, checksum=None):
+        """Store part part_number (1-based), which starts at byte offset; checksum is its base64 SHA-256"""
+        raise NotImplementedError
+
+    def finish_upload(self, key, upload_id):
+        """Assemble the written parts into the object and return its URL"""
+        raise NotImplementedError
+
+    def abort_upload(self, key, upload_id):
+        """Discard a chunked upload and its parts"""
+        raise NotImplementedError
+
+
+def _iter_file(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def copy_stream(src, dst, buffer_size=CHUNK_SIZE):
+    """
+    Copy src to dst in buffer_size chunks through one reused buffer and return
+    the number of bytes copied, so memory use stays flat whatever the size.
+    """
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    readinto = getattr(src, 'readinto', None)
+    copied = 0
+    while True:
+        if readinto:
+            n = readinto(buffer)
+            if not n:
+                break
+            dst.write(view[:n])
+        else:
+            chunk = src.read(buffer_size)
+            if not chunk:
+                break
+            n = len(chunk)
+            dst.write(chunk)
+        copied += n
+    return copied
+
+
+class ChecksumMismatchError(Exception):
+    """Raised when a stored object does not match what was uploaded"""
+
+
+class UploadTooLargeError(Exception):
+    """Raised while storing an upload that turns out larger than its size limit"""
+
+    def __init__(self, max_size):
+        super().__init__(f"Upload exceeds the {max_size} byte limit")
+        self.max_size = max_size
+
+
+class HashingReader:
+    """
+    Wraps a seekable upload stream and counts and hashes it with SHA-256 as the
+    storage backend reads it, so an upload's size and digest come out of the
+    pass that stores it: the whole stream, and each part_size part of an S3
+    multipart upload. Re-reads of bytes already hashed (retries, checksum
+    passes, a fallback to local storage) are skipped; if a reader ever skips
+    ahead, complete is False and no checksum is reported. Reading past
+    max_size raises UploadTooLargeError.
+    """
+
+    def __init__(self, fileobj, part_size=None, max_size=None):
+        self._fileobj = fileobj
+        self._start = fileobj.tell()
+        self.part_size = part_size
+        self.max_size = max_size
+        self._whole = hashlib.sha256()
+        self._part = hashlib.sha256()
+        self._part_filled = 0
+        self._part_digests = []
+        self.hashed = 0
+        self.complete = True
+
+    @property
+    def size(self):
+        """Bytes read so far; the upload's size once it has been stored"""
+        return self.hashed
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=0):
+        return self._fileobj.seek(offset, whence)
+
+    def tell(self):
+        return self._fileobj.tell()
+
+    def close(self):
+        # The caller owns the stream; the transfer closing it would break a fallback to local storage
+        pass
+
+    def read(self, size=-1):
+        position = self._fileobj.tell() - self._start
+        data = self._fileobj.read(size)
+        self._track(position, memoryview(data))
+        return data
+
+    def readinto(self, buffer):
+        position = self._fileobj.tell() - self._start
+        readinto = getattr(self._fileobj, 'readinto', None)
+        if readinto:
+            n = readinto(buffer)
+        else:
+            data = self._fileobj.read(len(buffer))
+            n = len(data)
+            buffer[:n] = data
+        self._track(position, memoryview(buffer)[:n])
+        return n
+
+    def _track(self, position, view):
+        if position > self.hashed:
+            self.complete = False
+        elif position + len(view) > self.hashed:
+            self._update(view[self.hashed - position:])
+
+    def _update(self, view):
+        self._whole.update(view)
+        self.hashed += len(view)
+        if self.max_size is not None and self.hashed > self.max_size:
+            raise UploadTooLargeError(self.max_size)
+        if not self.part_size:
+            return
+        while view:
+            take = min(self.part_size - self._part_filled, len(view))
+            self._part.update(view[:take])
+            self._part_filled += take
+            view = view[take:]
+            if self._part_filled == self.part_size:
+                self._part_digests.append(self._part.digest())
+                self._part = hashlib.sha256()
+                self._part_filled = 0
+
+    def hexdigest(self):
+        """Hex SHA-256 of the whole stream, or None if it was not read in one pass"""
+        return self._whole.hexdigest() if self.complete else None
+
+    def checksum(self):
+        """Base64 SHA-256 in the form S3 reports it: of the object, or of the part digests plus "-<parts>" for multipart"""
+        if not self.complete:
+            return None
+        if not self.part_size:
+            return base64.b64encode(self._whole.digest()).decode()
+        digests = self._part_digests + ([self._part.digest()] if self._part_filled else [])
+        return f"{base64.b64encode(hashlib.sha256(b''.join(digests)).digest()).decode()}-{len(digests)}"
+
+
+class LocalBackend(StorageBackend):
+    """Files under the local upload folder"""
+
+    name = 'local'
+
+    def __init__(self, root, url_prefix='/static/uploads', partial_root=None):
+        self.root = os.path.abspath(root)
+        self.url_prefix = url_prefix.rstrip('/')
+        # Unfinished chunked uploads are kept outside the served folder
+        self.partial_root = os.path.abspath(partial_root or os.path.join(os.path.dirname(self.root), '.upload_parts'))
+
+    def partial_path(self, upload_id):
+        if not upload_id.isalnum():
+            raise ValueError(f"Invalid upload id: {upload_id}")
+        return os.path.join(self.partial_root, f"{upload_id}.part")
+
+    def local_path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Storage key outside the upload folder: {key}")
+        return path
+
+    def put(self, key, file_obj, content_type=None):
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial upload
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                copy_stream(file_obj, f)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self.url_for(key)
+
+    def head(self, key):
+        try:
+            stat = os.stat(self.local_path(key))
+        except (OSError, ValueError):
+            return None
+        return self._stored_object(stat)
+
+    @staticmethod
+    def _stored_object(stat):
+        return StoredObject(
+            size=stat.st_size,
+            etag=f"{stat.st_mtime_ns:x}-{stat.st_size:x}",
+            last_modified=datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+        )
+
+    def open(self, key, start=None, end=None):
+        info = self.head(key)
+        if info is None:
+            return None
+        start = start or 0
+        end = info.size - 1 if end is None else min(end, info.size - 1)
+        info.start, info.end = start, end
+        info.body = _iter_file(self.local_path(key), start, end - start + 1)
+        return info
+
+    def delete(self, key):
+        try:
+            os.remove(self.local_path(key))
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def _walk_files(self, folder, prefix, start_after):
+        """(key, directory entry) of the files under folder in key order; a subfolder sorts as "name/" like on S3"""
+        entries = []
+        try:
+            for entry in os.scandir(folder):
+                name = entry.name + '/' if entry.is_dir(follow_symlinks=False) else entry.name
+                key = prefix + name
+                if start_after:
+                    # Skip files up to start_after and folders that sort entirely before it
+                    if name.endswith('/') and key < start_after and not start_after.startswith(key):
+                        continue
+                    if not name.endswith('/') and key <= start_after:
+                        continue
+                entries.append((name, entry))
+        except OSError:
+            return
+        # A heap yields entries in order without sorting a large folder that one page only needs the start of
+        heapq.heapify(entries)
+        while entries:
+            name, entry = heapq.heappop(entries)
+            if name.endswith('/'):
+                yield from self._walk_files(entry.path, prefix + name, start_after)
+            else:
+                yield prefix + name, entry
+
+    def list_objects(self, start_after=None, limit=1000, prefix=''):
+        objects = []
+        folder = os.path.join(self.root, *prefix.split('/')) if prefix else self.root
+        for key, entry in self._walk_files(folder, prefix, start_after):
+            try:
+                objects.append((key, self._stored_object(entry.stat())))
+            except OSError:
+                continue  # Deleted since the folder was read
+            if len(objects) >= limit:
+                break
+        return objects
+
+    def start_upload(self, key, content_type=None):
+        import uuid
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self.partial_root, exist_ok=True)
+        open(self.partial_path(upload_id), 'wb').close()
+        return upload_id
+
+    def write_part(self, key, upload_id, part_number, offset, data, checksum=None):
+        # Writing at the part's offset makes a retried part overwrite itself
+        with open(self.partial_path(upload_id), 'r+b') as f:
+            f.seek(offset)
+            f.write(data)
+
+    def finish_upload(self, key, upload_id):
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A rename when the partial folder is on the same filesystem, a copy otherwise
+        shutil.move(self.partial_path(upload_id), path)
+        return self.url_for(key)
+
+    def abort_upload(self, key, upload_id):
+        try:
+            os.remove(self.partial_path(upload_id))
+        except OSError:
+            pass
+
+    def url_for(self, key):
+        return f"{self.url_prefix}/{key}"
+
+    def key_from_url(self, url):
+        if url.startswith(self.url_prefix + '/'):
+            key = url[len(self.url_prefix) + 1:]
+        elif os.path.isabs(url) and os.path.abspath(url).startswith(self.root + os.sep):
+            # Older rows store the filesystem path
+            key = os.path.relpath(os.path.abspath(url), self.root).replace(os.sep, '/')
+        else:
+            return None
+        try:
+            self.local_path(key)
+        except ValueError:
+            return None
+        return key
+
+
+class S3Backend(StorageBackend):
+    """Objects in an S3 bucket or S3-compatible object store"""
+
+    name = 's3'
+
+    def __init__(self, client, bucket, region='us-east-1', custom_domain=None, endpoint_url=None, transfer_config=None,
+                 verify_checksums=False):
+        from boto3.s3.transfer import TransferConfig
+        self.client = client
+        self.bucket = bucket
+        self.region = region
+        self.custom_domain = custom_domain.rstrip('/') if custom_domain else None
+        self.endpoint_url = endpoint_url.rstrip('/') if endpoint_url else None
+        self.transfer_config = transfer_config or TransferConfig()
+        self.verify_checksums = verify_checksums
+
+    def put(self, key, file_obj, content_type=None):
+        extra_args = {'ContentType': content_type} if content_type else {}
+        if not self.verify_checksums:
+            self.client.upload_fileobj(file_obj, self.bucket, key, ExtraArgs=extra_args, Config=self.transfer_config)
+            return self.url_for(key)
+
+        # Large files go up as parallel multipart uploads; S3 checks every part against the SHA-256
+        # sent with it, and the object checksum it reports afterwards is compared with our own.
+        from s3transfer.utils import ChunksizeAdjuster
+        start = file_obj.tell()
+        file_obj.seek(0, os.SEEK_END)
+        size = file_obj.tell() - start
+        file_obj.seek(start)
+        part_size = None
+        if size >= self.transfer_config.multipart_threshold:
+            part_size = ChunksizeAdjuster().adjust_chunksize(self.transfer_config.multipart_chunksize, size)
+        # A HashingReader from the caller, not read yet, hashes the parts too instead of hashing twice
+        if isinstance(file_obj, HashingReader) and not file_obj.hashed:
+            reader = file_obj
+            reader.part_size = part_size
+        else:
+            reader = HashingReader(file_obj, part_size)
+        if reader.max_size is not None and size > reader.max_size:
+            raise UploadTooLargeError(reader.max_size)
+        extra_args['ChecksumAlgorithm'] = 'SHA256'
+        self.client.upload_fileobj(reader, self.bucket, key, ExtraArgs=extra_args, Config=self.transfer_config)
+        self.verify_upload(key, size, reader.checksum(), read_back=False)
+        return self.url_for(key)
+
+    def verify_upload(self, key, size, checksum=None, read_back=True):
+        """
+        Compare a stored object's size and SHA-256 with what was uploaded; delete it and raise
+        ChecksumMismatchError on a mismatch. When the store reports no checksum, read_back hashes the
+        object itself; otherwise only the size is checked.
+        """
+        from botocore.exceptions import ClientError
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=key, ChecksumMode='ENABLED')
+        except ClientError as e:
+            if e.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 404:
+                raise ChecksumMismatchError(f"Upload of {key} not found in the bucket")
+            raise
+        stored_checksum = response.get('ChecksumSHA256')
+        if not stored_checksum and checksum and read_back and '-' not in checksum:
+            stored = self.open(key)
+            digest = hashlib.sha256()
+            try:
+                for chunk in stored.body:
+                    digest.update(chunk)
+            finally:
+                stored.close()
+            stored_checksum = base64.b64encode(digest.digest()).decode()
+
+        problem = None
+        if response['ContentLength'] != size:
+            problem = f"size {response['ContentLength']} != {size}"
+        elif checksum and stored_checksum and stored_checksum.split('-')[0] != checksum.split('-')[0]:
+            # S3 appends "-<parts>" to multipart checksums; some compatible stores leave it off
+            problem = f"SHA-256 {stored_checksum} != {checksum}"
+        if problem:
+            self.client.delete_object(Bucket=self.bucket, Key=key)
+            raise ChecksumMismatchError(f"Upload of {key} failed verification: {problem}")
+        if not stored_checksum:
+            logger.debug(f"Object store did not report a checksum for {key}; verified size only")
+
+    def head(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 404:
+                return None
+            raise
+        return StoredObject(
+            size=response['ContentLength'],
+            content_type=response.get('ContentType'),
+            etag=response.get('ETag', '').strip('"') or None,
+            last_modified=response.get('LastModified')
+        )
+
+    def open(self, key, start=None, end=None):
+        from botocore.exceptions import ClientError
+        kwargs = {}
+        if start is not None or end is not None:
+            kwargs['Range'] = f"bytes={start or 0}-{'' if end is None else end}"
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key, **kwargs)
+        except ClientError as e:
+            if e.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 404:
+                return None
+            raise
+
+        body = response['Body']
+        size = response['ContentLength']
+        start, end = 0, size - 1
+        if response.get('ContentRange'):
+            # "bytes <start>-<end>/<size>"
+            span, _, total = response['ContentRange'].split(' ', 1)[1].partition('/')
+            start, end = (int(part) for part in span.split('-'))
+            size = int(total)
+        return StoredObject(
+            size=size,
+            content_type=response.get('ContentType'),
+            etag=response.get('ETag', '').strip('"') or None,
+            last_modified=response.get('LastModified'),
+            body=body.iter_chunks(CHUNK_SIZE),
+            start=start,
+            end=end,
+            close=body.close
+        )
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        return True
+
+    def list_objects(self, start_after=None, limit=1000, prefix=''):
+        kwargs = {'StartAfter': start_after} if start_after else {}
+        response = self.client.list_objects_v2(Bucket=self.bucket, MaxKeys=limit, Prefix=prefix, **kwargs)
+        return [(item['Key'], StoredObject(size=item['Size'], etag=item.get('ETag', '').strip('"') or None,
+                                           last_modified=item['LastModified']))
+                for item in response.get('Contents', [])]
+
+    def url_for(self, key):
+        encoded_key = quote(key, safe='/')
+        if self.custom_domain:
+            return f"{self.custom_domain}/{encoded_key}"
+        if self.endpoint_url:
+            return f"{self.endpoint_url}/{self.bucket}/{encoded_key}"
+        return f"https://{self.bucket}.s3.{self.region}.amazonaws.com/{encoded_key}"
+
+    def key_from_url(self, url):
+        """Key of a URL on this bucket: its virtual-host URL (any region), the custom domain or endpoint_url/bucket"""
+        if not url.startswith(('http://', 'https://')):
+            return None
+        for prefix in (self.custom_domain, f"{self.endpoint_url}/{self.bucket}" if self.endpoint_url else None):
+            if prefix and url.startswith(prefix + '/'):
+                return unquote(re.split(r'[?#]', url[len(prefix) + 1:], 1)[0]) or None
+        parsed = urlparse(url)
+        # Bucket names are globally unique, so the host alone identifies the bucket whatever region it names
+        if parsed.scheme == 'https' and re.fullmatch(rf'{re.escape(self.bucket)}\.s3[.-](?:[a-z0-9-]+\.)?amazonaws\.com',
+                                                     parsed.hostname or ''):
+            return unquote(parsed.path.lstrip('/')) or None
+        return None
+
+    def presigned_url(self, key, download_name, mimetype=None, as_attachment=True, expires_in=300):
+        disposition = 'attachment' if as_attachment else 'inline'
+        params = {
+            'Bucket': self.bucket,
+            'Key': key,
+            'ResponseContentDisposition': f"{disposition}; filename*=UTF-8''{quote(download_name)}"
+        }
+        if mimetype:
+            params['ResponseContentType'] = mimetype
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+
+    def start_upload(self, key, content_type=None):
+        extra_args = {'ContentType': content_type} if content_type else {}
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=key, ChecksumAlgorithm='SHA256', **extra_args)
+        return response['UploadId']
+
+    def write_part(self, key, upload_id, part_number, offset, data, checksum=None):
+        kwargs = {'ChecksumSHA256': checksum} if checksum else {'ChecksumAlgorithm': 'SHA256'}
+        self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data, **kwargs)
+
+    def finish_upload(self, key, upload_id):
+        parts = []
+        paginator = self.client.get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=self.bucket, Key=key, UploadId=upload_id):
+            for part in page.get('Parts', []):
+                entry = {'PartNumber': part['PartNumber'], 'ETag': part['ETag']}
+                if part.get('ChecksumSHA256'):
+                    entry['ChecksumSHA256'] = part['ChecksumSHA256']
+                parts.append(entry)
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                              MultipartUpload={'Parts': parts})
+        return self.url_for(key)
+
+    def abort_upload(self, key, upload_id):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+        except ClientError as e:
+            # Already completed or aborted
+            if e.response.get('ResponseMetadata', {}).get('HTTPStatusCode') != 404:
+                raise
+
+    def presigned_upload(self, key, content_type, checksum=None, expires_in=900):
+        # The checksum is part of the signature, so S3 rejects a body that does not match it
+        params = {'Bucket': self.bucket, 'Key': key, 'ContentType': content_type}
+        headers = {'Content-Type': content_type}
+        if checksum:
+            params['ChecksumSHA256'] = checksum
+            headers['x-amz-checksum-sha256'] = checksum
+        url = self.client.generate_presigned_url('put_object', Params=params, ExpiresIn=expires_in, HttpMethod='PUT')
+        return {'method': 'PUT', 'url': url, 'headers': headers}
+
+
+_memory_lock = threading.Lock()
+_memory_objects = {}
+_memory_uploads = {}
+
+
+class MemoryBackend(StorageBackend):
+    """Objects kept in this process's memory (tests and benchmarks only)"""
+
+    name = 'memory'
+
+    def put(self, key, file_obj, content_type=None):
+        data = b''.join(iter(lambda: file_obj.read(CHUNK_SIZE), b''))
+        with _memory_lock:
+            _memory_objects[key] = (data, content_type, hashlib.md5(data).hexdigest(),
+                                    datetime.fromtimestamp(int(time.time()), timezone.utc))
+        return self.url_for(key)
+
+    def head(self, key):
+        with _memory_lock:
+            entry = _memory_objects.get(key)
+        if entry is None:
+            return None
+        data, content_type, etag, last_modified = entry
+        return StoredObject(size=len(data), content_type=content_type, etag=etag, last_modified=last_modified)
+
+    def open(self, key, start=None, end=None):
+        with _memory_lock:
+            entry = _memory_objects.get(key)
+        if entry is None:
+            return None
+        data, content_type, etag, last_modified = entry
+        start = start or 0
+        end = len(data) - 1 if end is None else min(end, len(data) - 1)
+        view = memoryview(data)[start:end + 1]
+        body = (bytes(view[i:i + CHUNK_SIZE]) for i in range(0, len(view), CHUNK_SIZE))
+        return StoredObject(size=len(data), content_type=content_type, etag=etag, last_modified=last_modified,
+                            body=body, start=start, end=end)
+
+    def delete(self, key):
+        with _memory_lock:
+            return _memory_objects.pop(key, None) is not None
+
+    def list_objects(self, start_after=None, limit=1000, prefix=''):
+        with _memory_lock:
+            keys = sorted(key for key in _memory_objects
+                          if key.startswith(prefix) and (not start_after or key > start_after))[:limit]
+        return [(key, info) for key, info in ((key, self.head(key)) for key in keys) if info is not None]
+
+    def start_upload(self, key, content_type=None):
+        import uuid
+        upload_id = uuid.uuid4().hex
+        with _memory_lock:
+            _memory_uploads[upload_id] = (bytearray(), content_type)
+        return upload_id
+
+    def write_part(self, key, upload_id, part_number, offset, data, checksum=None):
+        with _memory_lock:
+            buffer = _memory_uploads[upload_id][0]
+            if len(buffer) < offset:
+                buffer.extend(bytes(offset - len(buffer)))
+            buffer[offset:offset + len(data)] = data
+
+    def finish_upload(self, key, upload_id):
+        with _memory_lock:
+            buffer, content_type = _memory_uploads.pop(upload_id)
+        return self.put(key, io.BytesIO(bytes(buffer)), content_type)
+
+    def abort_upload(self, key, upload_id):
+        with _memory_lock:
+            _memory_uploads.pop(upload_id, None)
+
+    def url_for(self, key):
+        return f"memory://{key}"
+
+    def key_from_url(self, url):
+        if not url.startswith('memory://'):
+            return None
+        return url[len('memory://'):] or None
+
+
+_cache_lock = threading.Lock()
+_cache = {'version': None, 'backends': {}}
+
+
+def _build_backend(name):
+    if name == 'memory':
+        return MemoryBackend()
+    if name == 's3':
+        from app.core.s3_utils import get_s3_client, get_transfer_config
+        from app.core.settings_cache import get_setting
+        result = get_s3_client()
+        if not result:
+            return None
+        client, bucket = result
+        return S3Backend(
+            client,
+            bucket,
+            region=get_setting('s3_region', 'us-east-1'),
+            custom_domain=get_setting('s3_custom_domain'),
+            endpoint_url=get_setting('s3_endpoint_url'),
+            transfer_config=get_transfer_config(),
+            verify_checksums=current_app.config.get('S3_VERIFY_CHECKSUMS', True)
+        )
+    return LocalBackend(current_app.config['UPLOAD_FOLDER'], partial_root=current_app.config.get('UPLOAD_PARTIAL_FOLDER'))
+
+
+def get_backend(name):
+    """
+    Return the named backend ('local', 's3' or 'memory'), built once per settings version; None if S3 is
+    not configured. The S3 backend exists whenever its credentials are set, whether or not S3 is enabled
+    for new uploads, so existing objects can still be read and deleted.
+    """
+    from app.core.settings_cache import get_settings_version
+    version = get_settings_version()
+    with _cache_lock:
+        if _cache['version'] != version:
+            _cache['version'] = version
+            _cache['backends'] = {}
+        if name not in _cache['backends']:
+            _cache['backends'][name] = _build_backend(name)
+        return _cache['backends'][name]
+
+
+def get_storage():
+    """Backend for new uploads: STORAGE_BACKEND if set, else S3 when enabled and configured, else local"""
+    from app.core.s3_utils import is_s3_enabled
+    name = current_app.config.get('STORAGE_BACKEND')
+    if not name:
+        name = 's3' if is_s3_enabled() else 'local'
+    return get_backend(name) or get_backend('local')
+
+
+def get_storage_for_url(url):
+    """Return (backend, key) for a stored file URL, or (None, None) if no configured backend holds it"""
+    if not url:
+        return None, None
+    if url.startswith('memory://'):
+        name = 'memory'
+    elif url.startswith(('http://', 'https://')):
+        name = 's3'
+    else:
+        name = 'local'
+    backend = get_backend(name)
+    key = backend.key_from_url(url) if backend else None
+    return (backend, key) if key else (None, None)
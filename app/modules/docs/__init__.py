@@ -5,3 +5,8 @@ bp = Blueprint('docs', __name__, url_prefix='/docs')
 # Import routes after bp is defined to avoid circular import
 from app.modules.docs import routes
 
+@bp.app_template_filter('responsive_images')
+def responsive_images_filter(html):
+    """Serve pasted images in rendered documents as lazily loaded, resized variants"""
+    from app.modules.docs.images import responsive_images
+    return responsive_images(html)
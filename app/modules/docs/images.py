@@ -0,0 +1,404 @@
+"""
+Display variants and thumbnails of pasted images.
+
+Screenshots pasted into documents are often multi-megabyte PNGs. Once an
+image is uploaded, a background thread (and, for anything it missed, a
+scheduled job) stores a WebP display variant no larger than
+IMAGE_DISPLAY_MAX_PX and a thumbnail no larger than IMAGE_THUMB_MAX_PX next
+to the original, and records them on the image's Blob. Rendered documents
+point at the variants and load them lazily, and the PDF and Word exports
+embed the display variant instead of the original.
+
+Documents pasted from Word or the HTML editor can also carry images inline
+as base64 data: URLs, which bloat documents.content into megabytes.
+extract_inline_images() moves them into the blob store when a document is
+saved, and a one-off job at startup does the same for existing documents
+(once, on one node).
+"""
+import re
+import base64
+import binascii
+import threading
+import logging
+import tempfile
+from io import BytesIO
+from datetime import datetime
+from flask import current_app
+from markupsafe import escape
+from sqlalchemy import func
+from app import db_session
+from app.core.metrics import track_job
+from app.core.models import Blob, Setting
+from app.core.storage import get_storage_for_url
+from app.modules.docs.models import Document
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = (('display', 'IMAGE_DISPLAY_MAX_PX'), ('thumb', 'IMAGE_THUMB_MAX_PX'))
+
+IMG_TAG = re.compile(r'<img\b[^>]*>', re.IGNORECASE)
+# Base64 may be wrapped over several lines; whitespace is dropped before decoding
+DATA_IMAGE = re.compile(r'data:image/([a-z0-9.+-]+);base64,([A-Za-z0-9+/=\s]+)', re.IGNORECASE)
+# A data: URL in content only counts when it runs up to the closing quote of its attribute or the ) of its markdown link
+DATA_IMAGE_REFERENCE = re.compile(DATA_IMAGE.pattern + r'(?=["\')])', re.IGNORECASE)
+# data: image types stored as files, with their extensions; anything else (SVG) stays inline
+INLINE_IMAGE_TYPES = {'png': 'png', 'jpeg': 'jpg', 'jpg': 'jpg', 'gif': 'gif', 'webp': 'webp'}
+
+IMG_SRC = re.compile(r'\ssrc=["\']([^"\']+)["\']', re.IGNORECASE)
+
+
+def _variant_key(key, name):
+    """blobs/ab/<sha>.png -> blobs/ab/<sha>.display.webp"""
+    stem = key.rsplit('.', 1)[0] if '.' in key.rsplit('/', 1)[-1] else key
+    return f"{stem}.{name}.webp"
+
+
+def build_image_variants(blob):
+    """
+    Store the WebP variants of an image blob next to it and record them on
+    blob.variants; the caller commits. A variant that would not be smaller
+    than the original points at the original. Animated and unreadable images
+    get no variants.
+    """
+    from PIL import Image, ImageOps
+    backend, key = get_storage_for_url(blob.url)
+    stored = backend.open(key) if backend else None
+    if stored is None:
+        raise FileNotFoundError(f"Image {blob.url} is missing from storage")
+
+    with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as source:
+        try:
+            for chunk in stored.body:
+                source.write(chunk)
+        finally:
+            stored.close()
+        source.seek(0)
+
+        variants = {}
+        with Image.open(source) as image:
+            if getattr(image, 'is_animated', False):
+                blob.variants = {}
+                return blob.variants
+            variants['original'] = {'url': blob.url, 'width': image.width, 'height': image.height, 'size': blob.size}
+            if image.format == 'JPEG':
+                # Decode large JPEGs at a reduced scale; the display size is the largest we need
+                image.draft('RGB', (current_app.config['IMAGE_DISPLAY_MAX_PX'],) * 2)
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+            for name, setting in VARIANTS:
+                limit = current_app.config[setting]
+                resized = image.copy()
+                resized.thumbnail((limit, limit), Image.LANCZOS)
+                out = BytesIO()
+                resized.save(out, 'WEBP', quality=current_app.config['IMAGE_VARIANT_QUALITY'], method=4)
+                if out.tell() >= blob.size:
+                    variants[name] = variants['original']
+                    continue
+                out.seek(0)
+                url = backend.put(_variant_key(key, name), out, 'image/webp')
+                variants[name] = {'url': url, 'width': resized.width, 'height': resized.height, 'size': out.getbuffer().nbytes}
+
+    blob.variants = variants
+    return variants
+
+
+def process_image_blob(blob_id):
+    """Build the variants of one image blob unless it has them; failures are recorded so they are not retried"""
+    blob = Blob.query.get(blob_id)
+    if blob is None or blob.variants is not None:
+        return False
+    try:
+        build_image_variants(blob)
+    except Exception as e:
+        logger.warning(f"Could not build image variants of {blob.url}: {str(e)}")
+        blob.variants = {}
+    db_session.commit()
+    return bool(blob.variants)
+
+
+def queue_image_variants(*blob_ids):
+    """Build uploaded images' variants in a background thread, off the request path"""
+    if not blob_ids:
+        return
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            for blob_id in blob_ids:
+                try:
+                    process_image_blob(blob_id)
+                except Exception as e:
+                    db_session.rollback()
+                    logger.error(f"Error building image variants of blob {blob_id}: {str(e)}")
+            db_session.remove()
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+
+
+def build_missing_image_variants(limit=200):
+    """
+    Build variants for image blobs that have none yet (uploads whose thread
+    did not finish, direct uploads).
+
+    Returns:
+        Number of images processed
+    """
+    blob_ids = [blob_id for (blob_id,) in db_session.query(Blob.id)
+                .filter(Blob.content_type.like('image/%'), Blob.variants.is_(None))
+                .order_by(Blob.id).limit(limit)]
+    for blob_id in blob_ids:
+        process_image_blob(blob_id)
+    if blob_ids:
+        logger.info(f"Built variants for {len(blob_ids)} images")
+    return len(blob_ids)
+
+
+@track_job('image_variants')
+def run_image_variant_job(app):
+    """Scheduled job: build variants of images the upload threads missed"""
+    from app.core.job_lock import job_lock
+
+    with app.app_context():
+        try:
+            with job_lock('image_variants') as acquired:
+                if not acquired:
+                    return
+                build_missing_image_variants()
+        except Exception as e:
+            db_session.rollback()
+            logger.error(f"Error building image variants: {str(e)}")
+        finally:
+            db_session.remove()
+
+
+def image_variants(urls):
+    """{original url: variants} for the image blobs among urls that have variants"""
+    urls = {url for url in urls if not url.startswith('data:')}
+    if not urls:
+        return {}
+    rows = db_session.query(Blob.url, Blob.variants).filter(Blob.url.in_(urls), Blob.variants.isnot(None))
+    return {url: variants for url, variants in rows if variants}
+
+
+def _set_attribute(tag, name, value):
+    if re.search(rf'\s{name}=', tag, re.IGNORECASE):
+        return tag
+    return f'{tag[:-2].rstrip()} {name}="{escape(value)}" />' if tag.endswith('/>') else f'{tag[:-1].rstrip()} {name}="{escape(value)}">'
+
+
+def responsive_images(html):
+    """
+    Point the images in rendered document HTML at their display variants,
+    with the thumbnail in srcset, intrinsic dimensions and lazy loading.
+    """
+    if not html or '<img' not in html.lower():
+        return html
+    srcs = [match.group(1) for match in map(IMG_SRC.search, IMG_TAG.findall(html)) if match]
+    variants_by_url = image_variants(srcs)
+
+    def rewrite(match):
+        tag = match.group(0)
+        src = IMG_SRC.search(tag)
+        variants = variants_by_url.get(src.group(1)) if src else None
+        if variants and 'display' in variants:
+            display, thumb = variants['display'], variants['thumb']
+            tag = tag.replace(src.group(0), f' src="{escape(display["url"])}"', 1)
+            if thumb['url'] != display['url']:
+                tag = _set_attribute(tag, 'srcset', f"{thumb['url']} {thumb['width']}w, {display['url']} {display['width']}w")
+                tag = _set_attribute(tag, 'sizes', f"(max-width: {display['width']}px) 100vw, {display['width']}px")
+            tag = _set_attribute(tag, 'width', str(display['width']))
+            tag = _set_attribute(tag, 'height', str(display['height']))
+        tag = _set_attribute(tag, 'loading', 'lazy')
+        return _set_attribute(tag, 'decoding', 'async')
+
+    return IMG_TAG.sub(rewrite, html)
+
+
+def display_variant_url(src):
+    """URL of an image's display variant, or src itself when it has none"""
+    variants = image_variants([src]).get(src)
+    return variants['display']['url'] if variants and 'display' in variants else src
+
+
+def open_export_image(src):
+    """
+    An image's display variant as PNG, for exporters that cannot embed WebP;
+    None for images without variants.
+    """
+    from PIL import Image
+    url = display_variant_url(src)
+    if url == src:
+        return None
+    backend, key = get_storage_for_url(url)
+    stored = backend.open(key) if backend else None
+    if stored is None:
+        return None
+    try:
+        data = b''.join(stored.body)
+    finally:
+        stored.close()
+    out = BytesIO()
+    with Image.open(BytesIO(data)) as image:
+        image.save(out, 'PNG')
+    out.seek(0)
+    return out
+
+
+def decode_data_image(src):
+    """(content type, bytes) of a base64 data: URL image, or None if it is not one or does not decode"""
+    match = DATA_IMAGE.fullmatch(src.strip())
+    if not match:
+        return None
+    try:
+        return f"image/{match.group(1).lower()}", base64.b64decode(re.sub(r'\s+', '', match.group(2)), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def extract_inline_images(content):
+    """
+    Store the base64 data: URL images in document content in the blob store
+    and point the content at the stored files. Like pasted images they take
+    no blob reference; their Blob rows are written in the caller's
+    transaction. Images of other types, or that are cut off, do not decode
+    or cannot be stored, are left inline.
+
+    Returns:
+        (content, ids of the blobs referenced)
+    """
+    from app.core.blobs import store_blob
+    if not content or 'data:image/' not in content:
+        return content, []
+    blob_ids = []
+
+    def store(match):
+        extension = INLINE_IMAGE_TYPES.get(match.group(1).lower())
+        image = decode_data_image(match.group(0)) if extension else None
+        if image is None:
+            return match.group(0)
+        content_type = 'image/jpeg' if extension == 'jpg' else f"image/{extension}"
+        blob = store_blob(BytesIO(image[1]), f"pasted.{extension}", content_type=content_type, reference=False)
+        if blob is None:
+            return match.group(0)
+        blob_ids.append(blob.id)
+        # Whitespace before a markdown link title stays; in an HTML attribute it is dropped
+        payload = match.group(2)
+        markdown = match.start() > 0 and match.string[match.start() - 1] == '('
+        return blob.url + payload[len(payload.rstrip()):] if markdown else blob.url
+
+    return DATA_IMAGE_REFERENCE.sub(store, content), blob_ids
+
+
+def content_size_report():
+    """Distribution of documents.content sizes in characters, and how many documents hold inline images"""
+    sizes = sorted(size for (size,) in db_session.query(func.coalesce(func.length(Document.content), 0)))
+    inline = db_session.query(func.count()).filter(Document.content.like('%data:image/%')).scalar()
+
+    def percentile(p):
+        return sizes[min(len(sizes) - 1, int(len(sizes) * p))] if sizes else 0
+
+    return {
+        'documents': len(sizes),
+        'total': sum(sizes),
+        'p50': percentile(0.5),
+        'p95': percentile(0.95),
+        'p99': percentile(0.99),
+        'max': sizes[-1] if sizes else 0,
+        'with_inline_images': inline
+    }
+
+
+def _format_size_report(report):
+    return (f"{report['documents']} documents, {report['total']} characters "
+            f"(p50 {report['p50']}, p95 {report['p95']}, p99 {report['p99']}, max {report['max']}), "
+            f"{report['with_inline_images']} with inline images")
+
+
+BACKFILL_DONE_KEY = 'inline_image_backfill_done'
+
+
+def backfill_inline_images():
+    """
+    Move the inline images of existing documents into the blob store, one
+    document per transaction. Documents keep their updated_at, and the image
+    variants are left to the scheduled image_variants job. A document saved
+    while its images were being stored is left as the save wrote it (saving
+    extracts the images itself), and the files stored for it are left to the
+    orphaned file collector.
+
+    Returns:
+        (size report before, size report after, number of documents rewritten,
+        number of documents that failed)
+    """
+    doc_ids = [doc_id for (doc_id,) in db_session.query(Document.id)
+               .filter(Document.content.like('%data:image/%')).order_by(Document.id)]
+    if not doc_ids:
+        return None, None, 0, 0
+    before = content_size_report()
+    logger.info(f"Documents before moving inline images: {_format_size_report(before)}")
+
+    rewritten = 0
+    failed = 0
+    for doc_id in doc_ids:
+        # Load one document's content at a time; these rows can be megabytes each
+        original = db_session.query(Document.content).filter_by(id=doc_id).scalar()
+        try:
+            content, blob_ids = extract_inline_images(original)
+            if not blob_ids:
+                db_session.rollback()
+                continue
+            # Storing the images can take seconds; only replace the content that was read
+            updated = Document.query.filter(Document.id == doc_id, Document.content == original).update(
+                {'content': content, 'updated_at': Document.updated_at}, synchronize_session=False
+            )
+            if not updated:
+                db_session.rollback()
+                continue
+            db_session.commit()
+            rewritten += 1
+        except Exception as e:
+            db_session.rollback()
+            failed += 1
+            logger.error(f"Error moving inline images of document {doc_id}: {str(e)}")
+
+    after = content_size_report()
+    logger.info(f"Documents after moving inline images of {rewritten} documents: {_format_size_report(after)}")
+    return before, after, rewritten, failed
+
+
+def _backfill_done():
+    return db_session.query(Setting.value).filter(Setting.key == BACKFILL_DONE_KEY).scalar() is not None
+
+
+def _mark_backfill_done():
+    # Written directly rather than through save_settings(): this is not a setting and must not reset the settings cache
+    db_session.add(Setting(key=BACKFILL_DONE_KEY, value=datetime.utcnow().isoformat(timespec='seconds'),
+                           description='When inline document images were moved to the blob store'))
+    db_session.commit()
+
+
+@track_job('inline_image_backfill')
+def run_inline_image_backfill(app):
+    """
+    One-off job at startup: move inline images of documents saved before
+    save-time extraction. It runs on one node at a time, and once a pass
+    completes without errors it is not repeated.
+    """
+    from app.core.job_lock import cluster_lock
+
+    with app.app_context():
+        try:
+            with cluster_lock('inline_image_backfill') as acquired:
+                if not acquired or _backfill_done():
+                    return
+                if not backfill_inline_images()[3]:
+                    _mark_backfill_done()
+        except Exception as e:
+            db_session.rollback()
+            logger.error(f"Error moving inline images: {str(e)}")
+        finally:
+            db_session.remove()
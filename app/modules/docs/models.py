@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.core.models import Base
@@ -62,7 +62,7 @@ class Software(Base):
     org_id = Column(Integer, ForeignKey('organizations.id'), nullable=False)
     title = Column(String(200), nullable=False)
     note = Column(Text, nullable=True)
-    file_path = Column(String(500), nullable=False)
+    file_path = Column(String(500), nullable=False, index=True)
     file_name = Column(String(255), nullable=False)
     file_size = Column(Integer, nullable=False)
     link = Column(String(500), nullable=True)
@@ -84,7 +84,7 @@ class DocumentFile(Base):
     folder_id = Column(Integer, ForeignKey('document_folders.id'), nullable=False)
     name = Column(String(200), nullable=False)
     original_filename = Column(String(255), nullable=False)
-    file_path = Column(String(500), nullable=False)
+    file_path = Column(String(500), nullable=False, index=True)
     file_size = Column(Integer, nullable=False)
     mime_type = Column(String(100), nullable=False)
     uploaded_by = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -101,3 +101,32 @@ class DocumentFile(Base):
         previewable_types = ['application/pdf', 'image/jpeg', 'image/png', 'image/gif', 'image/webp']
         return self.mime_type in previewable_types
 
+class UploadSession(Base):
+    """A software package or folder file being uploaded in chunks, resumable until it completes or expires"""
+    __tablename__ = 'upload_sessions'
+    query = QueryProperty()
+    
+    id = Column(Integer, primary_key=True)
+    org_id = Column(Integer, ForeignKey('organizations.id'), nullable=False)
+    folder_id = Column(Integer, ForeignKey('document_folders.id'), nullable=True)
+    kind = Column(String(20), nullable=False)  # 'software' or 'document_file'
+    filename = Column(String(255), nullable=False)
+    content_type = Column(String(100), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    offset = Column(BigInteger, default=0, nullable=False)  # Bytes received; always a multiple of chunk_size until the end
+    backend = Column(String(20), nullable=False)
+    storage_key = Column(String(500), nullable=False)
+    storage_upload_id = Column(String(255), nullable=False)
+    uploaded_by = Column(Integer, ForeignKey('users.id'), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+class DirectUploadToken(Base):
+    """A completed direct upload's token nonce, so each presigned upload creates one record"""
+    __tablename__ = 'direct_upload_tokens'
+    query = QueryProperty()
+    
+    id = Column(Integer, primary_key=True)
+    nonce = Column(String(64), unique=True, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
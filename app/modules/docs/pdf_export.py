@@ -4,7 +4,10 @@ import markdown
 from datetime import datetime
 import os
 import re
+from app.core.metrics import track_job
+from app.modules.docs.images import display_variant_url
 
+@track_job('pdf_render')
 def export_document_to_pdf(document, organization=None):
     """Export a document to PDF (supports both markdown and HTML)"""
     # Convert content to HTML based on content_type
@@ -24,6 +27,11 @@ def export_document_to_pdf(document, organization=None):
             src_match = re.search(r'src=["\']([^"\']+)["\']', img_tag)
             if src_match:
                 src = src_match.group(1)
+                # Pasted images are embedded as their display variant rather than the full-size original
+                variant_url = display_variant_url(src)
+                if variant_url != src:
+                    img_tag = img_tag.replace(src, variant_url)
+                    src = variant_url
                 # If it's a relative URL starting with /static/
                 if src.startswith('/static/'):
                     # Convert to absolute file path
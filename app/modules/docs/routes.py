@@ -1,6 +1,6 @@
 from flask import render_template, request, redirect, url_for, flash, send_file, session, jsonify
 from flask_login import login_required, current_user
-from io import BytesIO, SEEK_END
+from io import BytesIO
 from app.modules.docs import bp
 from app.modules.docs.models import Document, DocumentFolder, Software, DocumentFile
 from app.core import models
@@ -10,11 +10,14 @@ from app.modules.docs.pdf_export import export_document_to_pdf
 from app.modules.docs.word_export import export_document_to_word
 from app.core.sidebar_utils import build_document_tree
 from app.core.smtp_utils import send_email, get_smtp_settings
+from app.core.settings_cache import get_setting, get_setting_bool, get_setting_int
 from app import db_session, csrf
 import os
 import re
 import html
+import secrets
 from werkzeug.utils import secure_filename
+from werkzeug.http import is_resource_modified
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
@@ -42,6 +45,184 @@ def get_mime_type(filename):
     }
     return mime_types.get(ext, 'application/octet-stream')
 
+def get_image_content_type(filename):
+    """Get MIME type of an editor image upload from its filename"""
+    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    content_type_map = {
+        'jpg': 'image/jpeg',
+        'jpeg': 'image/jpeg',
+        'png': 'image/png',
+        'gif': 'image/gif',
+        'webp': 'image/webp'
+    }
+    return content_type_map.get(ext, 'image/jpeg')
+
+@bp.context_processor
+def inject_upload_mode():
+    """Tell upload forms whether to send files straight to S3"""
+    from app.core.s3_utils import direct_uploads_enabled
+    return dict(direct_uploads=direct_uploads_enabled())
+
+def _content_disposition(download_name, as_attachment):
+    """Content-Disposition header value, built as send_file() does, with an RFC 5987 filename for non-ASCII names"""
+    from urllib.parse import quote
+    from werkzeug.http import dump_options_header
+    import unicodedata
+    disposition = 'attachment' if as_attachment else 'inline'
+    # Control characters (a CR or LF would split the header) are dropped; quotes and backslashes are escaped below
+    download_name = ''.join(c for c in download_name if unicodedata.category(c) != 'Cc')
+    simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+    options = {'filename': simple}
+    quoted = quote(download_name, safe="!#$&+-.^_`|~")
+    if quoted != simple:
+        options['filename*'] = f"UTF-8''{quoted}"
+    return dump_options_header(disposition, options)
+
+def _send_stored_file(file_path, download_name, mimetype=None, as_attachment=True):
+    """
+    Send a stored upload without reading it into memory.
+    
+    Local files go through send_file (or the front proxy, see SENDFILE_MODE).
+    Other backends are streamed in chunks with Range and conditional request
+    support, or redirected to a presigned URL when that is enabled in the S3
+    settings. Returns None if the file could not be retrieved.
+    """
+    from flask import Response, current_app
+    from app.core.storage import get_storage_for_url
+    from app.core.s3_utils import presigned_downloads_enabled
+    
+    backend, key = get_storage_for_url(file_path)
+    if not backend:
+        return None
+    
+    local_path = backend.local_path(key)
+    if local_path:
+        response = _offload_local_file(local_path, download_name, mimetype, as_attachment)
+        if response is not None:
+            return response
+        
+        # conditional=True answers Range (206) and If-None-Match/If-Modified-Since (304) requests
+        response = send_file(
+            local_path,
+            mimetype=mimetype,
+            as_attachment=as_attachment,
+            download_name=download_name,
+            conditional=True
+        )
+        response.headers.setdefault('Accept-Ranges', 'bytes')
+        return response
+    
+    if presigned_downloads_enabled():
+        try:
+            url = backend.presigned_url(key, download_name, mimetype, as_attachment,
+                                        expires_in=get_setting_int('s3_presigned_expiry', 300))
+        except Exception as e:
+            current_app.logger.error(f"Error creating presigned URL for {file_path}: {str(e)}")
+            url = None
+        if url:
+            return redirect(url)
+    
+    try:
+        info = backend.head(key)
+        if info is None:
+            return None
+        
+        if not is_resource_modified(request.environ, etag=info.etag, last_modified=info.last_modified):
+            response = Response(status=304)
+            response.set_etag(info.etag)
+            return response
+        
+        byte_range = _requested_range(info)
+        if byte_range == 'unsatisfiable':
+            response = Response(status=416)
+            response.headers['Content-Range'] = f"bytes */{info.size}"
+            return response
+        
+        stored = backend.open(key, *byte_range) if byte_range else backend.open(key)
+        if stored is None:
+            return None
+    except Exception as e:
+        current_app.logger.error(f"Error opening {file_path} in {backend.name} storage: {str(e)}")
+        return None
+    
+    response = Response(
+        stored.body,
+        status=206 if byte_range else 200,
+        mimetype=mimetype or stored.content_type or 'application/octet-stream',
+        direct_passthrough=True
+    )
+    response.content_length = stored.content_length
+    response.headers['Content-Disposition'] = _content_disposition(download_name, as_attachment)
+    response.headers['Accept-Ranges'] = 'bytes'
+    if byte_range:
+        response.headers['Content-Range'] = stored.content_range
+    if stored.etag:
+        response.set_etag(stored.etag)
+    if stored.last_modified:
+        response.last_modified = stored.last_modified
+    response.call_on_close(stored.close)
+    return response
+
+def _requested_range(info):
+    """(start, end) of a satisfiable single Range request, 'unsatisfiable', or None to send everything"""
+    # Multiple ranges, and ranges whose If-Range no longer matches, get the whole object
+    if not request.range or len(request.range.ranges) != 1:
+        return None
+    if_range = request.if_range
+    if if_range.etag and if_range.etag != info.etag:
+        return None
+    if if_range.date and (not info.last_modified or info.last_modified > if_range.date):
+        return None
+    
+    byte_range = request.range.range_for_length(info.size)
+    if byte_range is None:
+        return 'unsatisfiable'
+    start, stop = byte_range
+    return start, stop - 1
+
+def _offload_local_file(local_path, download_name, mimetype, as_attachment):
+    """
+    Let the front proxy send a local upload (SENDFILE_MODE).
+    
+    Returns an empty response carrying X-Accel-Redirect or X-Sendfile, so the
+    worker is free as soon as the headers are written; the proxy handles
+    ranges and conditional requests. None when offloading is off or the file
+    is outside UPLOAD_FOLDER.
+    """
+    from flask import current_app
+    from urllib.parse import quote
+    import mimetypes
+    
+    mode = current_app.config['SENDFILE_MODE']
+    if mode not in ('x-accel-redirect', 'x-sendfile'):
+        return None
+    
+    upload_folder = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+    local_path = os.path.abspath(local_path)
+    if not local_path.startswith(upload_folder + os.sep):
+        return None
+    
+    response = current_app.response_class(
+        mimetype=mimetype or mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    )
+    response.headers['Content-Disposition'] = _content_disposition(download_name, as_attachment)
+    if mode == 'x-accel-redirect':
+        relative_path = os.path.relpath(local_path, upload_folder).replace(os.sep, '/')
+        prefix = current_app.config['SENDFILE_ACCEL_PREFIX'].rstrip('/')
+        response.headers['X-Accel-Redirect'] = f"{prefix}/{quote(relative_path)}"
+    else:
+        response.headers['X-Sendfile'] = local_path
+    return response
+
+def _is_new_download(response):
+    """True unless the response resumes a download (range not starting at 0) or sends nothing (304, 412, 416)"""
+    if 'X-Accel-Redirect' in response.headers or 'X-Sendfile' in response.headers:
+        # The proxy answers the Range header, so judge by the request
+        return not request.range or request.range.ranges[0][0] == 0
+    if response.status_code == 206:
+        return response.headers.get('Content-Range', '').startswith('bytes 0-')
+    return response.status_code in (200, 302)
+
 def html_to_markdown(html_content):
     """Convert HTML to Markdown (basic conversion)"""
     if not html_content:
@@ -253,12 +434,16 @@ def create():
                 flash('Invalid folder selected', 'error')
                 return redirect(url_for('docs.create'))
         
-        # Strip base64 images from content as a fallback (should be handled client-side, but this prevents DB errors)
+        # Images pasted inline as base64 (from Word or the HTML editor) are moved to the blob store
+        from app.modules.docs.images import extract_inline_images, queue_image_variants
+        content, image_blob_ids = extract_inline_images(content)
+        
+        # Strip base64 images that could not be stored as a fallback (this prevents DB errors)
         if content_type == 'html' and 'data:image/' in content:
             import re
             # Remove base64 image tags
             content = re.sub(r'<img[^>]+src="data:image/[^"]+"[^>]*>', '', content)
-            flash('Warning: Some images were removed because they were too large. Please upload images using the image button instead.', 'warning')
+            flash('Warning: Some images were removed because they could not be stored. Please upload images using the image button instead.', 'warning')
         
         doc = Document(
             org_id=org_id,
@@ -270,6 +455,7 @@ def create():
         )
         db_session.add(doc)
         db_session.commit()
+        queue_image_variants(*image_blob_ids)
         
         log_activity('create', 'document', doc.id)
         flash('Document created successfully', 'success')
@@ -313,18 +499,22 @@ def edit(doc_id):
                 flash('Invalid folder selected', 'error')
                 return redirect(url_for('docs.edit', doc_id=doc_id))
         
-        # Strip base64 images from content as a fallback (should be handled client-side, but this prevents DB errors)
-        content = request.form.get('content', '')
+        # Images pasted inline as base64 (from Word or the HTML editor) are moved to the blob store
+        from app.modules.docs.images import extract_inline_images, queue_image_variants
+        content, image_blob_ids = extract_inline_images(request.form.get('content', ''))
+        
+        # Strip base64 images that could not be stored as a fallback (this prevents DB errors)
         if doc.content_type == 'html' and 'data:image/' in content:
             import re
             # Remove base64 image tags
             content = re.sub(r'<img[^>]+src="data:image/[^"]+"[^>]*>', '', content)
-            flash('Warning: Some images were removed because they were too large. Please upload images using the image button instead.', 'warning')
+            flash('Warning: Some images were removed because they could not be stored. Please upload images using the image button instead.', 'warning')
         
         doc.folder_id = folder_id
         doc.content = content
         doc.updated_by = current_user.id
         db_session.commit()
+        queue_image_variants(*image_blob_ids)
         
         log_activity('update', 'document', doc_id)
         flash('Document updated successfully', 'success')
@@ -416,8 +606,7 @@ def export_word(doc_id):
 @login_required
 def upload_image():
     """Handle image upload for markdown editor"""
-    from flask import current_app
-    from app.core.s3_utils import upload_file
+    from app.core.blobs import store_blob
     
     if 'image' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
@@ -427,28 +616,19 @@ def upload_image():
         return jsonify({'error': 'No file selected'}), 400
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        # Add timestamp to avoid conflicts
-        from datetime import datetime
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-        filename = timestamp + filename
-        
         # Determine content type
-        ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-        content_type_map = {
-            'jpg': 'image/jpeg',
-            'jpeg': 'image/jpeg',
-            'png': 'image/png',
-            'gif': 'image/gif',
-            'webp': 'image/webp'
-        }
-        content_type = content_type_map.get(ext, 'image/jpeg')
+        content_type = get_image_content_type(file.filename)
         
-        # Upload file (to S3 or local storage)
-        url = upload_file(file, filename, folder='uploads', content_type=content_type)
+        # Store image in the blob store (S3 or local storage); a screenshot pasted again is not stored twice.
+        # Document content takes no blob reference: the orphaned file collector deletes images no longer shown
+        blob = store_blob(file.stream, file.filename, content_type=content_type, reference=False)
         
-        if url:
-            return jsonify({'url': url}), 200
+        if blob:
+            db_session.commit()
+            # Display variant and thumbnail are built in the background
+            from app.modules.docs.images import queue_image_variants
+            queue_image_variants(blob.id)
+            return jsonify({'url': blob.url}), 200
         else:
             return jsonify({'error': 'Failed to upload image'}), 500
     
@@ -786,28 +966,17 @@ def software_create():
             flash('No file selected', 'error')
             return redirect(url_for('docs.software_create'))
         
-        # Check file size (2GB = 2 * 1024 * 1024 * 1024 bytes)
-        from flask import current_app
-        file.seek(0, SEEK_END)
-        file_size = file.tell()
-        file.seek(0)
+        # Store file in the blob store (S3 or local storage), once per distinct content
+        from app.core.blobs import store_blob
+        from app.core.storage import UploadTooLargeError
         max_size = 2 * 1024 * 1024 * 1024  # 2GB
-        
-        if file_size > max_size:
+        try:
+            blob = store_blob(file.stream, file.filename, max_size=max_size)
+        except UploadTooLargeError:
             flash('File size exceeds 2GB limit', 'error')
             return redirect(url_for('docs.software_create'))
         
-        # Save file
-        filename = secure_filename(file.filename)
-        from datetime import datetime
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-        filename = timestamp + filename
-        
-        # Upload file (to S3 or local storage)
-        from app.core.s3_utils import upload_file
-        file_path_or_url = upload_file(file, filename, folder='software')
-        
-        if not file_path_or_url:
+        if not blob:
             flash('Failed to upload file', 'error')
             return redirect(url_for('docs.software_index'))
         
@@ -815,9 +984,9 @@ def software_create():
             org_id=org_id,
             title=title,
             note=note,
-            file_path=file_path_or_url,  # Can be S3 URL or local path
+            file_path=blob.url,  # Can be S3 URL or local path
             file_name=file.filename,
-            file_size=file_size,
+            file_size=blob.size,
             link=link if link else None,
             uploaded_by=current_user.id
         )
@@ -860,35 +1029,23 @@ def software_edit(software_id):
         if 'file' in request.files:
             file = request.files['file']
             if file.filename != '':
-                # Check file size (2GB)
-                from flask import current_app
-                file.seek(0, SEEK_END)
-                file_size = file.tell()
-                file.seek(0)
+                # Store new file in the blob store (S3 or local storage)
+                from datetime import datetime
+                from app.core.blobs import store_blob, release_file
+                from app.core.storage import UploadTooLargeError
                 max_size = 2 * 1024 * 1024 * 1024  # 2GB
-                
-                if file_size > max_size:
+                try:
+                    blob = store_blob(file.stream, file.filename, max_size=max_size)
+                except UploadTooLargeError:
                     flash('File size exceeds 2GB limit', 'error')
                     return redirect(url_for('docs.software_edit', software_id=software_id))
                 
-                # Delete old file
-                from app.core.s3_utils import delete_file as s3_delete_file
-                s3_delete_file(software.file_path)
-                
-                # Save new file
-                filename = secure_filename(file.filename)
-                from datetime import datetime
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-                filename = timestamp + filename
-                
-                # Upload file (to S3 or local storage)
-                from app.core.s3_utils import upload_file
-                file_path_or_url = upload_file(file, filename, folder='software')
-                
-                if file_path_or_url:
-                    software.file_path = file_path_or_url  # Can be S3 URL or local path
+                if blob:
+                    # Release the old file only once its replacement is stored
+                    release_file(software.file_path)
+                    software.file_path = blob.url  # Can be S3 URL or local path
                     software.file_name = file.filename
-                    software.file_size = file_size
+                    software.file_size = blob.size
                     software.uploaded_by = current_user.id
                     software.last_uploaded = datetime.utcnow()
                 else:
@@ -924,9 +1081,9 @@ def software_delete(software_id):
         flash('You do not have access to this software', 'error')
         return redirect(url_for('docs.software_index'))
     
-    # Delete file (from S3 or local storage)
-    from app.core.s3_utils import delete_file as s3_delete_file
-    s3_delete_file(software.file_path)
+    # Release file (from S3 or local storage); it is deleted once nothing else references it
+    from app.core.blobs import release_file
+    release_file(software.file_path)
     
     db_session.delete(software)
     db_session.commit()
@@ -940,8 +1097,7 @@ def software_delete(software_id):
 def software_download(software_id):
     """Download software and increment download count"""
     from flask import abort
-    from app.core.s3_utils import is_s3_url, download_file_from_s3, get_s3_key_from_url, file_exists
-    from io import BytesIO
+    from app.core.s3_utils import file_exists
     
     software = Software.query.get(software_id)
     if not software:
@@ -955,33 +1111,18 @@ def software_download(software_id):
         flash('File not found', 'error')
         return redirect(url_for('docs.software_index'))
     
-    # Increment download count
-    software.download_count += 1
-    db_session.commit()
-    
-    log_activity('view', 'software', software_id, {'action': 'download'})
-    
-    # Handle S3 or local file
-    if is_s3_url(software.file_path):
-        # Download from S3
-        s3_key = get_s3_key_from_url(software.file_path)
-        if s3_key:
-            file_data = download_file_from_s3(s3_key)
-            if file_data:
-                return send_file(
-                    BytesIO(file_data),
-                    as_attachment=True,
-                    download_name=software.file_name
-                )
-        flash('Failed to retrieve file from S3', 'error')
+    response = _send_stored_file(software.file_path, software.file_name, as_attachment=True)
+    if response is None:
+        flash('Failed to retrieve file', 'error')
         return redirect(url_for('docs.software_index'))
-    else:
-        # Return local file
-        return send_file(
-            software.file_path,
-            as_attachment=True,
-            download_name=software.file_name
-        )
+    
+    # Resumed ranges and cache revalidations are not new downloads
+    if _is_new_download(response):
+        software.download_count += 1
+        db_session.commit()
+        log_activity('view', 'software', software_id, {'action': 'download'})
+    
+    return response
 
 @bp.route('/<int:doc_id>/email', methods=['POST'])
 @login_required
@@ -1013,12 +1154,9 @@ def email_document(doc_id):
     # Check email domain restriction if enabled
     email_restriction_enabled = False
     email_restriction_domain = ''
-    restriction_setting = models.Setting.query.filter_by(key='email_domain_restriction_enabled').first()
-    if restriction_setting and restriction_setting.value == 'true':
+    if get_setting_bool('email_domain_restriction_enabled'):
         email_restriction_enabled = True
-        domain_setting = models.Setting.query.filter_by(key='email_domain_restriction').first()
-        if domain_setting and domain_setting.value:
-            email_restriction_domain = domain_setting.value.strip().lower()
+        email_restriction_domain = get_setting('email_domain_restriction', '').strip().lower()
     
     if email_restriction_enabled and email_restriction_domain:
         recipient_domain = recipient_email.split('@')[1].lower() if '@' in recipient_email else ''
@@ -1031,10 +1169,7 @@ def email_document(doc_id):
         pdf_data = export_document_to_pdf(doc, org)
         
         # Get brand name for email
-        brand_name = 'InfoGarden'
-        brand_setting = models.Setting.query.filter_by(key='brand_name').first()
-        if brand_setting and brand_setting.value:
-            brand_name = brand_setting.value
+        brand_name = get_setting('brand_name', 'InfoGarden')
         
         # Prepare email
         subject = f"{doc.title} - {brand_name}"
@@ -1156,31 +1291,22 @@ def upload_file(folder_id):
         flash('File type not allowed. Allowed types: PDF, RTF, DOC, DOCX, JPG, JPEG, PNG, WEBP', 'error')
         return redirect(url_for('docs.folder_view', folder_id=folder_id))
     
-    # Check file size (2GB limit)
-    file.seek(0, SEEK_END)
-    file_size = file.tell()
-    file.seek(0)
-    
-    max_size = 2 * 1024 * 1024 * 1024  # 2GB
-    if file_size > max_size:
-        flash('File size exceeds 2GB limit', 'error')
-        return redirect(url_for('docs.folder_view', folder_id=folder_id))
-    
-    # Save file
     original_filename = file.filename
-    filename = secure_filename(original_filename)
-    from datetime import datetime
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-    filename = timestamp + filename
     
     # Get MIME type
     mime_type = get_mime_type(original_filename)
     
-    # Upload file (to S3 or local storage)
-    from app.core.s3_utils import upload_file
-    file_path_or_url = upload_file(file, filename, folder='documents', content_type=mime_type)
+    # Store file in the blob store (S3 or local storage), once per distinct content
+    from app.core.blobs import store_blob
+    from app.core.storage import UploadTooLargeError
+    max_size = 2 * 1024 * 1024 * 1024  # 2GB
+    try:
+        blob = store_blob(file.stream, original_filename, content_type=mime_type, max_size=max_size)
+    except UploadTooLargeError:
+        flash('File size exceeds 2GB limit', 'error')
+        return redirect(url_for('docs.folder_view', folder_id=folder_id))
     
-    if not file_path_or_url:
+    if not blob:
         flash('Failed to upload file', 'error')
         return redirect(url_for('docs.folder_view', folder_id=folder_id))
     
@@ -1190,8 +1316,8 @@ def upload_file(folder_id):
         folder_id=folder_id,
         name=original_filename.rsplit('.', 1)[0] if '.' in original_filename else original_filename,
         original_filename=original_filename,
-        file_path=file_path_or_url,  # Can be S3 URL or local path
-        file_size=file_size,
+        file_path=blob.url,  # Can be S3 URL or local path
+        file_size=blob.size,
         mime_type=mime_type,
         uploaded_by=current_user.id
     )
@@ -1202,13 +1328,285 @@ def upload_file(folder_id):
     flash('File uploaded successfully', 'success')
     return redirect(url_for('docs.folder_view', folder_id=folder_id))
 
+def _upload_target(data, org_id, kinds):
+    """
+    Validate the kind, name, size and folder of an upload the browser is about to send.
+    
+    Returns:
+        Dict with kind, filename, size, content_type, key (storage key) and folder_id;
+        raises UploadError for anything that would be refused by the form routes
+    """
+    from flask import current_app
+    from datetime import datetime
+    from app.modules.docs.uploads import UploadError
+    
+    kind = data.get('kind')
+    original_filename = (data.get('filename') or '').strip()
+    folder_id = None
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        raise UploadError('File size is required')
+    if not original_filename:
+        raise UploadError('No file selected')
+    if size <= 0 or size > current_app.config['MAX_CONTENT_LENGTH']:
+        raise UploadError('File size exceeds 2GB limit')
+    
+    if kind not in kinds:
+        raise UploadError('Unknown upload type')
+    if kind == 'software':
+        storage_folder, content_type = 'software', 'application/octet-stream'
+    elif kind == 'document_file':
+        folder_id = int(data['folder_id']) if str(data.get('folder_id')).isdigit() else None
+        if not allowed_document_file(original_filename):
+            raise UploadError('File type not allowed. Allowed types: PDF, RTF, DOC, DOCX, JPG, JPEG, PNG, WEBP')
+        if not DocumentFolder.query.filter_by(id=folder_id, org_id=org_id).first():
+            raise UploadError('Folder not found', 404)
+        storage_folder, content_type = 'documents', get_mime_type(original_filename)
+    else:
+        if not allowed_file(original_filename):
+            raise UploadError('Invalid file type')
+        storage_folder, content_type = 'uploads', get_image_content_type(original_filename)
+    
+    filename = datetime.now().strftime('%Y%m%d_%H%M%S_') + secure_filename(original_filename)
+    return {
+        'kind': kind,
+        'filename': original_filename,
+        'size': size,
+        'content_type': content_type,
+        'key': f"{storage_folder}/{filename}",
+        'folder_id': folder_id
+    }
+
+def _create_uploaded_record(kind, org_id, folder_id, original_filename, file_path_or_url, file_size, mime_type, data):
+    """Create the Software or DocumentFile row for a file the browser uploaded, and say where to go next"""
+    if kind == 'software':
+        software = Software(
+            org_id=org_id,
+            title=(data.get('title') or '').strip(),
+            note=data.get('note', ''),
+            file_path=file_path_or_url,
+            file_name=original_filename,
+            file_size=file_size,
+            link=data.get('link') or None,
+            uploaded_by=current_user.id
+        )
+        db_session.add(software)
+        db_session.commit()
+        log_activity('create', 'software', software.id)
+        flash('Software uploaded successfully', 'success')
+        return jsonify({'redirect': url_for('docs.software_index')})
+    
+    doc_file = DocumentFile(
+        org_id=org_id,
+        folder_id=folder_id,
+        name=original_filename.rsplit('.', 1)[0] if '.' in original_filename else original_filename,
+        original_filename=original_filename,
+        file_path=file_path_or_url,
+        file_size=file_size,
+        mime_type=mime_type,
+        uploaded_by=current_user.id
+    )
+    db_session.add(doc_file)
+    db_session.commit()
+    log_activity('create', 'document_file', doc_file.id)
+    flash('File uploaded successfully', 'success')
+    return jsonify({'redirect': url_for('docs.folder_view', folder_id=folder_id)})
+
+DIRECT_UPLOAD_SALT = 'direct-upload'
+
+def _direct_upload_serializer():
+    from flask import current_app
+    from itsdangerous import URLSafeTimedSerializer
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=DIRECT_UPLOAD_SALT)
+
+@bp.route('/uploads/direct', methods=['POST'])
+@login_required
+def direct_upload_start():
+    """Hand the browser a presigned request to upload a software package, folder file or editor image straight to S3"""
+    from app.core.s3_utils import direct_uploads_enabled
+    from app.core.storage import get_storage
+    from app.modules.docs.uploads import UploadError
+    
+    if not direct_uploads_enabled():
+        return jsonify({'direct': False})
+    
+    org_id = session.get('current_org_id') or current_user.org_id
+    if not org_id or not current_user.can_access_org(org_id):
+        return jsonify({'error': 'You do not have access to this organization'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        target = _upload_target(data, org_id, ('software', 'document_file', 'image'))
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    
+    checksum = data.get('sha256')
+    if not checksum:
+        return jsonify({'error': 'SHA-256 checksum is required'}), 400
+    expires_in = get_setting_int('s3_presigned_expiry', 300)
+    upload = get_storage().presigned_upload(target['key'], target['content_type'], checksum=checksum, expires_in=expires_in)
+    if not upload:
+        return jsonify({'direct': False})
+    
+    # The nonce is recorded when the upload completes, so the token creates one record
+    token = _direct_upload_serializer().dumps(dict(target, sha256=checksum, nonce=secrets.token_urlsafe(16),
+                                                   org_id=org_id, user_id=current_user.id))
+    return jsonify({'direct': True, 'upload': upload, 'token': token})
+
+@bp.route('/uploads/direct/complete', methods=['POST'])
+@login_required
+def direct_upload_complete():
+    """Check a direct upload's size and checksum in S3, then create its Software or DocumentFile record"""
+    from itsdangerous import BadSignature
+    from app.core.storage import get_backend, ChecksumMismatchError
+    from app.core.blobs import register_blob, sha256_hex
+    from app.modules.docs.uploads import claim_direct_upload, direct_upload_max_age
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = _direct_upload_serializer().loads(data.get('token', ''), max_age=direct_upload_max_age())
+    except BadSignature:
+        return jsonify({'error': 'Upload expired, please try again'}), 400
+    if not upload.get('nonce') or not upload.get('sha256'):
+        return jsonify({'error': 'Upload expired, please try again'}), 400
+    if upload['user_id'] != current_user.id or not current_user.can_access_org(upload['org_id']):
+        return jsonify({'error': 'You do not have access to this organization'}), 403
+    
+    if upload['kind'] == 'software' and not (data.get('title') or '').strip():
+        return jsonify({'error': 'Title is required'}), 400
+    
+    storage = get_backend('s3')
+    if not storage:
+        return jsonify({'error': 'S3 storage is not configured'}), 400
+    try:
+        storage.verify_upload(upload['key'], upload['size'], upload['sha256'])
+    except ChecksumMismatchError as e:
+        from flask import current_app
+        current_app.logger.warning(f"Rejected direct upload: {str(e)}")
+        return jsonify({'error': 'Upload was incomplete or corrupted, please try again'}), 400
+    # Claimed in the same transaction as the record, so a failed completion can be retried
+    if not claim_direct_upload(upload['nonce']):
+        db_session.rollback()
+        return jsonify({'error': 'Upload was already completed'}), 409
+    
+    # Content already in the blob store is referenced instead, and this copy deleted. Images are for document content,
+    # which takes no reference
+    blob = register_blob(sha256_hex(upload['sha256']), upload['size'], storage.url_for(upload['key']), upload['content_type'],
+                         reference=upload['kind'] != 'image')
+    file_path_or_url = blob.url
+    
+    if upload['kind'] == 'image':
+        db_session.commit()
+        from app.modules.docs.images import queue_image_variants
+        queue_image_variants(blob.id)
+        return jsonify({'url': file_path_or_url})
+    return _create_uploaded_record(upload['kind'], upload['org_id'], upload['folder_id'], upload['filename'],
+                                   file_path_or_url, upload['size'], upload['content_type'], data)
+
+def _get_upload_session(upload_id):
+    """The current user's upload session, or None"""
+    from app.modules.docs.models import UploadSession
+    upload = UploadSession.query.filter_by(id=upload_id, uploaded_by=current_user.id).first()
+    if upload and not current_user.can_access_org(upload.org_id):
+        return None
+    return upload
+
+@bp.route('/uploads/resumable', methods=['POST'])
+@login_required
+def resumable_upload_start():
+    """Start a chunked upload of a software package or folder file"""
+    from app.modules.docs.uploads import UploadError, create_session, session_state
+    
+    org_id = session.get('current_org_id') or current_user.org_id
+    if not org_id or not current_user.can_access_org(org_id):
+        return jsonify({'error': 'You do not have access to this organization'}), 403
+    
+    try:
+        target = _upload_target(request.get_json(silent=True) or {}, org_id, ('software', 'document_file'))
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    
+    upload = create_session(target['kind'], target['filename'], target['content_type'], target['size'],
+                            target['key'], org_id, current_user.id, folder_id=target['folder_id'])
+    return jsonify(session_state(upload)), 201
+
+@bp.route('/uploads/resumable/<int:upload_id>', methods=['GET'])
+@login_required
+def resumable_upload_status(upload_id):
+    """Offset to resume a chunked upload from"""
+    from app.modules.docs.uploads import session_state
+    upload = _get_upload_session(upload_id)
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(session_state(upload))
+
+@bp.route('/uploads/resumable/<int:upload_id>', methods=['PATCH'])
+@login_required
+def resumable_upload_chunk(upload_id):
+    """Receive one chunk; Upload-Offset says where it starts and X-Chunk-SHA256 is its base64 SHA-256"""
+    from app.modules.docs.uploads import UploadError, write_chunk
+    upload = _get_upload_session(upload_id)
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({'error': 'Upload-Offset header is required'}), 400
+    if (request.content_length or 0) > upload.chunk_size:
+        return jsonify({'error': f'Chunks may be at most {upload.chunk_size} bytes'}), 413
+    
+    try:
+        new_offset = write_chunk(upload, offset, request.get_data(cache=False), request.headers.get('X-Chunk-SHA256'))
+    except UploadError as e:
+        db_session.rollback()
+        return jsonify({'error': str(e), 'offset': upload.offset}), e.status
+    return jsonify({'offset': new_offset})
+
+@bp.route('/uploads/resumable/<int:upload_id>/complete', methods=['POST'])
+@login_required
+def resumable_upload_complete(upload_id):
+    """Check and publish a fully received chunked upload (sha256 is the whole file's) and create its Software or DocumentFile record"""
+    from app.modules.docs.uploads import UploadError, complete_session
+    upload = _get_upload_session(upload_id)
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    if upload.kind == 'software' and not (data.get('title') or '').strip():
+        return jsonify({'error': 'Title is required'}), 400
+    
+    kind, org_id, folder_id = upload.kind, upload.org_id, upload.folder_id
+    filename, size, content_type = upload.filename, upload.size, upload.content_type
+    try:
+        file_path_or_url = complete_session(upload, data.get('sha256'))
+    except UploadError as e:
+        db_session.rollback()
+        return jsonify({'error': str(e)}), e.status
+    
+    # Content already in the blob store is referenced instead, and this copy deleted
+    from app.core.blobs import register_blob, sha256_hex
+    blob = register_blob(sha256_hex(data['sha256']), size, file_path_or_url, content_type)
+    return _create_uploaded_record(kind, org_id, folder_id, filename, blob.url, size, content_type, data)
+
+@bp.route('/uploads/resumable/<int:upload_id>', methods=['DELETE'])
+@login_required
+def resumable_upload_cancel(upload_id):
+    """Abandon a chunked upload and discard what was received"""
+    from app.modules.docs.uploads import abort_session
+    upload = _get_upload_session(upload_id)
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+    abort_session(upload)
+    return '', 204
+
 @bp.route('/file/<int:file_id>/preview')
 @login_required
 def preview_file(file_id):
     """Preview a document file"""
     from flask import current_app, abort, Response
-    from app.core.s3_utils import is_s3_url, download_file_from_s3, get_s3_key_from_url, file_exists
-    from io import BytesIO
+    from app.core.s3_utils import file_exists
     
     doc_file = DocumentFile.query.get(file_id)
     if not doc_file:
@@ -1222,43 +1620,26 @@ def preview_file(file_id):
         flash('File not found', 'error')
         return redirect(url_for('docs.folder_view', folder_id=doc_file.folder_id))
     
-    # Increment download count
-    doc_file.download_count += 1
-    db_session.commit()
-    
-    log_activity('view', 'document_file', file_id)
-    
-    # Handle S3 or local file
-    if is_s3_url(doc_file.file_path):
-        # Download from S3
-        s3_key = get_s3_key_from_url(doc_file.file_path)
-        if s3_key:
-            file_data = download_file_from_s3(s3_key)
-            if file_data:
-                return send_file(
-                    BytesIO(file_data),
-                    mimetype=doc_file.mime_type,
-                    as_attachment=False,
-                    download_name=doc_file.original_filename
-                )
-        flash('Failed to retrieve file from S3', 'error')
+    response = _send_stored_file(doc_file.file_path, doc_file.original_filename,
+                                 mimetype=doc_file.mime_type, as_attachment=False)
+    if response is None:
+        flash('Failed to retrieve file', 'error')
         return redirect(url_for('docs.folder_view', folder_id=doc_file.folder_id))
-    else:
-        # Return local file
-        return send_file(
-            doc_file.file_path,
-            mimetype=doc_file.mime_type,
-            as_attachment=False,
-            download_name=doc_file.original_filename
-        )
+    
+    # Resumed ranges and cache revalidations are not new downloads
+    if _is_new_download(response):
+        doc_file.download_count += 1
+        db_session.commit()
+        log_activity('view', 'document_file', file_id)
+    
+    return response
 
 @bp.route('/file/<int:file_id>/download')
 @login_required
 def download_file(file_id):
     """Download a document file"""
     from flask import current_app, abort
-    from app.core.s3_utils import is_s3_url, download_file_from_s3, get_s3_key_from_url, file_exists
-    from io import BytesIO
+    from app.core.s3_utils import file_exists
     
     doc_file = DocumentFile.query.get(file_id)
     if not doc_file:
@@ -1272,42 +1653,26 @@ def download_file(file_id):
         flash('File not found', 'error')
         return redirect(url_for('docs.folder_view', folder_id=doc_file.folder_id))
     
-    # Increment download count
-    doc_file.download_count += 1
-    db_session.commit()
-    
-    log_activity('view', 'document_file', file_id, {'action': 'download'})
-    
-    # Handle S3 or local file
-    if is_s3_url(doc_file.file_path):
-        # Download from S3
-        s3_key = get_s3_key_from_url(doc_file.file_path)
-        if s3_key:
-            file_data = download_file_from_s3(s3_key)
-            if file_data:
-                return send_file(
-                    BytesIO(file_data),
-                    mimetype=doc_file.mime_type,
-                    as_attachment=True,
-                    download_name=doc_file.original_filename
-                )
-        flash('Failed to retrieve file from S3', 'error')
+    response = _send_stored_file(doc_file.file_path, doc_file.original_filename,
+                                 mimetype=doc_file.mime_type, as_attachment=True)
+    if response is None:
+        flash('Failed to retrieve file', 'error')
         return redirect(url_for('docs.folder_view', folder_id=doc_file.folder_id))
-    else:
-        # Return local file
-        return send_file(
-            doc_file.file_path,
-            mimetype=doc_file.mime_type,
-            as_attachment=True,
-            download_name=doc_file.original_filename
-        )
+    
+    # Resumed ranges and cache revalidations are not new downloads
+    if _is_new_download(response):
+        doc_file.download_count += 1
+        db_session.commit()
+        log_activity('view', 'document_file', file_id, {'action': 'download'})
+    
+    return response
 
 @bp.route('/file/<int:file_id>/delete', methods=['POST'])
 @login_required
 def delete_file(file_id):
     """Delete a document file"""
     from flask import abort
-    from app.core.s3_utils import delete_file as s3_delete_file
+    from app.core.blobs import release_file
     
     doc_file = DocumentFile.query.get(file_id)
     if not doc_file:
@@ -1319,8 +1684,8 @@ def delete_file(file_id):
     
     folder_id = doc_file.folder_id
     
-    # Delete physical file (from S3 or local storage)
-    s3_delete_file(doc_file.file_path)
+    # Release physical file (from S3 or local storage); it is deleted once nothing else references it
+    release_file(doc_file.file_path)
     
     db_session.delete(doc_file)
     db_session.commit()
@@ -0,0 +1,245 @@
+"""
+Resumable chunked uploads of software packages and folder files.
+
+The browser creates an UploadSession, then sends the file in chunk_size
+pieces, each with its offset and SHA-256, and completes the session once the
+offset reaches the size. Every chunk goes straight into the storage backend
+(a part of an S3 multipart upload, or a write into a local partial file), so
+no request carries more than one chunk and a dropped connection costs only
+the chunk in flight: the browser asks for the session's offset and carries
+on from there. Sessions left idle for RESUMABLE_UPLOAD_EXPIRY_HOURS are
+aborted by a scheduled job.
+
+The browser hashes the whole file as its chunks are accepted and sends the
+SHA-256 with the completion request. The assembled object is read back and
+checked against it before it is published, and then goes into the blob
+store like a direct upload.
+"""
+import os
+import time
+import base64
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db_session
+from app.core.metrics import track_job
+from app.core.storage import get_backend, get_storage
+from app.modules.docs.models import DirectUploadToken, UploadSession
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+MIN_S3_PART_SIZE = 5 * MB
+
+
+class UploadError(Exception):
+    """A chunk or completion request that cannot be accepted; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def session_state(upload):
+    """What the browser needs to send or resume an upload"""
+    return {'id': upload.id, 'size': upload.size, 'offset': upload.offset, 'chunk_size': upload.chunk_size}
+
+
+def create_session(kind, filename, content_type, size, storage_key, org_id, user_id, folder_id=None):
+    """Start a chunked upload in the storage backend for new uploads and record its session"""
+    storage = get_storage()
+    chunk_size = current_app.config.get('RESUMABLE_CHUNK_SIZE_MB', 8) * MB
+    if storage.name == 's3':
+        chunk_size = max(chunk_size, MIN_S3_PART_SIZE)
+    upload = UploadSession(
+        org_id=org_id,
+        folder_id=folder_id,
+        kind=kind,
+        filename=filename,
+        content_type=content_type,
+        size=size,
+        chunk_size=chunk_size,
+        offset=0,
+        backend=storage.name,
+        storage_key=storage_key,
+        storage_upload_id=storage.start_upload(storage_key, content_type),
+        uploaded_by=user_id
+    )
+    db_session.add(upload)
+    db_session.commit()
+    return upload
+
+
+def _session_backend(upload):
+    backend = get_backend(upload.backend)
+    if not backend:
+        raise UploadError(f"{upload.backend} storage is not configured", 503)
+    return backend
+
+
+def write_chunk(upload, offset, data, checksum=None):
+    """
+    Store the chunk starting at offset and return the session's new offset.
+
+    Chunks must arrive in order and be exactly chunk_size long except the
+    last. A chunk resent after its response was lost gets a 409 carrying the
+    current offset, from which the browser continues.
+    """
+    if offset != upload.offset:
+        raise UploadError(f"Expected offset {upload.offset}, got {offset}", 409)
+    expected = min(upload.chunk_size, upload.size - offset)
+    if expected <= 0:
+        raise UploadError('Upload is already complete', 409)
+    if len(data) != expected:
+        raise UploadError(f"Chunk at offset {offset} must be {expected} bytes, got {len(data)}")
+    digest = base64.b64encode(hashlib.sha256(data).digest()).decode()
+    if checksum and checksum != digest:
+        raise UploadError(f"Checksum mismatch for chunk at offset {offset}")
+
+    _session_backend(upload).write_part(upload.storage_key, upload.storage_upload_id,
+                                        offset // upload.chunk_size + 1, offset, data, digest)
+
+    # Two requests for the same chunk write the same part; only the first one advances the offset
+    new_offset = offset + len(data)
+    UploadSession.query.filter_by(id=upload.id, offset=offset).update(
+        {'offset': new_offset, 'updated_at': datetime.utcnow()}, synchronize_session=False
+    )
+    db_session.commit()
+    return new_offset
+
+
+def _stored_checksum(backend, key):
+    """Base64 SHA-256 of a stored object, read back in chunks"""
+    stored = backend.open(key)
+    if stored is None:
+        return None
+    digest = hashlib.sha256()
+    try:
+        for chunk in stored.body:
+            digest.update(chunk)
+    finally:
+        stored.close()
+    return base64.b64encode(digest.digest()).decode()
+
+
+def complete_session(upload, checksum):
+    """
+    Publish a fully received upload whose whole-file SHA-256 (base64) is
+    checksum, and return its URL. The session row is deleted in the caller's
+    transaction, together with the record it creates.
+    """
+    if upload.offset != upload.size:
+        raise UploadError(f"Upload incomplete: {upload.offset} of {upload.size} bytes received", 409)
+    if not checksum:
+        raise UploadError('The SHA-256 of the whole file is required')
+    backend = _session_backend(upload)
+    url = backend.finish_upload(upload.storage_key, upload.storage_upload_id)
+    info = backend.head(upload.storage_key)
+    problem = None
+    if info is None or info.size != upload.size:
+        problem = 'Stored file does not match the upload size, please upload it again'
+    elif _stored_checksum(backend, upload.storage_key) != checksum:
+        problem = 'Stored file does not match the uploaded file, please upload it again'
+    if problem:
+        # The parts are assembled and cannot be resumed, so the session goes with the object
+        backend.delete(upload.storage_key)
+        db_session.delete(upload)
+        db_session.commit()
+        raise UploadError(problem)
+    db_session.delete(upload)
+    return url
+
+
+def abort_session(upload):
+    """Discard an upload's stored parts and its session"""
+    backend = get_backend(upload.backend)
+    try:
+        if backend:
+            backend.abort_upload(upload.storage_key, upload.storage_upload_id)
+    except Exception as e:
+        logger.warning(f"Error aborting upload session {upload.id}: {str(e)}")
+    db_session.delete(upload)
+    db_session.commit()
+
+
+def direct_upload_max_age():
+    """Seconds a direct upload token is accepted for: the presigned request's lifetime plus time to finish a slow upload"""
+    from app.core.settings_cache import get_setting_int
+    return get_setting_int('s3_presigned_expiry', 300) + 3600
+
+
+def claim_direct_upload(nonce):
+    """
+    Record a direct upload token as used, in the caller's transaction.
+
+    Returns:
+        False if the token was used before
+    """
+    from sqlalchemy.exc import IntegrityError
+    if not nonce:
+        return False
+    try:
+        with db_session.begin_nested():
+            db_session.add(DirectUploadToken(nonce=nonce))
+    except IntegrityError:
+        return False
+    return True
+
+
+def _remove_orphaned_parts(max_age_seconds):
+    """Delete local partial files no session refers to, left behind by crashes"""
+    folder = current_app.config.get('UPLOAD_PARTIAL_FOLDER')
+    if not folder or not os.path.isdir(folder):
+        return 0
+    active = {upload_id for (upload_id,) in db_session.query(UploadSession.storage_upload_id)
+              .filter(UploadSession.backend == 'local')}
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        upload_id = name[:-len('.part')] if name.endswith('.part') else None
+        if upload_id and upload_id not in active and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def cleanup_stale_upload_sessions(older_than_hours=24):
+    """
+    Abort upload sessions that received nothing for older_than_hours.
+
+    Returns:
+        Number of sessions aborted
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=older_than_hours)
+    stale = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    for upload in stale:
+        abort_session(upload)
+    removed = _remove_orphaned_parts(older_than_hours * 3600)
+    # Tokens past their max age are refused anyway, so their nonces need not be kept
+    DirectUploadToken.query.filter(
+        DirectUploadToken.created_at < datetime.utcnow() - timedelta(seconds=direct_upload_max_age())
+    ).delete(synchronize_session=False)
+    db_session.commit()
+    if stale or removed:
+        logger.info(f"Aborted {len(stale)} stale upload sessions, removed {removed} orphaned partial files")
+    return len(stale)
+
+
+@track_job('upload_session_cleanup')
+def run_upload_session_cleanup(app):
+    """Scheduled job: abort abandoned chunked uploads and forget expired direct upload tokens"""
+    from app.core.job_lock import job_lock
+
+    with app.app_context():
+        try:
+            with job_lock('upload_session_cleanup') as acquired:
+                if not acquired:
+                    return
+                cleanup_stale_upload_sessions(app.config.get('RESUMABLE_UPLOAD_EXPIRY_HOURS', 24))
+        except Exception as e:
+            db_session.rollback()
+            logger.error(f"Error cleaning up upload sessions: {str(e)}")
+        finally:
+            db_session.remove()
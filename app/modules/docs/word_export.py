@@ -10,7 +10,10 @@ import os
 import re
 from bs4 import BeautifulSoup
 from io import BytesIO
+from app.core.metrics import track_job
+from app.modules.docs.images import open_export_image, decode_data_image
 
+@track_job('word_render')
 def export_document_to_word(document, organization=None):
     """Export a document to Word format (supports both markdown and HTML, with images)"""
     # Create a new Document
@@ -209,12 +212,12 @@ def process_image(doc, element, app):
     if not src:
         return
     
-    # Get absolute file path
-    image_path = get_image_path(src, app)
-    if not image_path or not os.path.exists(image_path):
+    # Display variant of a pasted image, else the absolute file path
+    image_path = open_export_image(src) or get_image_path(src, app)
+    if not image_path:
         # If image not found, add a placeholder text
         para = doc.add_paragraph()
-        para.add_run(f'[Image: {src}]').italic = True
+        para.add_run(f'[Image: {image_label(src)}]').italic = True
         return
     
     try:
@@ -227,7 +230,7 @@ def process_image(doc, element, app):
     except Exception as e:
         # If image can't be added, add placeholder
         para = doc.add_paragraph()
-        para.add_run(f'[Image: {src} - Error: {str(e)}]').italic = True
+        para.add_run(f'[Image: {image_label(src)} - Error: {str(e)}]').italic = True
 
 def process_image_inline(para, element, app):
     """Process an image element inline"""
@@ -235,11 +238,11 @@ def process_image_inline(para, element, app):
     if not src:
         return
     
-    # Get absolute file path
-    image_path = get_image_path(src, app)
-    if not image_path or not os.path.exists(image_path):
+    # Display variant of a pasted image, else the absolute file path
+    image_path = open_export_image(src) or get_image_path(src, app)
+    if not image_path:
         # If image not found, add a placeholder text
-        para.add_run(f'[Image: {src}]').italic = True
+        para.add_run(f'[Image: {image_label(src)}]').italic = True
         return
     
     try:
@@ -249,7 +252,7 @@ def process_image_inline(para, element, app):
         run.add_picture(image_path, width=Inches(4))
     except Exception as e:
         # If image can't be added, add placeholder
-        para.add_run(f'[Image: {src} - Error: {str(e)}]').italic = True
+        para.add_run(f'[Image: {image_label(src)} - Error: {str(e)}]').italic = True
 
 def process_table(doc, element, app):
     """Process a table element"""
@@ -283,11 +286,16 @@ def process_table(doc, element, app):
                 else:
                     process_inline_elements(cell_para, cell, app)
 
+def image_label(src):
+    """Image src for placeholder text; inline data: URLs can be megabytes long"""
+    return 'inline image' if src.startswith('data:') else src
+
 def get_image_path(src, app):
-    """Convert image src to absolute file path"""
-    # If it's a data URL, return None (can't embed data URLs in Word easily)
+    """Convert image src to absolute file path (or the decoded image of a data: URL)"""
+    # Inline data: URL images are embedded from memory
     if src.startswith('data:'):
-        return None
+        image = decode_data_image(src)
+        return BytesIO(image[1]) if image else None
     
     # If it's a relative URL starting with /static/
     if src.startswith('/static/'):
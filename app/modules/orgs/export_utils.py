@@ -12,6 +12,7 @@ from app.modules.passwords.models import PasswordEntry
 from app.core.encryption import decrypt_data
 from app.modules.docs.pdf_export import export_document_to_pdf
 from app.modules.docs.word_export import export_document_to_word
+from app.core.metrics import track_job
 def html_to_markdown(html_content):
     """Convert HTML to Markdown (basic conversion)"""
     if not html_content:
@@ -138,13 +139,13 @@ def html_to_rtf(html_content):
     html_content = re.sub(r'<p[^>]*>(.*?)</p>', r'\\par\1\\par', html_content, flags=re.IGNORECASE)
     
     # Convert line breaks
-    html_content = re.sub(r'<br[^>]*>', '\\par', html_content, flags=re.IGNORECASE)
+    html_content = re.sub(r'<br[^>]*>', r'\\par', html_content, flags=re.IGNORECASE)
     
     # Convert lists
     html_content = re.sub(r'<ul[^>]*>', '', html_content, flags=re.IGNORECASE)
-    html_content = re.sub(r'</ul>', '\\par', html_content, flags=re.IGNORECASE)
+    html_content = re.sub(r'</ul>', r'\\par', html_content, flags=re.IGNORECASE)
     html_content = re.sub(r'<ol[^>]*>', '', html_content, flags=re.IGNORECASE)
-    html_content = re.sub(r'</ol>', '\\par', html_content, flags=re.IGNORECASE)
+    html_content = re.sub(r'</ol>', r'\\par', html_content, flags=re.IGNORECASE)
     html_content = re.sub(r'<li[^>]*>(.*?)</li>', r'\\par\\bullet \1', html_content, flags=re.IGNORECASE)
     
     # Convert blockquotes
@@ -222,6 +223,7 @@ def build_hierarchy_text(org_id):
     
     return "\n".join(lines)
 
+@track_job('org_export')
 def generate_org_export(org_id, export_job_id, db_session):
     """Generate the complete export for an organization"""
     try:
@@ -6,9 +6,6 @@ from app.core.auth import require_global_admin, require_org_access
 from app.core.activity_logger import log_activity
 from app import db_session
 import os
-from werkzeug.utils import secure_filename
-from datetime import datetime, timedelta
-from io import BytesIO
 import threading
 from app.modules.orgs.export_utils import generate_org_export
 
@@ -17,6 +14,17 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def logo_content_type(filename):
+    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    content_type_map = {
+        'jpg': 'image/jpeg',
+        'jpeg': 'image/jpeg',
+        'png': 'image/png',
+        'gif': 'image/gif',
+        'webp': 'image/webp'
+    }
+    return content_type_map.get(ext, 'image/jpeg')
+
 @bp.route('/')
 @login_required
 def index():
@@ -67,18 +75,12 @@ def create():
         if 'logo' in request.files:
             file = request.files['logo']
             if file and file.filename != '' and allowed_file(file.filename):
-                # Generate unique filename
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-                filename = secure_filename(file.filename)
-                filename = f'org_{timestamp}{filename}'
-                
-                upload_folder = current_app.config['UPLOAD_FOLDER']
-                os.makedirs(upload_folder, exist_ok=True)
-                filepath = os.path.join(upload_folder, filename)
-                file.save(filepath)
+                # Store logo in the blob store (S3 or local storage); a logo shared by several orgs is stored once
+                from app.core.blobs import store_blob
+                blob = store_blob(file.stream, file.filename, content_type=logo_content_type(file.filename))
                 
-                # Store relative path for URL generation
-                org.logo_path = url_for('static', filename=f'uploads/{filename}')
+                if blob:
+                    org.logo_path = blob.url
         
         db_session.add(org)
         db_session.commit()
@@ -144,33 +146,16 @@ def edit(org_id):
         if 'logo' in request.files:
             file = request.files['logo']
             if file and file.filename != '' and allowed_file(file.filename):
-                from app.core.s3_utils import upload_file, delete_file
-                
-                # Delete old logo if it exists
-                if org.logo_path:
-                    delete_file(org.logo_path)
-                
-                # Generate unique filename
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-                filename = secure_filename(file.filename)
-                filename = f'org_{org_id}_{timestamp}{filename}'
+                from app.core.blobs import store_blob, release_file
                 
-                # Determine content type
-                ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-                content_type_map = {
-                    'jpg': 'image/jpeg',
-                    'jpeg': 'image/jpeg',
-                    'png': 'image/png',
-                    'gif': 'image/gif',
-                    'webp': 'image/webp'
-                }
-                content_type = content_type_map.get(ext, 'image/jpeg')
+                # Store logo in the blob store (S3 or local storage)
+                blob = store_blob(file.stream, file.filename, content_type=logo_content_type(file.filename))
                 
-                # Upload file (to S3 or local storage)
-                logo_url = upload_file(file, filename, folder='uploads', content_type=content_type)
-                
-                if logo_url:
-                    org.logo_path = logo_url
+                if blob:
+                    # Release old logo if it exists; it is deleted once no other org uses it
+                    if org.logo_path:
+                        release_file(org.logo_path)
+                    org.logo_path = blob.url
         
         db_session.commit()
         
@@ -205,6 +190,12 @@ def delete(org_id):
     org = models.Organization.query.get(org_id)
     if not org:
         abort(404)
+    
+    # Release the org's stored files; shared ones stay for the orgs still using them
+    from app.core.blobs import release_file
+    for file_path in [org.logo_path] + [s.file_path for s in org.software] + [f.file_path for f in org.document_files]:
+        release_file(file_path)
+    
     db_session.delete(org)
     db_session.commit()
     
@@ -270,9 +261,16 @@ def view(org_id):
     # Create a dict for easy lookup
     contacts_dict = {contact.id: contact for contact in contacts}
     
-    # Count contacts and documents
+    # Count contacts, documents and users
     contact_count = Contact.query.filter_by(org_id=org_id).count()
     document_count = Document.query.filter_by(org_id=org_id).count()
+    user_count = models.User.query.filter_by(org_id=org_id).count()
+    
+    # Activity statistics from the daily rollups
+    from app.core.activity_rollups import get_activity_summary, get_daily_activity, get_top_users
+    activity_summary = get_activity_summary(org_id)
+    activity_daily = get_daily_activity(org_id)
+    activity_top_users = get_top_users(org_id)
     
     # Get locations for this org
     from app.modules.locations.models import Location
@@ -297,7 +295,8 @@ def view(org_id):
     from app.core.recent_visits import add_recent_visit
     add_recent_visit('org', org_id, org.name, url_for('orgs.view', org_id=org_id))
     
-    return render_template('modules/orgs/view.html', org=org, contacts=contacts_dict, export_job=export_job, contact_count=contact_count, document_count=document_count, locations=locations)
+    return render_template('modules/orgs/view.html', org=org, contacts=contacts_dict, export_job=export_job, contact_count=contact_count, document_count=document_count, user_count=user_count, locations=locations,
+                           activity_summary=activity_summary, activity_daily=activity_daily, activity_top_users=activity_top_users)
 
 @bp.route('/search')
 @login_required
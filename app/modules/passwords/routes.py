@@ -9,7 +9,6 @@ from app.core.sidebar_utils import build_document_tree
 from app import db_session
 from pyzbar.pyzbar import decode as pyzbar_decode
 from PIL import Image
-import io
 import base64
 
 @bp.route('/')
@@ -183,7 +182,7 @@ def parse_qr():
     
     try:
         # Read image
-        image = Image.open(io.BytesIO(file.read()))
+        image = Image.open(file.stream)
         
         # Decode QR code
         decoded_objects = pyzbar_decode(image)
@@ -7,6 +7,8 @@ from app.core.auth import require_global_admin, require_org_admin
 from app.core.activity_logger import log_activity
 from app import db_session
 
+ACTIVITY_PAGE_SIZE = 50
+
 @bp.route('/')
 @login_required
 @require_global_admin
@@ -116,19 +118,90 @@ def delete(user_id):
 @require_global_admin
 def activity(user_id):
     """View user activity logs"""
-    from flask import abort
+    from flask import abort, current_app
+    from datetime import timedelta
+    from app.core.audit import build_activity_query, fetch_activity_page
     user = models.User.query.get(user_id)
     if not user:
         abort(404)
     
-    # Get last 90 days of activity
-    from datetime import timedelta
-    cutoff_date = datetime.utcnow() - timedelta(days=90)
-    logs = models.ActivityLog.query.filter(
-        models.ActivityLog.user_id == user_id,
-        models.ActivityLog.timestamp >= cutoff_date
-    ).order_by(models.ActivityLog.timestamp.desc()).all()
+    # Page through the retention window newest first
+    cutoff_date = datetime.utcnow() - timedelta(days=current_app.config.get('ACTIVITY_LOG_RETENTION_DAYS', 90))
+    cursor = request.args.get('cursor')
+    query = build_activity_query(user_id=user_id, start=cutoff_date)
+    logs, next_cursor = fetch_activity_page(query, cursor, limit=ACTIVITY_PAGE_SIZE)
     
     log_activity('view', 'user', user_id, {'action': 'view_activity'})
-    return render_template('modules/users/activity.html', user=user, logs=logs)
+    return render_template('modules/users/activity.html', user=user, logs=logs, cursor=cursor, next_cursor=next_cursor)
 
+def _audit_filters():
+    """Read audit query filters from the request arguments"""
+    from app.core.audit import parse_datetime
+    return {
+        'user_id': request.args.get('user_id', type=int),
+        'org_id': request.args.get('org_id', type=int),
+        'action_type': request.args.get('action_type') or None,
+        'resource_type': request.args.get('resource_type') or None,
+        'start': parse_datetime(request.args.get('start')),
+        'end': parse_datetime(request.args.get('end'))
+    }
+
+@bp.route('/audit')
+@login_required
+@require_global_admin
+def audit():
+    """Query activity logs as JSON (keyset paginated)"""
+    from app.core.audit import build_activity_query, fetch_activity_page, serialize_log
+    
+    filters = _audit_filters()
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    logs, next_cursor = fetch_activity_page(build_activity_query(**filters), request.args.get('cursor'), limit=limit)
+    
+    return jsonify({
+        'results': [serialize_log(log) for log in logs],
+        'next_cursor': next_cursor
+    })
+
+@bp.route('/audit/export')
+@login_required
+@require_global_admin
+def audit_export():
+    """Stream matching activity logs as CSV"""
+    import csv
+    import json
+    from io import StringIO
+    from flask import Response, stream_with_context
+    from app.core.audit import build_activity_query
+    
+    filters = _audit_filters()
+    log_activity('view', 'audit', None, {'action': 'export_csv', 'filters': {k: str(v) for k, v in filters.items() if v is not None}})
+    query = build_activity_query(**filters).yield_per(1000)
+    
+    def generate():
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['id', 'timestamp', 'user_id', 'org_id', 'action_type', 'resource_type', 'resource_id', 'ip_address', 'details'])
+        for log in query:
+            writer.writerow([
+                log.id,
+                log.timestamp.isoformat() if log.timestamp else '',
+                log.user_id,
+                log.org_id or '',
+                log.action_type,
+                log.resource_type,
+                log.resource_id or '',
+                log.ip_address or '',
+                json.dumps(log.details) if log.details else ''
+            ])
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    filename = f"activity_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
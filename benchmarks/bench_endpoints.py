@@ -0,0 +1,223 @@
+"""
+Endpoint benchmark suite.
+
+Runs the hot pages in-process through Flask's test client against the
+database configured for the app (normally one filled by
+generate_dataset.py) and reports, per scenario: latency percentiles, SQL
+statements per request and peak Python memory allocated per request.
+
+Results can be saved as JSON and compared with a previous run; the script
+exits with status 1 when a scenario got slower or issues more queries than
+the baseline by more than --tolerance.
+
+Usage:
+    DATABASE_URL=sqlite:////tmp/bench.db ENCRYPTION_KEY=... \\
+        python benchmarks/bench_endpoints.py --iterations 20 --save before.json
+    ... python benchmarks/bench_endpoints.py --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from generate_dataset import ADMIN_USERNAME, ADMIN_PASSWORD
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def pick_targets(db_session, org_id=None):
+    """Choose the org, documents, folder and search term the scenarios use"""
+    from sqlalchemy import func
+    from app.modules.docs.models import Document, DocumentFolder, DocumentFile
+
+    if org_id is None:
+        org_id = db_session.query(Document.org_id).group_by(Document.org_id) \
+            .order_by(func.count(Document.id).desc()).limit(1).scalar()
+    if org_id is None:
+        raise SystemExit('No documents found; run generate_dataset.py first')
+
+    largest_doc = db_session.query(Document.id).filter(Document.org_id == org_id) \
+        .order_by(func.length(Document.content).desc()).limit(1).scalar()
+    typical_doc = db_session.query(Document.id).filter(Document.org_id == org_id) \
+        .order_by(Document.id).limit(1).scalar()
+
+    # Deepest folder: walk parent ids in memory
+    parents = dict(db_session.query(DocumentFolder.id, DocumentFolder.parent_id).filter(DocumentFolder.org_id == org_id).all())
+
+    def depth(folder_id):
+        level = 0
+        while parents.get(folder_id):
+            folder_id = parents[folder_id]
+            level += 1
+        return level
+    deepest_folder = max(parents, key=depth) if parents else None
+    file_id = db_session.query(DocumentFile.id).filter(DocumentFile.org_id == org_id).limit(1).scalar()
+    return {'org_id': org_id, 'largest_doc': largest_doc, 'typical_doc': typical_doc,
+            'deepest_folder': deepest_folder, 'file_id': file_id}
+
+
+def build_scenarios(targets, include_exports):
+    t = targets
+    scenarios = [
+        ('docs_index', 'GET', '/docs/'),
+        ('doc_view', 'GET', f"/docs/{t['typical_doc']}"),
+        ('doc_view_large', 'GET', f"/docs/{t['largest_doc']}"),
+        ('folder_view_deep', 'GET', f"/docs/folder/{t['deepest_folder']}" if t['deepest_folder'] else None),
+        ('search', 'GET', '/search/?q=firewall'),
+        ('org_view', 'GET', f"/orgs/{t['org_id']}"),
+        ('orgs_index', 'GET', '/orgs/'),
+        ('dashboard', 'GET', '/dashboard'),
+        ('file_download', 'GET', f"/docs/file/{t['file_id']}/download" if t['file_id'] else None),
+    ]
+    if include_exports:
+        scenarios += [
+            ('pdf_export', 'GET', f"/docs/{t['largest_doc']}/export"),
+            ('word_export', 'GET', f"/docs/{t['largest_doc']}/export-word"),
+        ]
+    return [s for s in scenarios if s[2]]
+
+
+def run_org_export(client, org_id, timeout=600):
+    """Start a full org export and wait for it to finish; returns (seconds, status)"""
+    start = time.perf_counter()
+    response = client.post(f'/orgs/{org_id}/export/start')
+    data = response.get_json(silent=True) or {}
+    job_id = data.get('export_job_id')
+    if not job_id:
+        return time.perf_counter() - start, f"start failed ({response.status_code})"
+    while time.perf_counter() - start < timeout:
+        status = (client.get(f'/orgs/{org_id}/export/status').get_json(silent=True) or {}).get('status')
+        if status in ('completed', 'failed', 'cancelled'):
+            return time.perf_counter() - start, status
+        time.sleep(0.2)
+    return time.perf_counter() - start, 'timeout'
+
+
+def run(args):
+    from sqlalchemy import event
+    from app import create_app
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    from app import db_session, db_engine
+    query_count = [0]
+
+    @event.listens_for(db_engine, 'before_cursor_execute')
+    def count_query(*_):
+        query_count[0] += 1
+
+    with app.app_context():
+        targets = pick_targets(db_session, args.org_id)
+    print(f"Targets: {targets}")
+
+    client = app.test_client()
+    response = client.post('/login', data={'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD})
+    if response.status_code != 302:
+        raise SystemExit(f'Login as {ADMIN_USERNAME} failed; run generate_dataset.py first')
+    client.post(f"/orgs/switch/{targets['org_id']}")
+
+    results = {}
+    for name, method, url in build_scenarios(targets, args.exports):
+        latencies, queries, statuses = [], [], set()
+        for i in range(args.warmup + args.iterations):
+            query_count[0] = 0
+            start = time.perf_counter()
+            response = client.open(url, method=method)
+            response.get_data()
+            elapsed = time.perf_counter() - start
+            response.close()
+            if i >= args.warmup:
+                latencies.append(elapsed * 1000)
+                queries.append(query_count[0])
+                statuses.add(response.status_code)
+
+        # Separate pass for memory so tracing does not distort the latencies
+        tracemalloc.start()
+        peaks = []
+        for _ in range(args.memory_iterations):
+            tracemalloc.reset_peak()
+            response = client.open(url, method=method)
+            response.get_data()
+            response.close()
+            peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+        tracemalloc.stop()
+
+        results[name] = {
+            'url': url,
+            'status': sorted(statuses),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'mean_ms': round(statistics.mean(latencies), 2),
+            'queries': int(statistics.median(queries)),
+            'peak_kb': round(max(peaks), 1) if peaks else None
+        }
+        r = results[name]
+        print(f"{name:<18} p50 {r['p50_ms']:>8.1f} ms  p95 {r['p95_ms']:>8.1f} ms  "
+              f"queries {r['queries']:>5}  peak {r['peak_kb'] or 0:>9.1f} KB  status {r['status']}")
+
+    if args.exports:
+        seconds, status = run_org_export(client, targets['org_id'])
+        results['org_export'] = {'url': f"/orgs/{targets['org_id']}/export/start", 'status': [status],
+                                 'p50_ms': round(seconds * 1000, 2), 'p95_ms': round(seconds * 1000, 2),
+                                 'mean_ms': round(seconds * 1000, 2), 'queries': None, 'peak_kb': None}
+        print(f"{'org_export':<18} {seconds:.1f} s ({status})")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print differences against a baseline run and return the regressed scenarios"""
+    regressions = []
+    print(f"\n{'scenario':<18} {'p50 before':>11} {'p50 after':>10} {'change':>8} {'queries':>14}")
+    for name, after in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        change = (after['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0.0
+        query_text = f"{before['queries']} -> {after['queries']}" if after.get('queries') is not None else '-'
+        print(f"{name:<18} {before['p50_ms']:>11.1f} {after['p50_ms']:>10.1f} {change:>+7.1f}% {query_text:>14}")
+        if change > tolerance or (after.get('queries') or 0) > (before.get('queries') or 0) * (1 + tolerance / 100.0):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--memory-iterations', type=int, default=3)
+    parser.add_argument('--org-id', type=int, default=None, help='Org to benchmark (default: the one with most documents)')
+    parser.add_argument('--exports', action='store_true', help='Also benchmark PDF, Word and full org exports')
+    parser.add_argument('--save', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Compare against a JSON file from --save')
+    parser.add_argument('--tolerance', type=float, default=20.0, help='Allowed slowdown in percent before failing --compare')
+    args = parser.parse_args()
+
+    results = run(args)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Microbenchmark for the IP whitelist check.
+
+Builds a whitelist of 1,000 entries (a mix of IPv4/IPv6 CIDRs and single
+addresses) and compares the compiled interval lookup in
+app.core.ip_whitelist against the previous parse-and-scan implementation.
+
+Usage:
+    python benchmarks/bench_ip_whitelist.py [--entries 1000] [--lookups 20000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import ipaddress
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.ip_whitelist import is_ip_allowed, compile_whitelist
+
+
+def linear_is_ip_allowed(ip_address, whitelist):
+    """The original implementation: parse every entry and scan on each call"""
+    client_ip_obj = ipaddress.ip_address(ip_address)
+    entries = []
+    for line in whitelist.split('\n'):
+        entries.extend([e.strip() for e in line.split(',') if e.strip()])
+    for entry in entries:
+        try:
+            if '/' in entry:
+                if client_ip_obj in ipaddress.ip_network(entry, strict=False):
+                    return True
+            elif client_ip_obj == ipaddress.ip_address(entry):
+                return True
+        except ValueError:
+            continue
+    return False
+
+
+def build_whitelist(count, rng):
+    entries = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            entries.append(f"10.{rng.randrange(256)}.{rng.randrange(256)}.0/24")
+        elif kind == 1:
+            entries.append(str(ipaddress.IPv4Address(rng.getrandbits(32))))
+        elif kind == 2:
+            entries.append(f"2001:db8:{rng.randrange(65536):x}::/48")
+        else:
+            entries.append(str(ipaddress.IPv6Address((0x20010db8 << 96) | rng.getrandbits(96))))
+    return '\n'.join(entries)
+
+
+def build_lookups(count, rng):
+    lookups = []
+    for i in range(count):
+        if i % 2:
+            lookups.append(f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}")
+        else:
+            lookups.append(f"2001:db8:{rng.randrange(65536):x}::{rng.randrange(65536):x}")
+    return lookups
+
+
+def timed(func, whitelist, lookups):
+    start = time.perf_counter()
+    allowed = sum(1 for ip in lookups if func(ip, whitelist))
+    return time.perf_counter() - start, allowed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=1000)
+    parser.add_argument('--lookups', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    whitelist = build_whitelist(args.entries, rng)
+    lookups = build_lookups(args.lookups, rng)
+
+    start = time.perf_counter()
+    compile_whitelist.cache_clear()
+    compile_whitelist(whitelist)
+    compile_time = time.perf_counter() - start
+
+    compiled_time, compiled_allowed = timed(is_ip_allowed, whitelist, lookups)
+    # The linear scan is slow, so time it on a slice and extrapolate
+    sample = lookups[:max(1, min(len(lookups), 1000))]
+    linear_time, linear_allowed = timed(linear_is_ip_allowed, whitelist, sample)
+    compiled_sample_allowed = sum(1 for ip in sample if is_ip_allowed(ip, whitelist))
+    assert linear_allowed == compiled_sample_allowed, 'compiled and linear results differ'
+
+    per_compiled = compiled_time / len(lookups) * 1e6
+    per_linear = linear_time / len(sample) * 1e6
+    print(f"entries:            {args.entries}")
+    print(f"compile (once):     {compile_time * 1000:.2f} ms")
+    print(f"compiled lookup:    {per_compiled:.2f} us/check ({compiled_allowed}/{len(lookups)} allowed)")
+    print(f"linear scan:        {per_linear:.2f} us/check (sampled {len(sample)})")
+    print(f"speedup:            {per_linear / per_compiled:.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+S3 operation latency benchmark.
+
+Times the S3 calls behind uploads and downloads (put, head, get, presign,
+delete) against the bucket configured on the settings page, which may be
+AWS or an S3-compatible store such as MinIO or moto_server (set its
+Endpoint URL). Two client strategies are measured:
+
+    per-call  a new boto3 client with default settings for every operation,
+              as get_s3_client() used to build
+    cached    the shared, pooled client from get_s3_client() with the
+              TransferConfig from get_transfer_config()
+
+Each operation's time includes getting the client, so the per-call figures
+show what client construction and lost connection reuse cost. --threads
+runs the iterations concurrently to exercise the connection pool.
+
+Results can be saved as JSON and compared with a previous run; the script
+exits with status 1 when an operation got slower than the baseline by more
+than --tolerance.
+
+Usage:
+    DATABASE_URL=sqlite:////tmp/bench.db ENCRYPTION_KEY=... \\
+        python benchmarks/bench_s3.py --iterations 50 --threads 8 --save s3.json
+    ... python benchmarks/bench_s3.py --mode cached --compare s3.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bench_endpoints import percentile
+
+OPERATIONS = ('put', 'head', 'get', 'presign', 'delete')
+
+
+def per_call_client():
+    """Build a client the way get_s3_client() did before clients were cached"""
+    import boto3
+    from app.core.settings_cache import get_setting, get_settings
+    settings = get_settings(['s3_access_key', 's3_secret_key', 's3_region', 's3_bucket'])
+    client = boto3.session.Session().client(
+        's3',
+        aws_access_key_id=settings['s3_access_key'],
+        aws_secret_access_key=settings['s3_secret_key'],
+        region_name=settings['s3_region'],
+        endpoint_url=get_setting('s3_endpoint_url')
+    )
+    return client, settings['s3_bucket'], None
+
+
+def cached_client():
+    from app.core.s3_utils import get_s3_client, get_transfer_config
+    client, bucket = get_s3_client()
+    return client, bucket, get_transfer_config()
+
+
+def run_iteration(get_client, payload, timings, lock):
+    """Run every operation once on a fresh key and record the latencies in ms"""
+    key = f"bench/s3/{uuid.uuid4().hex}.bin"
+    steps = {
+        'put': lambda c, b, t: c.upload_fileobj(io.BytesIO(payload), b, key, **({'Config': t} if t else {})),
+        'head': lambda c, b, t: c.head_object(Bucket=b, Key=key),
+        'get': lambda c, b, t: c.get_object(Bucket=b, Key=key)['Body'].read(),
+        'presign': lambda c, b, t: c.generate_presigned_url('get_object', Params={'Bucket': b, 'Key': key}, ExpiresIn=300),
+        'delete': lambda c, b, t: c.delete_object(Bucket=b, Key=key),
+    }
+    for name in OPERATIONS:
+        start = time.perf_counter()
+        client, bucket, transfer_config = get_client()
+        steps[name](client, bucket, transfer_config)
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            timings[name].append(elapsed)
+
+
+def run_mode(app, mode, args, payload):
+    get_client = per_call_client if mode == 'per-call' else cached_client
+    timings = {name: [] for name in OPERATIONS}
+    lock = threading.Lock()
+
+    def worker(i):
+        with app.app_context():
+            run_iteration(get_client, payload, timings, lock)
+
+    with app.app_context():
+        # Warm up outside the timed runs (settings cache, first connection)
+        for _ in range(args.warmup):
+            run_iteration(get_client, payload, {name: [] for name in OPERATIONS}, lock)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(worker, range(args.iterations)))
+    wall = time.perf_counter() - start
+
+    results = {}
+    for name in OPERATIONS:
+        values = timings[name]
+        results[f"{mode}/{name}"] = {
+            'p50_ms': round(percentile(values, 50), 2),
+            'p95_ms': round(percentile(values, 95), 2),
+            'mean_ms': round(statistics.mean(values), 2),
+        }
+        r = results[f"{mode}/{name}"]
+        print(f"{mode + '/' + name:<18} p50 {r['p50_ms']:>8.1f} ms  p95 {r['p95_ms']:>8.1f} ms  mean {r['mean_ms']:>8.1f} ms")
+    print(f"{mode + '/total':<18} {args.iterations} iterations in {wall:.2f} s "
+          f"({args.iterations * len(OPERATIONS) / wall:.0f} ops/s with {args.threads} threads)\n")
+    return results
+
+
+def run(args):
+    from app import create_app
+    app = create_app()
+    from app.core.s3_utils import get_s3_client
+
+    with app.app_context():
+        if not get_s3_client():
+            raise SystemExit('S3 is not enabled and configured; set it up on the settings page first')
+
+    payload = os.urandom(args.size_kb * 1024)
+    modes = ('per-call', 'cached') if args.mode == 'both' else (args.mode,)
+    results = {}
+    for mode in modes:
+        results.update(run_mode(app, mode, args, payload))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print differences against a baseline run and return the regressed operations"""
+    regressions = []
+    print(f"{'operation':<18} {'p50 before':>11} {'p50 after':>10} {'change':>8}")
+    for name, after in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        change = (after['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0.0
+        print(f"{name:<18} {before['p50_ms']:>11.1f} {after['p50_ms']:>10.1f} {change:>+7.1f}%")
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('per-call', 'cached', 'both'), default='both')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=1, help='Iterations run concurrently')
+    parser.add_argument('--size-kb', type=int, default=64, help='Size of each test object')
+    parser.add_argument('--save', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Compare against a JSON file from --save')
+    parser.add_argument('--tolerance', type=float, default=20.0, help='Allowed slowdown in percent before failing --compare')
+    args = parser.parse_args()
+
+    results = run(args)
+
+    if args.mode == 'both':
+        print(f"{'operation':<10} {'per-call p50':>13} {'cached p50':>11} {'speedup':>8}")
+        for name in OPERATIONS:
+            before, after = results[f"per-call/{name}"]['p50_ms'], results[f"cached/{name}"]['p50_ms']
+            print(f"{name:<10} {before:>13.1f} {after:>11.1f} {before / after if after else 0:>7.1f}x")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+S3 upload throughput benchmark.
+
+Uploads one large file through S3Backend.put() with a grid of part sizes and
+transfer concurrencies and reports MB/s for each, next to boto3's default
+transfer settings without checksum verification (what software uploads used
+before). It does not need the app database: by default it starts moto's
+in-process S3 server as a local object-store stand-in; point --endpoint-url
+at MinIO (or leave moto out and give AWS credentials in the environment) for
+figures closer to production.
+
+Usage:
+    python benchmarks/bench_s3_upload.py --size-mb 512 --part-mb 8,16,64 --concurrency 1,4,10
+    python benchmarks/bench_s3_upload.py --endpoint-url http://localhost:9000 --bucket bench
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+MB = 1024 * 1024
+
+
+def start_moto(port):
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        raise SystemExit('moto is not installed; pip install "moto[server]" or pass --endpoint-url')
+    server = ThreadedMotoServer(port=port, verbose=False)
+    server.start()
+    return server, f"http://127.0.0.1:{port}"
+
+
+def make_file(size):
+    """Random test file on disk, like the spooled request body an upload arrives in"""
+    f = tempfile.TemporaryFile()
+    block = os.urandom(MB)
+    for _ in range(size // MB):
+        f.write(block)
+    f.write(block[:size % MB])
+    f.seek(0)
+    return f
+
+
+def time_upload(backend, f, size, runs):
+    """Best of runs, in MB/s"""
+    best = None
+    for _ in range(runs):
+        key = f"bench/upload/{uuid.uuid4().hex}.bin"
+        f.seek(0)
+        start = time.perf_counter()
+        backend.put(key, f, 'application/octet-stream')
+        elapsed = time.perf_counter() - start
+        backend.delete(key)
+        best = elapsed if best is None else min(best, elapsed)
+    return size / MB / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--part-mb', default='8,16,64', help='Comma-separated part sizes to try')
+    parser.add_argument('--concurrency', default='1,4,10', help='Comma-separated transfer concurrencies to try')
+    parser.add_argument('--runs', type=int, default=2, help='Uploads per configuration; the fastest counts')
+    parser.add_argument('--endpoint-url', help='S3-compatible endpoint (default: start a moto server)')
+    parser.add_argument('--moto-port', type=int, default=5059)
+    parser.add_argument('--bucket', default='infogarden-bench')
+    parser.add_argument('--region', default='us-east-1')
+    args = parser.parse_args()
+
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from boto3.s3.transfer import TransferConfig
+    from app.core.storage import S3Backend
+
+    server = None
+    endpoint_url = args.endpoint_url
+    if not endpoint_url:
+        server, endpoint_url = start_moto(args.moto_port)
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+
+    part_sizes = [int(v) for v in args.part_mb.split(',')]
+    concurrencies = [int(v) for v in args.concurrency.split(',')]
+    client = boto3.session.Session().client(
+        's3', region_name=args.region, endpoint_url=endpoint_url,
+        config=BotoConfig(max_pool_connections=max(concurrencies + [10]))
+    )
+    try:
+        client.create_bucket(Bucket=args.bucket)
+    except (client.exceptions.BucketAlreadyOwnedByYou, client.exceptions.BucketAlreadyExists):
+        pass
+
+    size = args.size_mb * MB
+    f = make_file(size)
+    try:
+        print(f"Uploading {args.size_mb} MB to {endpoint_url}/{args.bucket}, best of {args.runs}\n")
+        baseline = S3Backend(client, args.bucket, endpoint_url=endpoint_url)
+        baseline_rate = time_upload(baseline, f, size, args.runs)
+        print(f"{'boto3 defaults, no checksum':<34} {baseline_rate:>8.1f} MB/s")
+
+        print(f"\n{'part size':>10} {'concurrency':>12} {'verified MB/s':>14} {'vs default':>11}")
+        for part_mb in part_sizes:
+            for concurrency in concurrencies:
+                config = TransferConfig(multipart_threshold=part_mb * MB, multipart_chunksize=part_mb * MB,
+                                        max_concurrency=concurrency, use_threads=True)
+                backend = S3Backend(client, args.bucket, endpoint_url=endpoint_url, transfer_config=config,
+                                    verify_checksums=True)
+                rate = time_upload(backend, f, size, args.runs)
+                print(f"{part_mb:>8} MB {concurrency:>12} {rate:>14.1f} {rate / baseline_rate:>10.2f}x")
+    finally:
+        f.close()
+        if server:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
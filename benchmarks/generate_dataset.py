@@ -0,0 +1,289 @@
+"""
+Synthetic multi-tenant dataset generator.
+
+Fills the database configured for the app (DATABASE_URL or DB_* variables,
+e.g. DATABASE_URL=sqlite:////tmp/bench.db as a local stand-in for MySQL)
+with MSP-style data: organizations, users, deep DocumentFolder trees,
+markdown documents with code blocks and tables, contacts (some pinned),
+encrypted passwords, locations, software and document files.
+
+Rows are bulk inserted with explicit primary keys so the script works the
+same on MySQL and SQLite. Output is deterministic for a given --seed.
+
+Usage:
+    ENCRYPTION_KEY=... DATABASE_URL=sqlite:////tmp/bench.db \\
+        python benchmarks/generate_dataset.py --orgs 300 --docs 100000
+
+Afterwards log in as bench_admin / bench-password (global admin).
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+ADMIN_USERNAME = 'bench_admin'
+ADMIN_PASSWORD = 'bench-password'
+
+WORDS = (
+    'firewall vpn switch router backup restore domain controller dns dhcp exchange tenant mailbox '
+    'printer scanner workstation laptop server hypervisor cluster storage nas san replication '
+    'license renewal vendor contract onboarding offboarding password policy mfa conditional access '
+    'patch update rollout inventory asset ticket escalation runbook procedure checklist outage '
+    'monitoring alert threshold certificate expiry wifi ssid vlan subnet gateway ups rack cabling'
+).split()
+
+FOLDER_NAMES = [
+    'Infrastructure', 'Network', 'Servers', 'Workstations', 'Cloud', 'Microsoft 365', 'Security',
+    'Backups', 'Vendors', 'Procedures', 'Onboarding', 'Offboarding', 'Printers', 'Phones',
+    'Licensing', 'Site Notes', 'Projects', 'Archive', 'Runbooks', 'Monitoring'
+]
+
+CODE_SNIPPETS = [
+    ('powershell', 'Get-ADUser -Filter * -Properties LastLogonDate |\n    Where-Object { $_.LastLogonDate -lt (Get-Date).AddDays(-90) } |\n    Select-Object Name, LastLogonDate'),
+    ('bash', 'rsync -avz --delete /srv/share/ backup@nas01:/volume1/share/\nsystemctl restart smbd'),
+    ('cisco', 'interface GigabitEthernet0/1\n description Uplink to core\n switchport mode trunk\n switchport trunk allowed vlan 10,20,30'),
+    ('json', '{\n  "ssid": "CorpWiFi",\n  "vlan": 20,\n  "auth": "wpa2-enterprise"\n}'),
+]
+
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn', 'Drew', 'Rowan']
+LAST_NAMES = ['Smith', 'Garcia', 'Nguyen', 'Patel', 'Kim', 'Brown', 'Lopez', 'Müller', 'Rossi', 'Cohen', 'Okafor', 'Silva']
+COMPANY_SUFFIXES = ['Dental', 'Law Group', 'Logistics', 'Clinic', 'Manufacturing', 'Realty', 'Accounting', 'Foundation', 'Labs', 'Architects']
+
+
+def sentence(rng, low=6, high=16):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(low, high))]
+    return ' '.join(words).capitalize() + '.'
+
+
+def markdown_document(rng, target_size):
+    """Markdown body with headings, lists, tables and code blocks, roughly target_size characters"""
+    parts = [f"# {sentence(rng, 2, 5)[:-1]}\n", sentence(rng) + ' ' + sentence(rng) + '\n']
+    size = sum(len(p) for p in parts)
+    while size < target_size:
+        kind = rng.random()
+        if kind < 0.35:
+            block = ' '.join(sentence(rng) for _ in range(rng.randint(2, 6))) + '\n'
+        elif kind < 0.55:
+            block = f"\n## {sentence(rng, 2, 4)[:-1]}\n"
+        elif kind < 0.75:
+            block = '\n'.join(f"- {sentence(rng, 3, 8)}" for _ in range(rng.randint(3, 7))) + '\n'
+        elif kind < 0.9:
+            language, code = rng.choice(CODE_SNIPPETS)
+            block = f"\n```{language}\n{code}\n```\n"
+        else:
+            rows = '\n'.join(f"| {rng.choice(WORDS)} | 10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)} | {rng.choice(WORDS)} |"
+                             for _ in range(rng.randint(2, 6)))
+            block = f"\n| Device | IP | Role |\n|---|---|---|\n{rows}\n"
+        parts.append(block)
+        size += len(block)
+    return '\n'.join(parts)
+
+
+def next_id(session, model):
+    from sqlalchemy import func
+    return (session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def bulk_insert(session, model, rows, batch_size):
+    from sqlalchemy import insert
+    for start in range(0, len(rows), batch_size):
+        session.execute(insert(model.__table__), rows[start:start + batch_size])
+        session.commit()
+
+
+def write_sample_files(upload_folder):
+    """Create a few real files of different sizes that generated rows point at"""
+    samples = []
+    for folder, name, size, mime in [
+        ('documents', 'bench_network_diagram.pdf', 256 * 1024, 'application/pdf'),
+        ('documents', 'bench_rack_photo.jpg', 1024 * 1024, 'image/jpeg'),
+        ('documents', 'bench_contract.pdf', 4 * 1024 * 1024, 'application/pdf'),
+        ('software', 'bench_agent_installer.msi', 16 * 1024 * 1024, 'application/octet-stream'),
+    ]:
+        path = os.path.join(upload_folder, folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path) or os.path.getsize(path) != size:
+            with open(path, 'wb') as f:
+                chunk = os.urandom(64 * 1024)
+                for _ in range(size // len(chunk)):
+                    f.write(chunk)
+        samples.append({'folder': folder, 'name': name, 'size': size, 'mime': mime,
+                        'url': f"/static/uploads/{folder}/{name}"})
+    return samples
+
+
+def generate(args):
+    from app import create_app
+    app = create_app()
+
+    with app.app_context():
+        from app import db_session
+        from app.core import models
+        from app.core.encryption import encrypt_data
+        from app.modules.docs.models import Document, DocumentFolder, Software, DocumentFile
+        from app.modules.contacts.models import Contact
+        from app.modules.passwords.models import PasswordEntry
+        from app.modules.locations.models import Location
+        from werkzeug.security import generate_password_hash
+
+        rng = random.Random(args.seed)
+        now = datetime.utcnow()
+        started = time.perf_counter()
+        password_hash = generate_password_hash(ADMIN_PASSWORD)
+        samples = write_sample_files(app.config['UPLOAD_FOLDER'])
+
+        # Organizations
+        org_start = next_id(db_session, models.Organization)
+        orgs = [{
+            'id': org_start + i,
+            'name': f"{rng.choice(LAST_NAMES)} {rng.choice(COMPANY_SUFFIXES)} {org_start + i}",
+            'description': sentence(rng),
+            'status': 'active' if rng.random() < 0.9 else 'inactive',
+            'must_knows': sentence(rng) + ' ' + sentence(rng),
+            'custom_links': [{'label': 'Portal', 'url': f"https://portal{org_start + i}.example.com"}],
+            'created_at': now - timedelta(days=rng.randint(30, 2000))
+        } for i in range(args.orgs)]
+        org_ids = [org['id'] for org in orgs]
+
+        # Users: one global admin plus a few users per org
+        user_start = next_id(db_session, models.User)
+        users = []
+        if not models.User.query.filter_by(username=ADMIN_USERNAME).first():
+            users.append({'id': user_start, 'username': ADMIN_USERNAME, 'email': f'{ADMIN_USERNAME}@example.com',
+                          'password_hash': password_hash, 'role': 'global_admin', 'org_id': None, 'created_at': now})
+        for org_id in org_ids:
+            for _ in range(args.users_per_org):
+                user_id = user_start + len(users)
+                users.append({'id': user_id, 'username': f'bench_user_{user_id}', 'email': f'bench_user_{user_id}@example.com',
+                              'password_hash': password_hash, 'role': rng.choice(['it_basic', 'it_admin', 'account_manager']),
+                              'org_id': org_id, 'created_at': now})
+        admin_id = users[0]['id'] if users and users[0]['username'] == ADMIN_USERNAME else \
+            models.User.query.filter_by(username=ADMIN_USERNAME).first().id
+
+        # Contacts, some pinned on the org page
+        contact_start = next_id(db_session, Contact)
+        contacts = []
+        for org in orgs:
+            pinned = []
+            for _ in range(args.contacts_per_org):
+                contact_id = contact_start + len(contacts)
+                name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+                contacts.append({'id': contact_id, 'org_id': org['id'], 'name': name, 'role': rng.choice(['Owner', 'Office Manager', 'IT Contact', 'CFO']),
+                                 'email': f"contact{contact_id}@example.com", 'phone': f"555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}",
+                                 'notes': sentence(rng), 'emergency_contact': rng.random() < 0.2, 'created_at': now})
+                if len(pinned) < 5 and rng.random() < 0.3:
+                    pinned.append({'contact_id': contact_id, 'note': sentence(rng, 3, 6)})
+            org['pinned_contacts'] = pinned
+
+        # Folder trees: a few roots per org, each branching down to --folder-depth levels
+        folder_start = next_id(db_session, DocumentFolder)
+        folders = []
+        folders_by_org = {}
+        for org_id in org_ids:
+            org_folders = []
+            level = [None]
+            for depth in range(args.folder_depth):
+                next_level = []
+                for parent_id in level:
+                    for _ in range(args.folder_fanout if depth else args.root_folders):
+                        if len(org_folders) >= args.max_folders_per_org:
+                            break
+                        folder_id = folder_start + len(folders)
+                        folders.append({'id': folder_id, 'org_id': org_id, 'parent_id': parent_id,
+                                        'name': f"{rng.choice(FOLDER_NAMES)} {folder_id}", 'created_by': admin_id,
+                                        'created_at': now, 'updated_at': now})
+                        org_folders.append(folder_id)
+                        next_level.append(folder_id)
+                level = next_level
+            folders_by_org[org_id] = org_folders
+
+        # Documents spread unevenly over orgs (a few large tenants, many small ones)
+        weights = [1.0 / (rank + 1) ** 0.8 for rank in range(len(org_ids))]
+        document_start = next_id(db_session, Document)
+        documents = []
+        for i in range(args.docs):
+            org_id = rng.choices(org_ids, weights)[0]
+            org_folders = folders_by_org[org_id]
+            size = int(min(rng.lognormvariate(8, 0.9), 60000))
+            documents.append({'id': document_start + i, 'org_id': org_id,
+                              'folder_id': rng.choice(org_folders) if org_folders and rng.random() < 0.85 else None,
+                              'title': sentence(rng, 2, 6)[:-1], 'content': markdown_document(rng, size),
+                              'content_type': 'markdown', 'created_by': admin_id, 'updated_by': admin_id,
+                              'created_at': now - timedelta(days=rng.randint(0, 1000)), 'updated_at': now})
+
+        # Passwords, locations, software and document files
+        password_start = next_id(db_session, PasswordEntry)
+        location_start = next_id(db_session, Location)
+        software_start = next_id(db_session, Software)
+        file_start = next_id(db_session, DocumentFile)
+        passwords, locations, software, files = [], [], [], []
+        for org_id in org_ids:
+            for _ in range(args.passwords_per_org):
+                passwords.append({'id': password_start + len(passwords), 'org_id': org_id, 'title': f"{rng.choice(WORDS).title()} admin",
+                                  'link': f"https://{rng.choice(WORDS)}.example.com", 'username': 'administrator',
+                                  'encrypted_password': encrypt_data(f"pw-{rng.getrandbits(64):x}"), 'date_added': now, 'created_by': admin_id})
+            for _ in range(args.locations_per_org):
+                locations.append({'id': location_start + len(locations), 'org_id': org_id, 'name': f"{rng.choice(['HQ', 'Branch', 'Warehouse', 'Clinic'])} {len(locations)}",
+                                  'address': f"{rng.randint(1, 9999)} Main St", 'city': 'Springfield', 'state': 'IL', 'zip_code': '62701',
+                                  'country': 'USA', 'notes': sentence(rng), 'created_at': now})
+            for _ in range(args.software_per_org):
+                sample = samples[-1]
+                software.append({'id': software_start + len(software), 'org_id': org_id, 'title': f"{rng.choice(WORDS).title()} Agent",
+                                 'note': sentence(rng), 'file_path': sample['url'], 'file_name': sample['name'], 'file_size': sample['size'],
+                                 'uploaded_by': admin_id, 'last_uploaded': now, 'download_count': 0, 'created_at': now, 'updated_at': now})
+            for _ in range(args.files_per_org):
+                if not folders_by_org[org_id]:
+                    break
+                sample = rng.choice(samples[:-1])
+                files.append({'id': file_start + len(files), 'org_id': org_id, 'folder_id': rng.choice(folders_by_org[org_id]),
+                              'name': sample['name'].rsplit('.', 1)[0], 'original_filename': sample['name'], 'file_path': sample['url'],
+                              'file_size': sample['size'], 'mime_type': sample['mime'], 'uploaded_by': admin_id,
+                              'download_count': 0, 'created_at': now, 'updated_at': now})
+
+        for label, model, rows in [
+            ('organizations', models.Organization, orgs),
+            ('users', models.User, users),
+            ('contacts', Contact, contacts),
+            ('folders', DocumentFolder, folders),
+            ('documents', Document, documents),
+            ('passwords', PasswordEntry, passwords),
+            ('locations', Location, locations),
+            ('software', Software, software),
+            ('document files', DocumentFile, files),
+        ]:
+            step = time.perf_counter()
+            bulk_insert(db_session, model, rows, args.batch_size)
+            print(f"{label:>15}: {len(rows):>8} rows in {time.perf_counter() - step:.1f}s")
+
+        print(f"Done in {time.perf_counter() - started:.1f}s. Log in as {ADMIN_USERNAME} / {ADMIN_PASSWORD}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orgs', type=int, default=300)
+    parser.add_argument('--docs', type=int, default=100000)
+    parser.add_argument('--users-per-org', type=int, default=3)
+    parser.add_argument('--contacts-per-org', type=int, default=25)
+    parser.add_argument('--passwords-per-org', type=int, default=40)
+    parser.add_argument('--locations-per-org', type=int, default=3)
+    parser.add_argument('--software-per-org', type=int, default=5)
+    parser.add_argument('--files-per-org', type=int, default=20)
+    parser.add_argument('--root-folders', type=int, default=4)
+    parser.add_argument('--folder-fanout', type=int, default=3)
+    parser.add_argument('--folder-depth', type=int, default=6)
+    parser.add_argument('--max-folders-per-org', type=int, default=400)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if not os.getenv('ENCRYPTION_KEY'):
+        parser.error('ENCRYPTION_KEY must be set (passwords are stored encrypted)')
+    generate(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,434 @@
+"""
+HTTP load test with realistic technician workflows.
+
+Simulates technicians working in InfoGarden over HTTP: each virtual user
+logs in and then repeatedly picks a workflow from a weighted mix:
+
+    login       log out and back in
+    org_switch  switch organization context and land on the dashboard
+    browse      sidebar navigation: docs index, a folder, a document
+    typeahead   global search typed one character at a time
+    edit        open a document in the editor and save it unchanged
+    reveal      open the password list and reveal a password
+    download    download a document file
+
+Document, folder, file and password ids are discovered from the pages the
+users visit, so any dataset works (normally one built with
+generate_dataset.py). Edits save the content that was loaded, leaving the
+data as it was.
+
+Point it at a running server, or let it start gunicorn with
+gunicorn_config.py (--spawn) so worker and pool settings can be varied
+between runs:
+
+    python benchmarks/loadtest.py --spawn --workers 4 --pool-size 5 \\
+        --users 32 --duration 60 --save w4.json
+    python benchmarks/loadtest.py --spawn --workers 8 --pool-size 5 \\
+        --users 32 --duration 60 --compare w4.json
+
+Reports throughput and per-step latency percentiles. --compare exits with
+status 1 when throughput dropped, p95 latency rose by more than
+--tolerance percent, or the error rate went up.
+"""
+import os
+import re
+import sys
+import json
+import time
+import html
+import random
+import argparse
+import threading
+import subprocess
+from urllib.parse import urlparse
+
+import requests
+
+from generate_dataset import ADMIN_USERNAME, ADMIN_PASSWORD
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+DEFAULT_MIX = 'browse=35,typeahead=20,edit=10,reveal=10,download=10,org_switch=10,login=5'
+SEARCH_TERMS = ['firewall', 'backup', 'printer', 'vpn', 'server', 'password', 'router', 'tenant']
+
+CSRF_RE = re.compile(r'<meta name="csrf-token" content="([^"]+)"|name="csrf_token" value="([^"]+)"')
+ORG_RE = re.compile(r'href="/orgs/(\d+)"')
+DOC_RE = re.compile(r'href="/docs/(\d+)"')
+FOLDER_RE = re.compile(r'href="/docs/folder/(\d+)"')
+FILE_RE = re.compile(r'href="/docs/file/(\d+)/download"')
+PASSWORD_RE = re.compile(r'reveal-password" data-id="(\d+)"')
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in WORKFLOWS:
+            raise SystemExit(f"Unknown workflow '{name.strip()}' (choose from {', '.join(WORKFLOWS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class Stats:
+    """Latencies and errors per step, shared by all virtual users"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.workflows = {}
+
+    def record(self, step, ms, error=None):
+        """Record one request; error is the unexpected status code or exception name"""
+        with self.lock:
+            self.latencies.setdefault(step, []).append(ms)
+            if error is not None:
+                step_errors = self.errors.setdefault(step, {})
+                step_errors[str(error)] = step_errors.get(str(error), 0) + 1
+
+    def workflow_done(self, name):
+        with self.lock:
+            self.workflows[name] = self.workflows.get(name, 0) + 1
+
+
+class VirtualUser:
+    """One technician with its own cookie session"""
+
+    def __init__(self, base_url, username, password, stats, rng, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.stats = stats
+        self.rng = rng
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.csrf_token = None
+        self.orgs = []
+        self.reset_targets()
+
+    def reset_targets(self):
+        self.docs, self.folders, self.files, self.passwords = set(), set(), set(), set()
+
+    def harvest(self, text):
+        """Pick up the CSRF token and object ids from a page"""
+        match = CSRF_RE.search(text)
+        if match:
+            self.csrf_token = match.group(1) or match.group(2)
+        self.docs.update(DOC_RE.findall(text))
+        self.folders.update(FOLDER_RE.findall(text))
+        self.files.update(FILE_RE.findall(text))
+        self.passwords.update(PASSWORD_RE.findall(text))
+
+    def request(self, step, method, path, expect=(200,), stream=False, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.timeout,
+                                            allow_redirects=False, stream=stream, **kwargs)
+            if stream:
+                for _ in response.iter_content(64 * 1024):
+                    pass
+            else:
+                response.content
+        except requests.RequestException as e:
+            self.stats.record(step, (time.perf_counter() - start) * 1000, type(e).__name__)
+            return None
+        ok = response.status_code in expect
+        self.stats.record(step, (time.perf_counter() - start) * 1000, None if ok else response.status_code)
+        if ok and not stream and 'text/html' in response.headers.get('Content-Type', ''):
+            self.harvest(response.text)
+        return response if ok else None
+
+    def login(self):
+        page = self.request('login_page', 'GET', '/login')
+        if page is None:
+            return False
+        response = self.request('login_submit', 'POST', '/login', expect=(302,), data={
+            'csrf_token': self.csrf_token, 'username': self.username, 'password': self.password})
+        if response is None or '/dashboard' not in response.headers.get('Location', ''):
+            return False
+        self.request('dashboard', 'GET', '/dashboard')
+        if not self.orgs:
+            orgs = self.request('orgs_index', 'GET', '/orgs/')
+            if orgs is not None:
+                self.orgs = sorted(set(ORG_RE.findall(orgs.text)))
+        # Global admins have no home org, so pick one like a technician would
+        return self.wf_org_switch() if self.orgs else True
+
+    # Workflows
+
+    def wf_login(self):
+        self.request('logout', 'GET', '/logout', expect=(302,))
+        self.session.cookies.clear()
+        return self.login()
+
+    def wf_org_switch(self):
+        if not self.orgs:
+            return False
+        org_id = self.rng.choice(self.orgs)
+        response = self.request('org_switch', 'POST', f'/orgs/switch/{org_id}', expect=(302,),
+                                data={'csrf_token': self.csrf_token})
+        if response is None:
+            return False
+        self.reset_targets()
+        return self.request('dashboard', 'GET', '/dashboard') is not None
+
+    def wf_browse(self):
+        if self.request('docs_index', 'GET', '/docs/') is None:
+            return False
+        if self.folders:
+            self.request('folder_view', 'GET', f'/docs/folder/{self.rng.choice(sorted(self.folders))}')
+        if self.docs:
+            self.request('doc_view', 'GET', f'/docs/{self.rng.choice(sorted(self.docs))}')
+        return True
+
+    def wf_typeahead(self):
+        term = self.rng.choice(SEARCH_TERMS)
+        # The search box waits for two characters before querying
+        for length in range(2, len(term) + 1):
+            self.request('search', 'GET', '/search/', params={'q': term[:length]})
+        return True
+
+    def wf_edit(self):
+        if not self.docs:
+            self.wf_browse()
+        if not self.docs:
+            return False
+        doc_id = self.rng.choice(sorted(self.docs))
+        page = self.request('doc_edit_page', 'GET', f'/docs/{doc_id}/edit')
+        if page is None:
+            return False
+        form = parse_edit_form(page.text)
+        if form is None:
+            return False
+        form['csrf_token'] = self.csrf_token
+        return self.request('doc_edit_save', 'POST', f'/docs/{doc_id}/edit', expect=(302,), data=form) is not None
+
+    def wf_reveal(self):
+        if self.request('passwords_list', 'GET', '/passwords/') is None or not self.passwords:
+            return False
+        entry_id = self.rng.choice(sorted(self.passwords))
+        return self.request('password_reveal', 'POST', f'/passwords/{entry_id}/reveal',
+                            headers={'X-CSRFToken': self.csrf_token}) is not None
+
+    def wf_download(self):
+        if not self.files and self.folders:
+            self.request('folder_view', 'GET', f'/docs/folder/{self.rng.choice(sorted(self.folders))}')
+        if not self.files:
+            return False
+        file_id = self.rng.choice(sorted(self.files))
+        # S3-backed files answer with a redirect to the object URL
+        return self.request('file_download', 'GET', f'/docs/file/{file_id}/download',
+                            expect=(200, 302), stream=True) is not None
+
+
+WORKFLOWS = {
+    'login': VirtualUser.wf_login,
+    'org_switch': VirtualUser.wf_org_switch,
+    'browse': VirtualUser.wf_browse,
+    'typeahead': VirtualUser.wf_typeahead,
+    'edit': VirtualUser.wf_edit,
+    'reveal': VirtualUser.wf_reveal,
+    'download': VirtualUser.wf_download,
+}
+
+
+def parse_edit_form(text):
+    """Read the current values of the document edit form, or None if it is not there"""
+    def field(pattern, flags=0):
+        match = re.search(pattern, text, flags)
+        return html.unescape(match.group(1)) if match else None
+
+    title = field(r'name="title" value="([^"]*)"')
+    content_type = field(r'name="content_type" value="([^"]*)"') or 'markdown'
+    if title is None:
+        return None
+    textarea_id = 'richtext-content' if content_type == 'html' else 'content'
+    content = field(rf'<textarea[^>]*id="{textarea_id}"[^>]*>(.*?)</textarea>', re.DOTALL) or ''
+    folder_id = field(r'<option value="([^"]+)" selected>') or 'None'
+    return {'title': title, 'content': content, 'content_type': content_type, 'folder_id': folder_id}
+
+
+def user_loop(index, args, mix, stats, deadline, start_barrier):
+    rng = random.Random(args.seed + index)
+    user = VirtualUser(args.base_url, args.username, args.password, stats, rng, args.timeout)
+    start_barrier.wait()
+    # Spread logins over the ramp-up period
+    if args.ramp_up:
+        time.sleep(args.ramp_up * index / max(args.users, 1))
+    if not user.login():
+        return
+    names, weights = list(mix), list(mix.values())
+    while time.time() < deadline:
+        name = rng.choices(names, weights)[0]
+        if WORKFLOWS[name](user):
+            stats.workflow_done(name)
+        if args.think_time:
+            time.sleep(rng.uniform(0, 2 * args.think_time))
+
+
+def spawn_server(args):
+    """Start gunicorn with gunicorn_config.py and wait until it answers"""
+    env = dict(os.environ)
+    env['FLASK_PORT'] = str(urlparse(args.base_url).port or 80)
+    if args.workers:
+        env['GUNICORN_WORKERS'] = str(args.workers)
+    if args.pool_size is not None:
+        env['DB_POOL_SIZE'] = str(args.pool_size)
+    if args.max_overflow is not None:
+        env['DB_MAX_OVERFLOW'] = str(args.max_overflow)
+    env.setdefault('LOG_LEVEL', 'warning')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn_config.py', '--access-logfile', os.devnull, 'wsgi:app'],
+        cwd=ROOT, env=env)
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'gunicorn exited with status {process.returncode}')
+        try:
+            requests.get(args.base_url.rstrip('/') + '/login', timeout=2)
+            return process
+        except requests.RequestException:
+            time.sleep(0.5)
+    process.terminate()
+    raise SystemExit('gunicorn did not start within 60 seconds')
+
+
+def summarize(stats, elapsed, args):
+    steps = {}
+    total = errors = 0
+    for step, latencies in sorted(stats.latencies.items()):
+        step_errors = stats.errors.get(step, {})
+        total += len(latencies)
+        errors += sum(step_errors.values())
+        steps[step] = {
+            'count': len(latencies),
+            'errors': sum(step_errors.values()),
+            'error_statuses': dict(sorted(step_errors.items())),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p90_ms': round(percentile(latencies, 90), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'max_ms': round(max(latencies), 2)
+        }
+    return {
+        'config': {'users': args.users, 'duration': args.duration, 'think_time': args.think_time,
+                   'mix': args.mix, 'workers': args.workers, 'pool_size': args.pool_size,
+                   'max_overflow': args.max_overflow},
+        'summary': {
+            'requests': total,
+            'errors': errors,
+            'error_rate': round(errors / total, 4) if total else 0.0,
+            'elapsed_s': round(elapsed, 2),
+            'requests_per_s': round(total / elapsed, 2) if elapsed else 0.0,
+            'workflows_per_s': round(sum(stats.workflows.values()) / elapsed, 2) if elapsed else 0.0,
+            'workflows': dict(sorted(stats.workflows.items()))
+        },
+        'steps': steps
+    }
+
+
+def print_report(results):
+    s = results['summary']
+    print(f"\n{s['requests']} requests in {s['elapsed_s']:.1f} s: {s['requests_per_s']:.1f} req/s, "
+          f"{s['workflows_per_s']:.1f} workflows/s, {s['errors']} errors ({s['error_rate'] * 100:.2f}%)")
+    print(f"\n{'step':<16} {'count':>7} {'errors':>7} {'p50':>9} {'p90':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for step, r in results['steps'].items():
+        print(f"{step:<16} {r['count']:>7} {r['errors']:>7} {r['p50_ms']:>9.1f} {r['p90_ms']:>9.1f} "
+              f"{r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['max_ms']:>9.1f}"
+              + (f"  {r['error_statuses']}" if r['errors'] else ''))
+
+
+def compare(results, baseline, tolerance):
+    """Print differences against a baseline run and return what regressed"""
+    regressions = []
+    before, after = baseline['summary'], results['summary']
+    change = (after['requests_per_s'] - before['requests_per_s']) / before['requests_per_s'] * 100 \
+        if before['requests_per_s'] else 0.0
+    print(f"\nthroughput {before['requests_per_s']:.1f} -> {after['requests_per_s']:.1f} req/s ({change:+.1f}%), "
+          f"error rate {before['error_rate'] * 100:.2f}% -> {after['error_rate'] * 100:.2f}%")
+    if change < -tolerance:
+        regressions.append('throughput')
+    if after['error_rate'] > before['error_rate']:
+        regressions.append('error rate')
+
+    print(f"\n{'step':<16} {'p95 before':>11} {'p95 after':>10} {'change':>8}")
+    for step, r in results['steps'].items():
+        old = baseline['steps'].get(step)
+        if not old:
+            continue
+        step_change = (r['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0.0
+        print(f"{step:<16} {old['p95_ms']:>11.1f} {r['p95_ms']:>10.1f} {step_change:>+7.1f}%")
+        if step_change > tolerance:
+            regressions.append(step)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--username', default=ADMIN_USERNAME)
+    parser.add_argument('--password', default=ADMIN_PASSWORD)
+    parser.add_argument('--users', type=int, default=10, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds to run after ramp-up')
+    parser.add_argument('--ramp-up', type=float, default=5, help='Seconds over which users log in')
+    parser.add_argument('--think-time', type=float, default=0.0, help='Mean pause between workflows in seconds')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Workflow weights, e.g. browse=50,edit=10')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--spawn', action='store_true', help='Start gunicorn with gunicorn_config.py for the run')
+    parser.add_argument('--workers', type=int, help='GUNICORN_WORKERS for --spawn')
+    parser.add_argument('--pool-size', type=int, help='DB_POOL_SIZE for --spawn')
+    parser.add_argument('--max-overflow', type=int, help='DB_MAX_OVERFLOW for --spawn')
+    parser.add_argument('--save', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Compare against a JSON file from --save')
+    parser.add_argument('--tolerance', type=float, default=10.0, help='Allowed change in percent before failing --compare')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    server = spawn_server(args) if args.spawn else None
+    try:
+        stats = Stats()
+        start_barrier = threading.Barrier(args.users + 1)
+        deadline = time.time() + args.ramp_up + args.duration
+        threads = [threading.Thread(target=user_loop, args=(i, args, mix, stats, deadline, start_barrier), daemon=True)
+                   for i in range(args.users)]
+        for thread in threads:
+            thread.start()
+        start_barrier.wait()
+        start = time.perf_counter()
+        print(f"Running {args.users} users against {args.base_url} for {args.ramp_up + args.duration:.0f} s")
+        for thread in threads:
+            thread.join()
+        results = summarize(stats, time.perf_counter() - start, args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    print_report(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -44,6 +44,16 @@ tmp_upload_dir = None
 # keyfile = None
 # certfile = None
 
+def on_starting(server):
+    """Called just before the master process is initialized."""
+    # Start every run with an empty Prometheus multiprocess directory
+    multiproc_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for filename in os.listdir(multiproc_dir):
+            if filename.endswith('.db'):
+                os.remove(os.path.join(multiproc_dir, filename))
+
 def when_ready(server):
     """Called just after the server is started."""
     server.log.info("Server is ready. Spawning workers")
@@ -68,6 +78,16 @@ def on_reload(server):
     """Called to recycle workers during a reload via SIGHUP."""
     server.log.info("Reloading: spawning new workers")
 
+def child_exit(server, worker):
+    """Called in the master after a worker has exited."""
+    # Drop live gauges (in-progress requests, pool usage) of the dead worker
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        try:
+            from prometheus_client import multiprocess
+            multiprocess.mark_process_dead(worker.pid)
+        except ImportError:
+            pass
+
 def worker_abort(worker):
     """Called when a worker times out."""
     worker.log.info("worker timed out")